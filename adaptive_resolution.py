@@ -0,0 +1,86 @@
+"""
+Adaptive inference resolution
+Steps the model's input size through a fixed set of sizes so that the mean
+inference time of recent frames stays under a per-frame latency budget
+"""
+
+from collections import deque
+
+DEFAULT_SIZES = (320, 416, 512, 640)
+DEFAULT_WINDOW = 15
+# Step up only if the next size is predicted to use at most this share of the budget
+STEP_UP_HEADROOM = 0.85
+# A size's measured time is trusted for this many windows; after that it's re-tried
+MEASUREMENT_TTL = 20
+
+
+class ResolutionController:
+    """
+    Picks imgsz from `sizes` to hold `budget_ms` of inference per frame
+
+    After every `window` fresh measurements at the current size, the controller
+    steps down when their mean exceeds the budget, and steps up when the next
+    size is predicted (from what it measured there in the last MEASUREMENT_TTL
+    windows, or by scaling with the pixel count) to fit within STEP_UP_HEADROOM
+    of the budget. The gap between the two thresholds, and deciding once per
+    window, keep it from oscillating between two sizes; expiring old
+    measurements lets it recover a larger size that was only slow for a while.
+
+    A steady cost settles on one size, re-trying the larger one once per TTL:
+
+    >>> cost_ms = {320: 35, 416: 50, 512: 105, 640: 170}
+    >>> controller = ResolutionController(100)
+    >>> for _ in range(600):
+    ...     _ = controller.observe(cost_ms[controller.imgsz] / 1000)
+    >>> controller.imgsz, controller.changes
+    (416, 3)
+    """
+
+    def __init__(self, budget_ms, sizes=DEFAULT_SIZES, initial=None, window=DEFAULT_WINDOW):
+        if budget_ms <= 0:
+            raise ValueError("The latency budget must be positive")
+        self.budget_ms = budget_ms
+        self.sizes = sorted(set(sizes))
+        start = initial if initial in self.sizes else self.sizes[len(self.sizes) // 2]
+        self.level = self.sizes.index(start)
+        self.window = window
+        self.changes = 0
+        self._samples = deque(maxlen=window)
+        self._windows = 0
+        self._measured_ms = {}  # Size -> (last mean inference time there, window it was measured in)
+
+    @property
+    def imgsz(self):
+        return self.sizes[self.level]
+
+    def observe(self, seconds):
+        """Record one inference at the current size; returns the size for the next one"""
+        self._samples.append(seconds * 1000.0)
+        if len(self._samples) < self.window:
+            return self.imgsz
+
+        mean_ms = sum(self._samples) / len(self._samples)
+        # Each decision gets a window of fresh samples, so _windows counts windows
+        self._samples.clear()
+        self._windows += 1
+        self._measured_ms[self.imgsz] = (mean_ms, self._windows)
+        if mean_ms > self.budget_ms and self.level > 0:
+            self._step(-1)
+        elif self.level + 1 < len(self.sizes) and self._predict_ms(self.level + 1, mean_ms) \
+                <= self.budget_ms * STEP_UP_HEADROOM:
+            self._step(1)
+        return self.imgsz
+
+    def _predict_ms(self, level, current_ms):
+        size = self.sizes[level]
+        if size in self._measured_ms:
+            measured_ms, window = self._measured_ms[size]
+            if self._windows - window <= MEASUREMENT_TTL:
+                return measured_ms
+            del self._measured_ms[size]
+        # Inference cost grows roughly with the number of input pixels
+        return current_ms * (size / self.imgsz) ** 2
+
+    def _step(self, direction):
+        self.level += direction
+        self.changes += 1
@@ -0,0 +1,28 @@
+"""
+Animal class table shared by the GUI and the headless tools
+Mirrors the names in animal_data.yaml
+"""
+
+# Animal classes from the dataset
+CLASS_NAMES = {
+    0: "Dog", 1: "Cat", 2: "Zebra", 3: "Lion", 4: "Leopard",
+    5: "Cheetah", 6: "Tiger", 7: "Bear", 8: "Brown Bear", 9: "Butterfly",
+    10: "Canary", 11: "Crocodile", 12: "Polar Bear", 13: "Bull", 14: "Camel",
+    15: "Crab", 16: "Chicken", 17: "Centipede", 18: "Cattle", 19: "Caterpillar", 20: "Duck"
+}
+
+# Carnivorous animals (highlighted in red)
+CARNIVOROUS_ANIMALS = {
+    "Lion", "Leopard", "Cheetah", "Tiger", "Bear", "Brown Bear",
+    "Polar Bear", "Crocodile", "Cat"
+}
+
+
+def class_name_for(class_id):
+    """Return the display name for a class id"""
+    return CLASS_NAMES.get(class_id, f"Class_{class_id}")
+
+
+def is_carnivorous(class_name):
+    """Return True if the class name is one of the carnivorous animals"""
+    return class_name in CARNIVOROUS_ANIMALS
@@ -0,0 +1,194 @@
+"""
+Shared detection post-processing and drawing
+Moves YOLO boxes to NumPy once per result, classifies carnivores with a
+vectorized table lookup and draws into reusable output buffers
+"""
+
+import cv2
+import numpy as np
+
+from animal_classes import CLASS_NAMES, CARNIVOROUS_ANIMALS, class_name_for
+
+CARNIVORE_COLOR = (0, 0, 255)  # Red (BGR)
+OTHER_COLOR = (0, 255, 0)  # Green (BGR)
+TEXT_COLOR = (255, 255, 255)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class ClassTable:
+    """Precomputed id -> (name, is_carnivore, colour) lookup arrays"""
+
+    def __init__(self, class_names=None, carnivorous_animals=None):
+        class_names = CLASS_NAMES if class_names is None else class_names
+        carnivorous_animals = CARNIVOROUS_ANIMALS if carnivorous_animals is None else carnivorous_animals
+
+        size = max(class_names) + 1 if class_names else 0
+        self.names = [class_names.get(i, f"Class_{i}") for i in range(size)]
+        self.carnivorous = np.array([name in carnivorous_animals for name in self.names], dtype=bool)
+        self.colors = np.where(self.carnivorous[:, None],
+                               np.array(CARNIVORE_COLOR, dtype=np.uint8),
+                               np.array(OTHER_COLOR, dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_carnivorous(self, class_ids):
+        """Vectorized carnivore lookup; unknown ids are not carnivorous"""
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+        known = (class_ids >= 0) & (class_ids < len(self.names))
+        result = np.zeros(class_ids.shape, dtype=bool)
+        result[known] = self.carnivorous[class_ids[known]]
+        return result
+
+    def colors_for(self, class_ids):
+        """Vectorized colour lookup; unknown ids get the non-carnivore colour"""
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+        known = (class_ids >= 0) & (class_ids < len(self.names))
+        result = np.empty(class_ids.shape + (3,), dtype=np.uint8)
+        result[:] = OTHER_COLOR
+        result[known] = self.colors[class_ids[known]]
+        return result
+
+    def name(self, class_id):
+        if 0 <= class_id < len(self.names):
+            return self.names[class_id]
+        return class_name_for(class_id)
+
+    def color(self, class_id):
+        if 0 <= class_id < len(self.names):
+            return tuple(int(c) for c in self.colors[class_id])
+        return OTHER_COLOR
+
+
+DEFAULT_TABLE = ClassTable()
+
+
+class Detections:
+    """Detections for one image as parallel NumPy arrays"""
+
+    __slots__ = ("xyxy", "conf", "cls", "carnivorous", "track_ids")
+
+    def __init__(self, xyxy, conf, cls, carnivorous, track_ids=None):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+        self.carnivorous = carnivorous
+        self.track_ids = track_ids
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                   np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool))
+
+    def __len__(self):
+        return len(self.cls)
+
+    @property
+    def carnivorous_count(self):
+        return int(self.carnivorous.sum())
+
+    def class_names(self, table=DEFAULT_TABLE):
+        return [table.name(int(c)) for c in self.cls]
+
+    def to_records(self, table=DEFAULT_TABLE):
+        """Convert to a list of JSON-serialisable dicts"""
+        records = [{
+            "class_id": int(class_id),
+            "class_name": table.name(int(class_id)),
+            "confidence": round(float(conf), 4),
+            "xyxy": [round(float(v), 1) for v in box],
+            "carnivorous": bool(carn),
+        } for box, conf, class_id, carn in zip(self.xyxy, self.conf, self.cls, self.carnivorous)]
+
+        if self.track_ids is not None:
+            for record, track_id in zip(records, self.track_ids.tolist()):
+                record["track_id"] = track_id
+        return records
+
+
+def extract_detections(result, table=DEFAULT_TABLE):
+    """Pull xyxy/conf/cls out of a YOLO result with a single device transfer"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return Detections.empty()
+
+    data = boxes.data.cpu().numpy()  # (N, 6): x1, y1, x2, y2, conf, cls
+    cls = data[:, 5].astype(np.int64)
+    return Detections(data[:, :4].astype(np.float32), data[:, 4].astype(np.float32),
+                      cls, table.is_carnivorous(cls))
+
+
+class Annotator:
+    """
+    Draws detections onto a copy of the frame
+
+    Output frames come from a small pool of reusable buffers. Use more than
+    one buffer when a frame is still being displayed while the next is drawn.
+    """
+
+    def __init__(self, table=DEFAULT_TABLE, buffer_count=1, font_scale=0.5,
+                 box_thickness=2, show_count=True):
+        self.table = table
+        self.font_scale = font_scale
+        self.box_thickness = box_thickness
+        self.show_count = show_count
+        self._buffers = [None] * max(1, buffer_count)
+        self._next_buffer = 0
+
+    def _output_buffer(self, frame):
+        index = self._next_buffer
+        self._next_buffer = (index + 1) % len(self._buffers)
+
+        buffer = self._buffers[index]
+        if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            buffer = np.empty_like(frame)
+            self._buffers[index] = buffer
+        np.copyto(buffer, frame)
+        return buffer
+
+    def annotate(self, frame, detections, carnivores_seen=None):
+        """
+        Return an annotated copy of `frame` held in one of the reusable buffers
+
+        `carnivores_seen` is the number of distinct tracked carnivores, shown
+        instead of the per-frame box count when given.
+        """
+        output = self._output_buffer(frame)
+
+        if len(detections):
+            boxes = np.rint(detections.xyxy).astype(np.int32)
+            colors = self.table.colors_for(detections.cls)
+            track_ids = (detections.track_ids.tolist() if detections.track_ids is not None
+                         else [None] * len(detections))
+
+            for (x1, y1, x2, y2), confidence, class_id, carnivorous, color, track_id in zip(
+                    boxes.tolist(), detections.conf.tolist(), detections.cls.tolist(),
+                    detections.carnivorous.tolist(), colors.tolist(), track_ids):
+                color = tuple(color)
+                cv2.rectangle(output, (x1, y1), (x2, y2), color, self.box_thickness)
+
+                label = f"{self.table.name(class_id)}: {confidence:.2f}"
+                if track_id is not None:
+                    label = f"#{track_id} {label}"
+                if carnivorous:
+                    label += " (CARNIVOROUS)"
+                self._draw_label(output, label, x1, y1, color)
+
+        if self.show_count:
+            carnivorous_count = detections.carnivorous_count if carnivores_seen is None else carnivores_seen
+            if carnivorous_count > 0:
+                cv2.putText(output, f"Carnivorous: {carnivorous_count}",
+                            (10, 30), FONT, 1, CARNIVORE_COLOR, 2)
+        return output
+
+    def _draw_label(self, image, label, x1, y1, color):
+        """Draw label text on a filled background above the box"""
+        (text_width, text_height), baseline = cv2.getTextSize(label, FONT, self.font_scale, 1)
+        top = y1 - text_height - baseline - 5
+        if top < 0:
+            # Keep the label inside the image for boxes touching the top edge
+            y1 = text_height + baseline + 5
+            top = 0
+
+        cv2.rectangle(image, (x1, top), (x1 + text_width, y1), color, -1)
+        cv2.putText(image, label, (x1, y1 - baseline - 2), FONT, self.font_scale, TEXT_COLOR, 1)
@@ -0,0 +1,555 @@
+"""
+Headless batch animal detection
+Runs the YOLO model over folders, globs and video files in batches of frames
+and writes per-image detections as JSON Lines, optionally also streaming video
+detections to compact columnar detection logs
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import cv2
+
+from annotator import Detections, extract_detections
+from detection_cache import (DEFAULT_CACHE_DIR, DEFAULT_DISK_BYTES, CachedDetector,
+                             DetectionCache, hash_file)
+from model_formats import load_detector
+from metrics import JsonDumper, Metrics, MetricsServer
+from tiled_inference import DEFAULT_OVERLAP, DEFAULT_TILE_BATCH, MERGE_METHODS, TiledDetector
+from motion_gate import DEFAULT_FORCE_EVERY, DEFAULT_MIN_CHANGED, MotionGate
+from detection_log import DetectionLogWriter
+from video_pipeline import source_fps
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv"}
+
+
+def collect_sources(inputs):
+    """Expand directories and glob patterns into a sorted list of image/video files"""
+    sources = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for dirpath, _, filenames in os.walk(item):
+                for filename in filenames:
+                    sources.append(os.path.join(dirpath, filename))
+        elif glob.has_magic(item):
+            sources.extend(glob.glob(item, recursive=True))
+        else:
+            sources.append(item)
+
+    supported = IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+    return sorted({os.path.normpath(path) for path in sources
+                   if os.path.isfile(path) and os.path.splitext(path)[1].lower() in supported})
+
+
+def is_video(path):
+    """Return True if the path has a video file extension"""
+    return os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS
+
+
+class FrameItem:
+    """One image or video frame on its way through the batch pipeline"""
+
+    __slots__ = ("source", "frame_index", "frame", "content_hash", "detections", "static")
+
+    def __init__(self, source, frame_index, frame, content_hash=None, detections=None, static=False):
+        self.source = source
+        self.frame_index = frame_index
+        self.frame = frame
+        self.content_hash = content_hash
+        self.detections = detections
+        # Video frame the motion gate found unchanged; reuses the previous frame's detections
+        self.static = static
+
+
+def load_image_item(path, detector=None, metrics=None, tiler=None):
+    """Read one image; with a cache, a hit skips decoding entirely"""
+    content_hash = None
+    if detector is not None:
+        content_hash = hash_file(path)
+        detections = detector.lookup(content_hash, tiler)
+        if detections is not None:
+            return FrameItem(path, None, None, content_hash, detections)
+
+    start = time.perf_counter()
+    frame = cv2.imread(path)
+    if metrics is not None:
+        metrics.observe("decode", time.perf_counter() - start)
+    return FrameItem(path, None, frame, content_hash)
+
+
+def iter_image_frames(paths, executor, prefetch, detector=None, metrics=None, tiler=None):
+    """Load images on the worker pool, keeping up to `prefetch` reads in flight"""
+    pending = deque()
+    paths = iter(paths)
+
+    for path in paths:
+        pending.append((path, executor.submit(load_image_item, path, detector, metrics, tiler)))
+        if len(pending) >= prefetch:
+            break
+
+    while pending:
+        path, future = pending.popleft()
+        next_path = next(paths, None)
+        if next_path is not None:
+            pending.append((next_path, executor.submit(load_image_item, next_path, detector, metrics, tiler)))
+        if metrics is not None:
+            metrics.set_gauge("decode_queue_depth", len(pending))
+
+        try:
+            item = future.result()
+        except OSError as e:
+            print(f"Warning: could not read image {path}: {str(e)}", file=sys.stderr)
+            continue
+        if item.frame is None and item.detections is None:
+            print(f"Warning: could not read image {path}", file=sys.stderr)
+            continue
+        yield item
+
+
+def iter_video_frames(path, stride, metrics=None, motion_gate=None, start_frame=0, end_frame=None):
+    """Yield every `stride`-th frame of a video file in [start_frame, end_frame), flagging static ones if gated"""
+    video_cap = cv2.VideoCapture(path)
+    if not video_cap.isOpened():
+        print(f"Warning: could not open video {path}", file=sys.stderr)
+        return
+
+    try:
+        frame_index = 0
+        if start_frame > 0:
+            video_cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            frame_index = int(video_cap.get(cv2.CAP_PROP_POS_FRAMES))
+        while end_frame is None or frame_index < end_frame:
+            # Stride is counted from the start of the file so a resumed run picks the same frames
+            if frame_index % stride == 0:
+                start = time.perf_counter()
+                ret, frame = video_cap.read()
+                if not ret:
+                    break
+                if metrics is not None:
+                    metrics.observe("decode", time.perf_counter() - start)
+                static = False
+                if motion_gate is not None:
+                    static = not motion_gate.should_detect(frame)
+                    if static and metrics is not None:
+                        metrics.incr("frames_skipped_static")
+                yield FrameItem(path, frame_index, None if static else frame, static=static)
+            elif not video_cap.grab():
+                break
+            frame_index += 1
+    finally:
+        video_cap.release()
+        if motion_gate is not None:
+            stats = motion_gate.stats()
+            print(f"Motion gate on {os.path.basename(path)}: skipped {stats['skipped']} of "
+                  f"{stats['frames']} frame(s) ({stats['skip_ratio']:.0%})", file=sys.stderr)
+
+
+def processing_order(sources):
+    """Images first, then videos; the order iter_frames yields them in"""
+    return [path for path in sources if not is_video(path)] + [path for path in sources if is_video(path)]
+
+
+def iter_frames(sources, executor, prefetch, stride, detector=None, metrics=None, tiler=None,
+                motion_gate=None, frame_range=(0, None), start_frames=None):
+    """Yield FrameItems for all images and videos in order
+
+    `frame_range` limits every video to [start, end) frames; `start_frames` maps a
+    video to the frame a resumed run continues from.
+    """
+    images = [path for path in sources if not is_video(path)]
+    videos = [path for path in sources if is_video(path)]
+    start_frames = start_frames or {}
+
+    yield from iter_image_frames(images, executor, prefetch, detector, metrics, tiler)
+    for path in videos:
+        # A fresh gate per video so backgrounds don't leak between files
+        gate = motion_gate() if motion_gate is not None else None
+        start = max(frame_range[0], start_frames.get(path, 0))
+        yield from iter_video_frames(path, stride, metrics, gate, start, frame_range[1])
+
+
+def iter_batches(frames, batch_size):
+    """Group the frame stream into lists of at most batch_size items"""
+    batch = []
+    for item in frames:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def detections_to_record(source, frame_index, detections):
+    """Convert detections for one image/frame into a JSON-serialisable record"""
+    return {
+        "source": source,
+        "frame": frame_index,
+        "carnivorous_count": detections.carnivorous_count,
+        "detections": detections.to_records(),
+    }
+
+
+def detect_batch(model, batch, predict_args, detector=None, metrics=None, tiler=None):
+    """Fill in detections for every item, running the model once on all cache misses
+
+    Only images are cached (by file hash, looked up before decoding); video
+    frames almost never repeat, so hashing and storing them would be wasted work.
+    """
+    misses = [item for item in batch if item.detections is None and not item.static]
+    if not misses:
+        return
+
+    if tiler is not None:
+        # Each image is split into tiles that are batched on their own
+        for item in misses:
+            start = time.perf_counter()
+            item.detections = tiler.detect(item.frame)
+            if metrics is not None:
+                metrics.observe("infer", time.perf_counter() - start)
+            if item.content_hash is not None:
+                detector.store(item.content_hash, item.detections, tiler)
+        return
+
+    start = time.perf_counter()
+    results = model.predict([item.frame for item in misses], verbose=False, **predict_args)
+    if metrics is not None:
+        # Per-frame share of the batched forward pass
+        metrics.observe("infer", (time.perf_counter() - start) / len(misses))
+
+    for item, result in zip(misses, results):
+        start = time.perf_counter()
+        item.detections = extract_detections(result)
+        if metrics is not None:
+            metrics.observe("postprocess", time.perf_counter() - start)
+        if item.content_hash is not None:
+            detector.store(item.content_hash, item.detections)
+
+
+def open_video_log(log_dir, path, resume_rows=None):
+    """Detection log for one video, named after the file"""
+    video_cap = cv2.VideoCapture(path)
+    fps = source_fps(video_cap)
+    video_cap.release()
+    name = os.path.splitext(os.path.basename(path))[0] + "_detections"
+    return DetectionLogWriter(os.path.join(log_dir, name), fps=fps, source=path, resume_rows=resume_rows)
+
+
+class BatchCheckpoint:
+    """
+    Progress of a batch run, saved atomically every `interval` seconds
+
+    Sources are processed in a fixed order, so progress is a cursor: the index
+    of the current source in processing_order() and the next frame to process
+    in it. Totals, the output file offset and the open detection log's row
+    counts are saved alongside so a resumed run continues exactly there.
+    """
+
+    def __init__(self, path, sources, interval=30.0, settings=None):
+        self.path = path
+        self.sources = processing_order(sources)
+        self.settings = settings or {}
+        self.interval = interval
+        self.state = {"sources": self.sources, "settings": self.settings, "source_index": 0, "next_frame": 0,
+                      "frames_done": 0, "carnivorous_total": 0, "output_offset": None,
+                      "log_rows": None, "complete": False}
+        self._last_save = time.perf_counter()
+
+    def load(self):
+        """Restore saved progress; returns False if there is none for this set of sources"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("sources") != self.sources or state.get("settings") != self.settings:
+            print(f"Ignoring checkpoint {self.path}: it was made for different inputs or settings",
+                  file=sys.stderr)
+            return False
+        self.state = state
+        return True
+
+    def remaining(self):
+        """(sources still to process, {video: start frame}) after the cursor"""
+        index = self.state["source_index"]
+        remaining = self.sources[index:]
+        start_frames = {}
+        if remaining and self.state["next_frame"]:
+            start_frames[remaining[0]] = self.state["next_frame"]
+        return remaining, start_frames
+
+    def advance(self, item):
+        """Move the cursor past a processed frame"""
+        index = self.sources.index(item.source, self.state["source_index"])
+        if is_video(item.source):
+            self.state["source_index"], self.state["next_frame"] = index, item.frame_index + 1
+        else:
+            self.state["source_index"], self.state["next_frame"] = index + 1, 0
+
+    def due(self):
+        return time.perf_counter() - self._last_save >= self.interval
+
+    def save(self, frames_done, carnivorous_total, output_offset, log_rows, complete=False):
+        self.state.update(frames_done=frames_done, carnivorous_total=carnivorous_total,
+                          output_offset=output_offset, log_rows=log_rows, complete=complete)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+        self._last_save = time.perf_counter()
+
+
+def run_batch_detection(sources, model, output, batch_size=8, workers=4,
+                        imgsz=416, conf=0.25, iou=0.7, video_stride=1,
+                        cache=None, model_path=None, metrics=None, tiling=None, motion_gate=None,
+                        log_dir=None, frame_range=(0, None), checkpoint=None):
+    """Run batched detection over all sources and stream records to `output` (and video logs to `log_dir`)
+
+    With a BatchCheckpoint, progress is saved periodically and a loaded checkpoint
+    skips everything already processed. Returns the counts of this run only.
+    """
+    frames_done = 0
+    carnivorous_total = 0
+    start = time.perf_counter()
+
+    predict_args = {"imgsz": imgsz, "conf": conf, "iou": iou}
+    detector = CachedDetector(model, model_path, cache, **predict_args) if cache is not None else None
+    tiler = None
+    if tiling is not None:
+        tiler = TiledDetector(model, conf=conf, iou=iou, **tiling)
+
+    start_frames = None
+    resume_log_rows = None
+    base_frames = base_carnivorous = 0
+    if checkpoint is not None:
+        sources, start_frames = checkpoint.remaining()
+        resume_log_rows = checkpoint.state["log_rows"]
+        base_frames = checkpoint.state["frames_done"]
+        base_carnivorous = checkpoint.state["carnivorous_total"]
+
+    def save_checkpoint(complete=False):
+        output.flush()
+        offset = output.tell() if output.seekable() else None
+        log_rows = None
+        if video_log is not None:
+            video_log.flush()
+            log_rows = [video_log.source, video_log.detections, video_log.frames]
+        checkpoint.save(base_frames + frames_done, base_carnivorous + carnivorous_total,
+                        offset, log_rows, complete)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        frames = iter_frames(sources, executor, prefetch=batch_size * 2,
+                             stride=video_stride, detector=detector, metrics=metrics, tiler=tiler,
+                             motion_gate=motion_gate, frame_range=frame_range, start_frames=start_frames)
+        previous = {}
+        video_log = None
+
+        try:
+            for batch in iter_batches(frames, batch_size):
+                detect_batch(model, batch, predict_args, detector, metrics, tiler)
+
+                for item in batch:
+                    if item.static:
+                        item.detections = previous.get(item.source) or Detections.empty()
+                    previous[item.source] = item.detections
+                    record = detections_to_record(item.source, item.frame_index, item.detections)
+                    carnivorous_total += record["carnivorous_count"]
+                    output.write(json.dumps(record) + "\n")
+                    if metrics is not None:
+                        metrics.frame_done()
+                        if record["carnivorous_count"]:
+                            metrics.incr("carnivorous_detections", record["carnivorous_count"])
+
+                    if log_dir is not None and is_video(item.source):
+                        # Sources are processed in order, so one video log is open at a time
+                        if video_log is None or video_log.source != item.source:
+                            if video_log is not None:
+                                video_log.close()
+                            resume_rows = None
+                            if resume_log_rows and resume_log_rows[0] == item.source:
+                                resume_rows = tuple(resume_log_rows[1:])
+                            video_log = open_video_log(log_dir, item.source, resume_rows)
+                        video_log.append(item.frame_index, item.frame_index / video_log.fps,
+                                         item.detections)
+                    if checkpoint is not None:
+                        checkpoint.advance(item)
+
+                frames_done += len(batch)
+                if checkpoint is not None and checkpoint.due():
+                    save_checkpoint()
+
+            if checkpoint is not None:
+                save_checkpoint(complete=True)
+        finally:
+            if video_log is not None:
+                video_log.close()
+
+    elapsed = time.perf_counter() - start
+    return frames_done, carnivorous_total, elapsed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless batch animal detection")
+    parser.add_argument("inputs", nargs="+",
+                        help="Image/video files, directories or glob patterns")
+    parser.add_argument("--model", default="yolov8n.pt", help="YOLO weights (.pt, .onnx or OpenVINO model)")
+    parser.add_argument("--output", default="-",
+                        help="JSON Lines output file ('-' for stdout)")
+    parser.add_argument("--batch-size", type=int, default=8,
+                        help="Frames per forward pass")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Image decode threads")
+    parser.add_argument("--imgsz", type=int, default=416, help="Inference image size")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold")
+    parser.add_argument("--video-stride", type=int, default=1,
+                        help="Process every N-th video frame")
+    parser.add_argument("--tile", action="store_true",
+                        help="Tiled inference for high-resolution images (tiles of --imgsz)")
+    parser.add_argument("--tile-overlap", type=float, default=DEFAULT_OVERLAP,
+                        help="Fractional overlap between neighbouring tiles")
+    parser.add_argument("--tile-batch", type=int, default=DEFAULT_TILE_BATCH,
+                        help="Maximum tiles per forward pass")
+    parser.add_argument("--tile-merge", choices=MERGE_METHODS, default="nms",
+                        help="How duplicate boxes across tile borders are merged")
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="Skip inference on video frames without motion")
+    parser.add_argument("--motion-threshold", type=float, default=DEFAULT_MIN_CHANGED,
+                        help="Fraction of changed pixels that counts as motion")
+    parser.add_argument("--motion-force-every", type=int, default=DEFAULT_FORCE_EVERY,
+                        help="Force a detection at least every N processed frames")
+    parser.add_argument("--start-frame", type=int, default=0, help="First video frame to process")
+    parser.add_argument("--end-frame", type=int, help="Stop videos before this frame")
+    parser.add_argument("--checkpoint",
+                        help="Save progress to this file and resume from it if it exists")
+    parser.add_argument("--checkpoint-interval", type=float, default=30.0,
+                        help="Seconds between checkpoint saves")
+    parser.add_argument("--log-dir",
+                        help="Also stream video detections to columnar detection logs in this directory")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory of the on-disk detection cache")
+    parser.add_argument("--cache-size-mb", type=int, default=DEFAULT_DISK_BYTES // (1024 * 1024),
+                        help="Maximum size of the on-disk detection cache")
+    parser.add_argument("--no-cache", action="store_true", help="Always run the model")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve live metrics as JSON on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-json", help="Periodically write metrics to this JSON file")
+    parser.add_argument("--metrics-interval", type=float, default=5.0,
+                        help="Seconds between --metrics-json writes")
+    args = parser.parse_args(argv)
+
+    if args.batch_size < 1 or args.workers < 1 or args.video_stride < 1:
+        parser.error("--batch-size, --workers and --video-stride must be positive")
+    if not 0.0 <= args.tile_overlap < 1.0:
+        parser.error("--tile-overlap must be in [0, 1)")
+    if args.start_frame < 0 or (args.end_frame is not None and args.end_frame <= args.start_frame):
+        parser.error("--end-frame must be greater than --start-frame (and both non-negative)")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    sources = collect_sources(args.inputs)
+    if not sources:
+        print("No images or videos found.", file=sys.stderr)
+        return 1
+
+    tiling = None
+    if args.tile:
+        tiling = {"tile_size": args.imgsz, "overlap": args.tile_overlap,
+                  "max_batch": args.tile_batch, "merge_method": args.tile_merge}
+
+    motion_gate = None
+    if args.motion_gate:
+        motion_gate = partial(MotionGate, min_changed=args.motion_threshold,
+                              force_every=args.motion_force_every)
+
+    checkpoint = None
+    resumed = False
+    if args.checkpoint:
+        # Everything that changes the records, so a resumed run can't mix two configurations
+        settings = {"model": args.model, "imgsz": args.imgsz, "conf": args.conf, "iou": args.iou,
+                    "video_stride": args.video_stride, "frame_range": [args.start_frame, args.end_frame],
+                    "cache": not args.no_cache,
+                    # params() doesn't touch the model, so it's not loaded yet
+                    "tiling": (TiledDetector(None, conf=args.conf, iou=args.iou, **tiling).params()
+                               if tiling is not None else None),
+                    "motion_gate": (dict(motion_gate.keywords) if motion_gate is not None else None)}
+        checkpoint = BatchCheckpoint(args.checkpoint, sources, args.checkpoint_interval, settings)
+        resumed = checkpoint.load()
+        if resumed and checkpoint.state["complete"]:
+            print(f"Checkpoint {args.checkpoint} says this run already completed; "
+                  f"delete it to start over.", file=sys.stderr)
+            return 0
+        if resumed:
+            remaining, start_frames = checkpoint.remaining()
+            print(f"Resuming from checkpoint: {len(remaining)} of {len(sources)} file(s) left"
+                  + (f", continuing {os.path.basename(remaining[0])} at frame {start_frames[remaining[0]]}"
+                     if start_frames else ""), file=sys.stderr)
+
+    print(f"Found {len(sources)} file(s), loading model: {args.model}", file=sys.stderr)
+    model = load_detector(args.model)
+
+    cache = None
+    if not args.no_cache:
+        cache = DetectionCache(args.cache_dir, disk_bytes=args.cache_size_mb * 1024 * 1024)
+
+    metrics = Metrics()
+    metrics_server = dumper = None
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(metrics, args.metrics_port).start()
+        print(f"Serving metrics at {metrics_server.address}", file=sys.stderr)
+    if args.metrics_json:
+        dumper = JsonDumper(metrics, args.metrics_json, args.metrics_interval).start()
+
+    if args.output == "-":
+        output = sys.stdout
+        if checkpoint is not None:
+            print("Warning: records written to stdout can't be rolled back on resume", file=sys.stderr)
+    elif resumed and checkpoint.state["output_offset"] is not None and os.path.exists(args.output):
+        # Drop records written after the checkpoint; they will be produced again
+        output = open(args.output, "r+", encoding="utf-8")
+        output.truncate(checkpoint.state["output_offset"])
+        output.seek(checkpoint.state["output_offset"])
+    else:
+        output = open(args.output, "w", encoding="utf-8")
+    try:
+        frames_done, carnivorous_total, elapsed = run_batch_detection(
+            sources, model, output,
+            batch_size=args.batch_size, workers=args.workers, imgsz=args.imgsz,
+            conf=args.conf, iou=args.iou, video_stride=args.video_stride,
+            cache=cache, model_path=args.model, metrics=metrics, tiling=tiling,
+            motion_gate=motion_gate, log_dir=args.log_dir,
+            frame_range=(args.start_frame, args.end_frame), checkpoint=checkpoint)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if dumper is not None:
+            dumper.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+
+    fps = frames_done / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {frames_done} frame(s) in {elapsed:.1f}s ({fps:.1f} FPS), "
+          f"carnivorous detections: {carnivorous_total}", file=sys.stderr)
+    if resumed:
+        print(f"Including earlier runs: {checkpoint.state['frames_done']} frame(s), "
+              f"carnivorous detections: {checkpoint.state['carnivorous_total']}", file=sys.stderr)
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Cache: {stats['memory_hits']} memory hit(s), {stats['disk_hits']} disk hit(s), "
+              f"{stats['misses']} miss(es), hit rate {stats['hit_rate']:.0%}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""
+Headless end-to-end performance benchmark
+Generates synthetic images and videos, runs them through the same
+load -> infer -> annotate -> display-conversion path as AnimalDetectionApp,
+and reports per-stage latency percentiles, FPS and peak memory
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+DEFAULT_RESOLUTIONS = ["640x480", "1280x720", "1920x1080"]
+STAGES = ("load", "infer", "annotate", "display")
+
+# Canvas size of one image pane in the default 1200x800 window
+DISPLAY_SIZE = (560, 600)
+
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def synthetic_image(width, height, seed):
+    """Textured noise with a few filled shapes, so the decoder and model do real work"""
+    rng = np.random.default_rng(seed)
+    image = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (7, 7), 0)
+    for _ in range(6):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        radius = int(rng.integers(min(width, height) // 20, min(width, height) // 6))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.circle(image, (x, y), radius, color, -1)
+    return image
+
+
+def generate_inputs(work_dir, resolutions, frames, with_video):
+    """Write synthetic JPEG images (and optionally one MP4 per resolution) to work_dir"""
+    inputs = []
+    for resolution in resolutions:
+        width, height = parse_resolution(resolution)
+
+        image_paths = []
+        for i in range(frames):
+            path = os.path.join(work_dir, f"img_{resolution}_{i:04d}.jpg")
+            cv2.imwrite(path, synthetic_image(width, height, seed=i))
+            image_paths.append(path)
+        inputs.append({"kind": "images", "resolution": resolution, "paths": image_paths})
+
+        if with_video:
+            path = os.path.join(work_dir, f"video_{resolution}.mp4")
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 25.0, (width, height))
+            base = synthetic_image(width, height, seed=0)
+            for i in range(frames):
+                # Slow pan so consecutive frames differ like real footage
+                writer.write(np.roll(base, shift=i * 4, axis=1))
+            writer.release()
+            inputs.append({"kind": "video", "resolution": resolution, "paths": [path]})
+    return inputs
+
+
+def iter_loaded_frames(source, timings):
+    """Yield decoded frames, recording the load time of each"""
+    if source["kind"] == "images":
+        for path in source["paths"]:
+            start = time.perf_counter()
+            frame = cv2.imread(path)
+            timings["load"].append(time.perf_counter() - start)
+            yield frame
+    else:
+        video_cap = cv2.VideoCapture(source["paths"][0])
+        try:
+            while True:
+                start = time.perf_counter()
+                ret, frame = video_cap.read()
+                if not ret:
+                    break
+                timings["load"].append(time.perf_counter() - start)
+                yield frame
+        finally:
+            video_cap.release()
+
+
+def to_display(image, buffers):
+    """Resize and convert for Tk the way CanvasDisplay.show does (without Tk itself)"""
+    from PIL import Image
+
+    height, width = image.shape[:2]
+    scale = min(DISPLAY_SIZE[0] / width, DISPLAY_SIZE[1] / height, 1.0)
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    if size != (width, height):
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    rgb = buffers.get(image.shape)
+    if rgb is None:
+        rgb = buffers[image.shape] = np.empty_like(image)
+    cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=rgb)
+    return Image.fromarray(rgb)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS bytes
+        return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+    except ImportError:
+        try:
+            import psutil  # type: ignore
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+        except (ImportError, AttributeError):
+            return None
+
+
+def summarize(samples):
+    """p50/p95/p99/mean in milliseconds"""
+    if not samples:
+        return None
+    values = np.asarray(samples) * 1000.0
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "mean_ms": round(float(values.mean()), 3),
+            "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3)}
+
+
+def run_config(config):
+    """Benchmark one (model, imgsz, batch, input) combination; runs in a fresh process"""
+    from annotator import Annotator, extract_detections
+    from model_formats import load_detector
+
+    model = load_detector(config["model"])
+    annotator = Annotator(buffer_count=2)
+    predict_args = {"imgsz": config["imgsz"], "verbose": False}
+
+    # Warm-up so one-off graph/kernel initialization is not measured
+    warmup = np.zeros((config["imgsz"], config["imgsz"], 3), dtype=np.uint8)
+    for _ in range(config["warmup"]):
+        model.predict([warmup] * config["batch_size"], **predict_args)
+
+    timings = {stage: [] for stage in STAGES}
+    display_buffers = {}
+    frames = 0
+    start = time.perf_counter()
+
+    batch = []
+    source_frames = iter_loaded_frames(config["source"], timings)
+    for frame in itertools.chain(source_frames, [None]):
+        if frame is not None:
+            batch.append(frame)
+            if len(batch) < config["batch_size"]:
+                continue
+        if not batch:
+            break
+
+        t0 = time.perf_counter()
+        results = model.predict(batch, **predict_args)
+        timings["infer"].append((time.perf_counter() - t0) / len(batch))
+
+        for image, result in zip(batch, results):
+            t0 = time.perf_counter()
+            detected = annotator.annotate(image, extract_detections(result))
+            timings["annotate"].append(time.perf_counter() - t0)
+
+            if config["display"]:
+                t0 = time.perf_counter()
+                to_display(image, display_buffers)
+                to_display(detected, display_buffers)
+                timings["display"].append(time.perf_counter() - t0)
+
+        frames += len(batch)
+        batch = []
+
+    elapsed = time.perf_counter() - start
+    return {
+        "config": {key: value for key, value in config.items() if key != "source"},
+        "frames": frames,
+        "elapsed_s": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {stage: summarize(samples) for stage, samples in timings.items() if samples},
+    }
+
+
+def config_key(config):
+    return (f"{os.path.basename(config['model'])}|imgsz={config['imgsz']}|"
+            f"batch={config['batch_size']}|{config['input']}")
+
+
+def environment_info():
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+    }
+    try:
+        import torch  # type: ignore
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    try:
+        import ultralytics  # type: ignore
+        info["ultralytics"] = ultralytics.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Print FPS / p95 deltas against the baseline; return the list of regressions"""
+    baseline_by_key = {config_key(entry["config"]): entry for entry in baseline.get("results", [])}
+    regressions = []
+
+    print("\n" + "=" * 78)
+    print("COMPARISON WITH BASELINE")
+    print("=" * 78)
+    for entry in results:
+        key = config_key(entry["config"])
+        base = baseline_by_key.get(key)
+        if base is None:
+            print(f"{key:<52} (no baseline)")
+            continue
+
+        fps_change = (entry["fps"] - base["fps"]) / base["fps"] if base["fps"] else 0.0
+        infer = (entry["stages"].get("infer") or {}).get("p95_ms")
+        base_infer = (base["stages"].get("infer") or {}).get("p95_ms")
+        flag = ""
+        if fps_change < -tolerance:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        infer_text = f"infer p95 {base_infer:.1f} -> {infer:.1f} ms" if infer and base_infer else ""
+        print(f"{key:<52} FPS {base['fps']:.1f} -> {entry['fps']:.1f} ({fps_change:+.1%}) {infer_text}{flag}")
+    print("=" * 78)
+    return regressions
+
+
+def build_configs(args, inputs):
+    configs = []
+    for model, imgsz, batch_size, source in itertools.product(
+            args.models, args.imgsz, args.batch_sizes, inputs):
+        configs.append({
+            "model": model,
+            "imgsz": imgsz,
+            "batch_size": batch_size,
+            "input": f"{source['kind']}@{source['resolution']}",
+            "display": not args.no_display,
+            "warmup": args.warmup,
+            "source": source,
+        })
+    return configs
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless detection benchmark")
+    parser.add_argument("--models", nargs="+", default=["yolov8n.pt"], help="Weights to compare")
+    parser.add_argument("--imgsz", nargs="+", type=int, default=[416], help="Inference sizes to sweep")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1], help="Batch sizes to sweep")
+    parser.add_argument("--resolutions", nargs="+", default=DEFAULT_RESOLUTIONS,
+                        help="Synthetic input resolutions, e.g. 1920x1080")
+    parser.add_argument("--frames", type=int, default=50, help="Images (and video frames) per resolution")
+    parser.add_argument("--no-video", action="store_true", help="Skip synthetic video inputs")
+    parser.add_argument("--no-display", action="store_true", help="Skip the display conversion stage")
+    parser.add_argument("--warmup", type=int, default=2, help="Warm-up batches before timing")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results JSON path")
+    parser.add_argument("--baseline", help="Baseline results JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Also write the results to the --baseline path")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Allowed FPS drop versus baseline before flagging a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="animal_bench_") as work_dir:
+        print("Generating synthetic inputs...")
+        inputs = generate_inputs(work_dir, args.resolutions, args.frames, not args.no_video)
+        configs = build_configs(args, inputs)
+
+        results = []
+        # A fresh process per configuration isolates peak memory and model state
+        context = multiprocessing.get_context("spawn")
+        for i, config in enumerate(configs, 1):
+            print(f"[{i}/{len(configs)}] {config_key(config)}")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                entry = executor.submit(run_config, config).result()
+            results.append(entry)
+
+            stages = "  ".join(f"{stage} p50 {summary['p50_ms']:.1f}ms"
+                               for stage, summary in entry["stages"].items())
+            print(f"    {entry['fps']:.1f} FPS  {stages}  peak RSS {entry['peak_rss_mb'] or 0:.0f} MB")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment_info(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    regressions = []
+    if args.baseline:
+        if args.save_baseline:
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"Baseline saved to {args.baseline}")
+        elif os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        else:
+            print(f"Baseline not found: {args.baseline} (use --save-baseline to create it)")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Train from the preprocessed dataset cache
+A YOLODataset that reads images from the memory-mapped shards written by
+dataset_cache.py instead of decoding JPEGs, and a DetectionTrainer that uses it
+"""
+
+import math
+import os
+
+import cv2
+from ultralytics.data.dataset import YOLODataset  # type: ignore
+from ultralytics.models.yolo.detect import DetectionTrainer  # type: ignore
+from ultralytics.utils import colorstr  # type: ignore
+
+from dataset_cache import DatasetCache
+
+
+class CachedYOLODataset(YOLODataset):
+    """YOLODataset over a prepared cache split (img_path is the split's cache directory)"""
+
+    def get_img_files(self, img_path):
+        self.store = DatasetCache(img_path)
+        indices = self.store.indices
+        fraction = getattr(self, "fraction", 1.0)
+        if fraction < 1:
+            indices = indices[:round(len(indices) * fraction)]
+        self.cache_indices = indices
+        if not indices:
+            raise FileNotFoundError(f"No cached images in {img_path}, run dataset_cache.py first")
+        return [self.store.image_path(index) for index in indices]
+
+    def get_labels(self):
+        labels = []
+        for index, im_file in zip(self.cache_indices, self.im_files):
+            rows = self.store.labels(index)
+            labels.append({
+                "im_file": im_file,
+                "shape": self.store.original_shape(index),
+                "cls": rows[:, 0:1].copy(),
+                "bboxes": rows[:, 1:].copy(),
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        """Same contract as BaseDataset.load_image, reading the pre-resized image from the shard"""
+        image = self.ims[i]
+        if image is not None:
+            return image, self.im_hw0[i], self.im_hw[i]
+
+        index = self.cache_indices[i]
+        image = self.store.image(index)
+        height0, width0 = self.store.original_shape(index)
+        if rect_mode:
+            # Only needed when training at a different size than the cache was built for
+            height, width = image.shape[:2]
+            ratio = self.imgsz / max(height, width)
+            if ratio != 1:
+                size = (min(math.ceil(width * ratio), self.imgsz), min(math.ceil(height * ratio), self.imgsz))
+                image = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+        elif image.shape[:2] != (self.imgsz, self.imgsz):
+            image = cv2.resize(image, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+
+        # Keep the mosaic buffer behaviour of BaseDataset
+        if self.augment:
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = image, (height0, width0), image.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return image, (height0, width0), image.shape[:2]
+
+
+class CachedDetectionTrainer(DetectionTrainer):
+    """DetectionTrainer whose train/val datasets come from the dataset cache"""
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        model = getattr(self.model, "module", self.model)
+        stride = max(int(model.stride.max() if model else 0), 32)
+        return CachedYOLODataset(
+            img_path=img_path,
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=self.args,
+            rect=self.args.rect or mode == "val",
+            cache=None,  # The shards already are the cache
+            single_cls=self.args.single_cls or False,
+            stride=stride,
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=colorstr(f"{mode}: "),
+            task=self.args.task,
+            classes=self.args.classes,
+            data=self.data,
+            fraction=self.args.fraction if mode == "train" else 1.0,
+        )
+
+
+def train_from_cache(model, cache_data_config, **train_args):
+    """model.train() on the cache produced by dataset_cache.prepare_dataset_cache"""
+    if not os.path.exists(cache_data_config):
+        raise FileNotFoundError(f"Dataset cache config not found: {cache_data_config}")
+    return model.train(data=cache_data_config, trainer=CachedDetectionTrainer, **train_args)
@@ -0,0 +1,340 @@
+"""
+Model compression: channel pruning plus knowledge distillation
+Prunes a fraction of the channels of trained weights (requires torch-pruning),
+fine-tunes the smaller student on the dataset while distilling from the
+unpruned teacher, and reports parameters, FLOPs, CPU latency and mAP of
+student versus teacher
+"""
+
+import argparse
+import copy
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import torch  # type: ignore
+import torch.nn.functional as F  # type: ignore
+from torch import nn  # type: ignore
+from ultralytics import YOLO  # type: ignore
+from ultralytics.models.yolo.detect import DetectionTrainer  # type: ignore
+from ultralytics.nn.modules import C2f, Detect  # type: ignore
+from ultralytics.utils.loss import v8DetectionLoss  # type: ignore
+
+from dataset_config import DEFAULT_DATA_CONFIG, load_data_config, write_resolved_config
+
+DEFAULT_SPARSITY = 0.3
+DEFAULT_EPOCHS = 10
+DEFAULT_IMAGE_SIZE = 416
+DEFAULT_DISTILL_WEIGHT = 1.0
+DEFAULT_TEMPERATURE = 2.0
+LATENCY_RUNS = 50
+
+
+class C2fSplit(nn.Module):
+    """
+    C2f with its first convolution split in two
+
+    C2f.cv1 produces both halves in one convolution and chunks the output,
+    which ties their channels together; two separate convolutions let the
+    pruner remove channels from each half independently. Same outputs.
+    """
+
+    def __init__(self, c2f):
+        super().__init__()
+        self.c = c2f.c
+        self.cv0 = _slice_conv(c2f.cv1, 0, self.c)
+        self.cv1 = _slice_conv(c2f.cv1, self.c, 2 * self.c)
+        self.cv2 = c2f.cv2
+        self.m = c2f.m
+        # Layer routing attributes set by Ultralytics' parse_model
+        for attr in ("f", "i", "type", "np"):
+            if hasattr(c2f, attr):
+                setattr(self, attr, getattr(c2f, attr))
+
+    def forward(self, x):
+        y = [self.cv0(x), self.cv1(x)]
+        y.extend(m(y[-1]) for m in self.m)
+        return self.cv2(torch.cat(y, 1))
+
+
+def _slice_conv(conv, start, end):
+    """Copy of an Ultralytics Conv keeping output channels [start, end)"""
+    sliced = copy.deepcopy(conv)
+    sliced.conv.weight = nn.Parameter(conv.conv.weight.data[start:end].clone())
+    sliced.conv.out_channels = end - start
+    if conv.conv.bias is not None:
+        sliced.conv.bias = nn.Parameter(conv.conv.bias.data[start:end].clone())
+    if hasattr(conv, "bn"):
+        sliced.bn.weight = nn.Parameter(conv.bn.weight.data[start:end].clone())
+        sliced.bn.bias = nn.Parameter(conv.bn.bias.data[start:end].clone())
+        sliced.bn.running_mean = conv.bn.running_mean[start:end].clone()
+        sliced.bn.running_var = conv.bn.running_var[start:end].clone()
+        sliced.bn.num_features = end - start
+    return sliced
+
+
+def split_c2f(module):
+    """Replace every C2f block below `module` with an equivalent C2fSplit"""
+    for name, child in module.named_children():
+        if isinstance(child, C2f):
+            setattr(module, name, C2fSplit(child))
+        else:
+            split_c2f(child)
+
+
+def count_flops(model, imgsz):
+    """(GFLOPs, parameters) of one forward pass at imgsz x imgsz"""
+    import torch_pruning as tp  # type: ignore
+
+    # On a copy in eval mode: a training-mode pass would update BatchNorm statistics
+    model = copy.deepcopy(model).float().eval()
+    example = torch.zeros(1, 3, imgsz, imgsz)
+    macs, params = tp.utils.count_ops_and_params(model, example)
+    return round(2 * macs / 1e9, 3), int(params)
+
+
+def prune_model(model, sparsity, imgsz):
+    """Copy of a DetectionModel with `sparsity` of its prunable channels removed"""
+    import torch_pruning as tp  # type: ignore
+
+    model = copy.deepcopy(model).float()
+    split_c2f(model)
+    model.train()
+    for parameter in model.parameters():
+        parameter.requires_grad_(True)
+
+    # The head's output convolutions fix the number of classes and box bins
+    ignored = []
+    for module in model.modules():
+        if isinstance(module, Detect):
+            ignored.extend(branch[-1] for branch in module.cv2)
+            ignored.extend(branch[-1] for branch in module.cv3)
+            ignored.append(module.dfl)
+
+    example = torch.zeros(1, 3, imgsz, imgsz)
+    importance = tp.importance.MagnitudeImportance(p=2)
+    try:
+        pruner = tp.pruner.MagnitudePruner(model, example, importance=importance,
+                                           pruning_ratio=sparsity, ignored_layers=ignored)
+    except TypeError:  # torch-pruning < 1.3
+        pruner = tp.pruner.MagnitudePruner(model, example, importance=importance,
+                                           ch_sparsity=sparsity, ignored_layers=ignored)
+    pruner.step()
+    return model
+
+
+class DistillationLoss(v8DetectionLoss):
+    """
+    Detection loss plus a distillation term from the teacher's raw head outputs
+
+    Class scores are matched with a temperature-softened BCE against the
+    teacher's probabilities and box distributions (DFL bins) with KL divergence.
+    """
+
+    def __init__(self, model, teacher, weight=DEFAULT_DISTILL_WEIGHT, temperature=DEFAULT_TEMPERATURE):
+        super().__init__(model)
+        self.teacher = teacher
+        self.weight = weight
+        self.temperature = temperature
+        self.last_distill = 0.0
+
+    def __call__(self, preds, batch):
+        loss, loss_items = super().__call__(preds, batch)
+        features = preds[1] if isinstance(preds, tuple) else preds
+        with torch.no_grad():
+            teacher_out = self.teacher(batch["img"])
+        teacher_features = teacher_out[1] if isinstance(teacher_out, tuple) else teacher_out
+
+        distill = self.distill_loss(features, teacher_features)
+        self.last_distill = float(distill.detach())
+        batch_size = features[0].shape[0]
+        return loss.sum() + self.weight * distill * batch_size, loss_items
+
+    def distill_loss(self, student, teacher):
+        t = self.temperature
+        total = 0.0
+        for s, te in zip(student, teacher):
+            batch_size = s.shape[0]
+            s_box, s_cls = s.view(batch_size, self.no, -1).split((self.reg_max * 4, self.nc), 1)
+            t_box, t_cls = te.view(batch_size, self.no, -1).split((self.reg_max * 4, self.nc), 1)
+            cls_term = F.binary_cross_entropy_with_logits(s_cls / t, torch.sigmoid(t_cls / t))
+            s_dist = F.log_softmax(s_box.reshape(batch_size, 4, self.reg_max, -1) / t, dim=2)
+            t_dist = F.softmax(t_box.reshape(batch_size, 4, self.reg_max, -1) / t, dim=2)
+            box_term = F.kl_div(s_dist, t_dist, reduction="none").sum(2).mean()
+            total = total + (cls_term + box_term) * t * t
+        return total / len(student)
+
+
+def distillation_trainer(student, teacher, weight=DEFAULT_DISTILL_WEIGHT, temperature=DEFAULT_TEMPERATURE,
+                         base=DetectionTrainer):
+    """Trainer class that fine-tunes `student` with distillation from `teacher`"""
+
+    class DistillationTrainer(base):
+        def get_model(self, cfg=None, weights=None, verbose=True):
+            return student
+
+        def _setup_train(self, world_size):
+            super()._setup_train(world_size)
+            # Attached after the EMA copy is made, so checkpoints never carry the teacher
+            self.model.criterion = DistillationLoss(self.model, teacher, weight, temperature)
+
+        def save_model(self):
+            criterion = self.model.__dict__.pop("criterion", None)
+            try:
+                super().save_model()
+            finally:
+                if criterion is not None:
+                    self.model.criterion = criterion
+
+    return DistillationTrainer
+
+
+def measure_latency(model, imgsz, runs=LATENCY_RUNS, warmup=5):
+    """Forward-pass latency of a fused copy of the model on CPU"""
+    from benchmark import summarize
+
+    model = copy.deepcopy(model).float().eval()
+    if hasattr(model, "fuse"):
+        model = model.fuse(verbose=False)
+    example = torch.zeros(1, 3, imgsz, imgsz)
+    samples = []
+    with torch.inference_mode():
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            model(example)
+            if i >= warmup:
+                samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def describe(model, imgsz):
+    gflops, params = count_flops(model, imgsz)
+    return {"params": params, "gflops": gflops, "latency": measure_latency(model, imgsz)}
+
+
+def compress(teacher_path, data=DEFAULT_DATA_CONFIG, sparsity=DEFAULT_SPARSITY, epochs=DEFAULT_EPOCHS,
+             imgsz=DEFAULT_IMAGE_SIZE, batch=8, workers=2, distill_weight=DEFAULT_DISTILL_WEIGHT,
+             temperature=DEFAULT_TEMPERATURE, output=None, project="animal_detection_cpu",
+             name="compressed", validate=True):
+    """Prune, distill and measure; returns the report dict (also written next to the student)"""
+    if not 0 < sparsity < 1:
+        raise ValueError(f"sparsity must be between 0 and 1, got {sparsity}")
+    teacher = YOLO(teacher_path).model.float().eval()
+    for parameter in teacher.parameters():
+        parameter.requires_grad_(False)
+
+    print(f"Pruning {sparsity:.0%} of the channels...")
+    student = prune_model(teacher, sparsity, imgsz)
+    pruned = describe(student, imgsz)
+    teacher_stats = describe(teacher, imgsz)
+    print(f"  params {teacher_stats['params']:,} -> {pruned['params']:,}, "
+          f"GFLOPs {teacher_stats['gflops']} -> {pruned['gflops']}")
+
+    with tempfile.TemporaryDirectory(prefix="animal_compress_") as work_dir:
+        # Ultralytics resolves a relative dataset root against its own datasets directory
+        data = write_resolved_config(load_data_config(data), os.path.join(work_dir, "data.yaml"))
+        print(f"Fine-tuning the student with distillation for {epochs} epoch(s)...")
+        trainer = distillation_trainer(student, teacher, distill_weight, temperature)
+        model = YOLO(teacher_path)
+        model.train(trainer=trainer, data=data, epochs=epochs, imgsz=imgsz, batch=batch, workers=workers,
+                    device="cpu", amp=False, project=project, name=name, plots=False,
+                    # Fine-tuning a trained model: a short warmup and a small learning rate
+                    lr0=0.001, warmup_epochs=1, close_mosaic=max(1, epochs // 2))
+        save_dir = str(model.trainer.save_dir)
+        best = os.path.join(save_dir, "weights", "best.pt")
+
+        output = output or os.path.splitext(teacher_path)[0] + f"_pruned{int(sparsity * 100)}.pt"
+        shutil.copyfile(best, output)
+        student = YOLO(output).model.float().eval()
+
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "teacher": {"weights": os.path.abspath(teacher_path), **teacher_stats},
+            "student": {"weights": os.path.abspath(output), **describe(student, imgsz)},
+            "sparsity": sparsity,
+            "imgsz": imgsz,
+            "epochs": epochs,
+            "distill_weight": distill_weight,
+            "temperature": temperature,
+            "run_dir": save_dir,
+        }
+        teacher_ms = report["teacher"]["latency"]["p50_ms"]
+        student_ms = report["student"]["latency"]["p50_ms"]
+        report["speedup"] = round(teacher_ms / student_ms, 3) if student_ms else None
+
+        if validate:
+            for role in ("teacher", "student"):
+                metrics = YOLO(report[role]["weights"]).val(data=data, imgsz=imgsz, batch=batch, device="cpu",
+                                                             plots=False, verbose=False)
+                report[role]["map50"] = round(float(metrics.box.map50), 4)
+                report[role]["map50_95"] = round(float(metrics.box.map), 4)
+            report["map50_change"] = round(report["student"]["map50"] - report["teacher"]["map50"], 4)
+
+    with open(os.path.splitext(output)[0] + "_report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def print_report(report):
+    print("\n" + "=" * 60)
+    print("COMPRESSION REPORT")
+    print("=" * 60)
+    print(f"{'':<10} {'params':>12} {'GFLOPs':>8} {'p50 ms':>8} {'mAP50':>7} {'mAP50-95':>9}")
+    for role in ("teacher", "student"):
+        entry = report[role]
+        map50 = f"{entry['map50']:.4f}" if "map50" in entry else "-"
+        map50_95 = f"{entry['map50_95']:.4f}" if "map50_95" in entry else "-"
+        print(f"{role:<10} {entry['params']:>12,} {entry['gflops']:>8.2f} "
+              f"{entry['latency']['p50_ms']:>8.1f} {map50:>7} {map50_95:>9}")
+    if report["speedup"]:
+        print(f"Student is {report['speedup']:.2f}x as fast "
+              f"({1 - 1 / report['speedup']:.0%} less time per image)")
+    if "map50_change" in report:
+        print(f"mAP50 change: {report['map50_change']:+.4f}")
+    print(f"Student weights: {report['student']['weights']}")
+    print("=" * 60)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Prune trained weights and fine-tune them with distillation")
+    parser.add_argument("weights", help="Trained teacher weights, e.g. .../weights/best.pt")
+    parser.add_argument("--data", default=DEFAULT_DATA_CONFIG, help="Dataset YAML")
+    parser.add_argument("--sparsity", type=float, default=DEFAULT_SPARSITY,
+                        help="Fraction of channels to remove (0.3 roughly halves FLOPs)")
+    parser.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS, help="Distillation fine-tuning epochs")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMAGE_SIZE)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--distill-weight", type=float, default=DEFAULT_DISTILL_WEIGHT)
+    parser.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE)
+    parser.add_argument("--output", help="Student weights path (default: <weights>_pruned<N>.pt)")
+    parser.add_argument("--no-val", action="store_true", help="Skip the mAP comparison")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not 0 < args.sparsity < 1:
+        print("--sparsity must be between 0 and 1")
+        return 1
+    try:
+        import torch_pruning  # type: ignore  # noqa: F401
+    except ImportError:
+        print("Channel pruning needs torch-pruning: pip install torch-pruning")
+        return 1
+
+    report = compress(args.weights, args.data, args.sparsity, args.epochs, args.imgsz, args.batch,
+                      args.workers, args.distill_weight, args.temperature, args.output,
+                      validate=not args.no_val)
+    print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    # Run through the importable module so saved students reference compress_model.C2fSplit,
+    # not __main__.C2fSplit, and load anywhere this repository is on the path
+    from compress_model import main as module_main
+    sys.exit(module_main())
@@ -0,0 +1,333 @@
+"""
+Preprocessed training dataset cache
+Decodes and resizes every train/val image once, in parallel, into fixed-size
+memory-mapped shards, keeps the labels as NumPy arrays next to them and
+records a manifest of content hashes so later runs only reprocess changed files
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from dataset_config import (DEFAULT_DATA_CONFIG, image_to_label_path, list_split_images,
+                            load_data_config, split_image_dir)
+from detection_cache import hash_file
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset_cache")
+DEFAULT_IMAGE_SIZE = 416  # Matches IMAGE_SIZE in train_yolo.py
+DEFAULT_SHARD_SIZE = 256
+CACHE_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+SHAPES_FILE = "shapes.npy"
+LABELS_FILE = "labels.npy"
+LABEL_OFFSETS_FILE = "label_offsets.npy"
+
+
+def shard_path(split_dir, shard):
+    return os.path.join(split_dir, f"images_{shard:04d}.npy")
+
+
+def resize_long_side(image, imgsz):
+    """Resize so the longer side equals imgsz, exactly as Ultralytics does when loading a training image"""
+    height, width = image.shape[:2]
+    ratio = imgsz / max(height, width)
+    if ratio == 1:
+        return image
+    size = (min(imgsz, math.ceil(width * ratio)), min(imgsz, math.ceil(height * ratio)))
+    # Ultralytics uses INTER_LINEAR for augmented (training) images in either direction
+    return cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+
+
+def parse_label_file(label_path):
+    """YOLO label file -> (N, 5) float32 array of class, cx, cy, w, h (normalized)"""
+    rows = []
+    if os.path.exists(label_path):
+        with open(label_path, "r", encoding="utf-8") as f:
+            for line in f:
+                values = line.split()
+                if not values:
+                    continue
+                numbers = [float(v) for v in values]
+                if len(numbers) > 5:
+                    # Segmentation polygon; keep its bounding box
+                    xs, ys = numbers[1::2], numbers[2::2]
+                    x1, x2, y1, y2 = min(xs), max(xs), min(ys), max(ys)
+                    numbers = [numbers[0], (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1]
+                rows.append(numbers[:5])
+    return np.asarray(rows, dtype=np.float32).reshape(-1, 5)
+
+
+# Shards opened by this worker process, so each task doesn't remap the file
+_worker_shards = {}
+
+
+def _process_image(task):
+    """Worker: decode one image and write it into its shard slot"""
+    index, image_path, path, slot, imgsz = task
+    try:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise IOError("could not decode image")
+        height0, width0 = image.shape[:2]
+        image = resize_long_side(image, imgsz)
+        height, width = image.shape[:2]
+
+        shard = _worker_shards.get(path)
+        if shard is None:
+            shard = _worker_shards[path] = np.load(path, mmap_mode="r+")
+        shard[slot] = 0
+        shard[slot, :height, :width] = image
+        return index, (height0, width0, height, width), None
+    except Exception as e:
+        return index, None, str(e)
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _load_previous(split_dir, imgsz, shard_size):
+    """Previous manifest and arrays of a split, or empty state if missing or incompatible"""
+    manifest_path = os.path.join(split_dir, MANIFEST_FILE)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if (manifest.get("version") != CACHE_VERSION or manifest.get("imgsz") != imgsz
+                or manifest.get("shard_size") != shard_size):
+            raise ValueError("incompatible cache")
+        shapes = np.load(os.path.join(split_dir, SHAPES_FILE))
+        labels = np.load(os.path.join(split_dir, LABELS_FILE))
+        offsets = np.load(os.path.join(split_dir, LABEL_OFFSETS_FILE))
+        entries = manifest["entries"]
+        old_labels = [labels[offsets[i]:offsets[i + 1]] for i in range(len(entries))]
+        return entries, [tuple(int(v) for v in row) for row in shapes], old_labels
+    except (OSError, ValueError, KeyError):
+        # Start over; stale shards would have the wrong layout
+        if os.path.isdir(split_dir):
+            for name in os.listdir(split_dir):
+                if name.startswith("images_") and name.endswith(".npy"):
+                    os.remove(os.path.join(split_dir, name))
+        return [], [], []
+
+
+def _content_hash(path, stamp, previous):
+    """Reuse the previous hash when size and mtime are unchanged"""
+    if previous is not None and previous.get("stamp") == list(stamp):
+        return previous["hash"]
+    return hash_file(path)
+
+
+def prepare_split(config, split, cache_dir, imgsz=DEFAULT_IMAGE_SIZE, workers=None,
+                  shard_size=DEFAULT_SHARD_SIZE):
+    """Bring the cache of one split up to date; returns a dict of counts"""
+    split_dir = os.path.join(cache_dir, split)
+    os.makedirs(split_dir, exist_ok=True)
+    image_dir = split_image_dir(config, split)
+    images = list_split_images(config, split)
+
+    entries, shapes, labels = _load_previous(split_dir, imgsz, shard_size)
+    by_file = {entry["file"]: index for index, entry in enumerate(entries) if entry is not None}
+    free = [index for index, entry in enumerate(entries) if entry is None]
+    seen = set()
+    tasks = []
+    counts = {"split": split, "images": len(images), "processed": 0, "reused": 0,
+              "removed": 0, "failed": 0, "labels_updated": 0}
+
+    for image_path in images:
+        relative = os.path.relpath(image_path, image_dir).replace(os.sep, "/")
+        label_path = image_to_label_path(image_path)
+        index = by_file.get(relative)
+        previous = entries[index] if index is not None else None
+
+        image_stamp = _file_stamp(image_path)
+        image_hash = _content_hash(image_path, image_stamp, previous and previous["image"])
+        label_stamp = _file_stamp(label_path) if os.path.exists(label_path) else (0, 0)
+        label_hash = (_content_hash(label_path, label_stamp, previous and previous["label"])
+                      if os.path.exists(label_path) else None)
+
+        if index is None:
+            index = free.pop(0) if free else len(entries)
+            if index == len(entries):
+                entries.append(None)
+                shapes.append((0, 0, 0, 0))
+                labels.append(np.zeros((0, 5), dtype=np.float32))
+        seen.add(index)
+
+        if previous is None or previous["image"]["hash"] != image_hash:
+            tasks.append((index, image_path, shard_path(split_dir, index // shard_size),
+                          index % shard_size, imgsz))
+        else:
+            counts["reused"] += 1
+        if previous is None or previous["label"]["hash"] != label_hash:
+            labels[index] = parse_label_file(label_path)
+            counts["labels_updated"] += 1
+
+        entries[index] = {
+            "file": relative,
+            "image": {"hash": image_hash, "stamp": list(image_stamp)},
+            "label": {"hash": label_hash, "stamp": list(label_stamp)},
+        }
+
+    for index, entry in enumerate(entries):
+        if entry is not None and index not in seen:
+            entries[index] = None
+            shapes[index] = (0, 0, 0, 0)
+            labels[index] = np.zeros((0, 5), dtype=np.float32)
+            counts["removed"] += 1
+
+    # Drop free slots at the end, then make sure every needed shard exists
+    while entries and entries[-1] is None:
+        entries.pop()
+        shapes.pop()
+        labels.pop()
+    shard_count = math.ceil(len(entries) / shard_size)
+    queued = {task[0] for task in tasks}
+    for shard in range(shard_count):
+        path = shard_path(split_dir, shard)
+        if not os.path.exists(path):
+            np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8,
+                                      shape=(shard_size, imgsz, imgsz, 3)).flush()
+            # A shard deleted behind our back: everything that lived in it is redone
+            for index in range(shard * shard_size, min(len(entries), (shard + 1) * shard_size)):
+                if entries[index] is not None and index not in queued:
+                    tasks.append((index, os.path.join(image_dir, *entries[index]["file"].split("/")),
+                                  path, index % shard_size, imgsz))
+                    counts["reused"] -= 1
+    shard = shard_count
+    while os.path.exists(shard_path(split_dir, shard)):
+        os.remove(shard_path(split_dir, shard))
+        shard += 1
+
+    if tasks:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            for index, shape, error in executor.map(_process_image, tasks, chunksize=8):
+                if error is not None:
+                    print(f"Warning: skipping {entries[index]['file']}: {error}")
+                    entries[index] = None
+                    shapes[index] = (0, 0, 0, 0)
+                    labels[index] = np.zeros((0, 5), dtype=np.float32)
+                    counts["failed"] += 1
+                else:
+                    shapes[index] = shape
+                    counts["processed"] += 1
+
+    offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(rows) for rows in labels])
+    all_labels = np.concatenate(labels) if labels else np.zeros((0, 5), dtype=np.float32)
+    np.save(os.path.join(split_dir, SHAPES_FILE), np.asarray(shapes, dtype=np.int32).reshape(-1, 4))
+    np.save(os.path.join(split_dir, LABELS_FILE), all_labels.astype(np.float32))
+    np.save(os.path.join(split_dir, LABEL_OFFSETS_FILE), offsets)
+
+    # The manifest is written last so an interrupted run is redone, not trusted
+    manifest = {"version": CACHE_VERSION, "imgsz": imgsz, "shard_size": shard_size,
+                "image_dir": os.path.abspath(image_dir), "entries": entries}
+    tmp_path = os.path.join(split_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(split_dir, MANIFEST_FILE))
+    return counts
+
+
+def write_cache_data_config(config, cache_dir, splits):
+    """Data YAML pointing at the cache split directories, for CachedDetectionTrainer"""
+    import yaml  # type: ignore
+
+    cache_config = {"path": os.path.abspath(cache_dir), "names": config["names"]}
+    for split in splits:
+        cache_config[split] = split
+    output_path = os.path.join(cache_dir, "data.yaml")
+    with open(output_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(cache_config, f, sort_keys=False)
+    return output_path
+
+
+def prepare_dataset_cache(data_config=DEFAULT_DATA_CONFIG, cache_dir=DEFAULT_CACHE_DIR,
+                          imgsz=DEFAULT_IMAGE_SIZE, workers=None, splits=("train", "val"),
+                          shard_size=DEFAULT_SHARD_SIZE):
+    """Update the cache for all splits; returns (cache data yaml path, per-split counts)"""
+    config = load_data_config(data_config)
+    os.makedirs(cache_dir, exist_ok=True)
+    counts = [prepare_split(config, split, cache_dir, imgsz, workers, shard_size) for split in splits]
+    return write_cache_data_config(config, cache_dir, splits), counts
+
+
+class DatasetCache:
+    """Read access to one prepared split; shards are memory-mapped read-only on first use"""
+
+    def __init__(self, split_dir):
+        self.split_dir = split_dir
+        with open(os.path.join(split_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.imgsz = manifest["imgsz"]
+        self.shard_size = manifest["shard_size"]
+        self.image_dir = manifest["image_dir"]
+        self.entries = manifest["entries"]
+        self.indices = [index for index, entry in enumerate(self.entries) if entry is not None]
+        self.shapes = np.load(os.path.join(split_dir, SHAPES_FILE))
+        self._labels = np.load(os.path.join(split_dir, LABELS_FILE))
+        self._offsets = np.load(os.path.join(split_dir, LABEL_OFFSETS_FILE))
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getstate__(self):
+        # Dataloader workers reopen the memory maps instead of receiving copies
+        state = dict(self.__dict__)
+        state["_shards"] = {}
+        return state
+
+    def image_path(self, index):
+        return os.path.join(self.image_dir, *self.entries[index]["file"].split("/"))
+
+    def original_shape(self, index):
+        height0, width0 = self.shapes[index][:2]
+        return int(height0), int(width0)
+
+    def image(self, index):
+        """Resized image as a writable copy (augmentations modify images in place)"""
+        shard = index // self.shard_size
+        images = self._shards.get(shard)
+        if images is None:
+            images = self._shards[shard] = np.load(shard_path(self.split_dir, shard), mmap_mode="r")
+        height, width = self.shapes[index][2:]
+        return np.array(images[index % self.shard_size, :height, :width])
+
+    def labels(self, index):
+        return self._labels[self._offsets[index]:self._offsets[index + 1]]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Prepare the preprocessed, memory-mapped training dataset cache")
+    parser.add_argument("--data", default=DEFAULT_DATA_CONFIG, help="Dataset YAML")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Where to write the cache")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMAGE_SIZE, help="Training image size")
+    parser.add_argument("--workers", type=int, help="Decode processes (default: all CPU cores)")
+    parser.add_argument("--splits", nargs="+", default=["train", "val"], help="Splits to cache")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="Images per shard file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    data_yaml, counts = prepare_dataset_cache(args.data, args.cache_dir, args.imgsz, args.workers,
+                                              args.splits, args.shard_size)
+    for split_counts in counts:
+        print(f"{split_counts['split']}: {split_counts['images']} images, "
+              f"{split_counts['processed']} processed, {split_counts['reused']} reused, "
+              f"{split_counts['removed']} removed, {split_counts['failed']} failed")
+    print(f"Cache data config: {data_yaml}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Helpers for reading animal_data.yaml
+Resolves the dataset root and split directories so tools work on the machine
+they run on, not only at the path written in the YAML
+"""
+
+import os
+
+import yaml  # type: ignore
+
+DEFAULT_DATA_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "animal_data.yaml")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def _normalize(path):
+    """Accept Windows-style separators in the YAML on any platform"""
+    return os.path.normpath(str(path).replace("\\", os.sep))
+
+
+def load_data_config(data_config=DEFAULT_DATA_CONFIG):
+    """Load the dataset YAML and resolve its root directory"""
+    with open(data_config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    config_dir = os.path.dirname(os.path.abspath(data_config))
+    root = _normalize(config.get("path", ""))
+    if not os.path.isabs(root):
+        root = os.path.join(config_dir, root)
+    if not os.path.isdir(root):
+        # The committed path is machine specific; fall back to ./dataset next to the YAML
+        fallback = os.path.join(config_dir, "dataset")
+        if os.path.isdir(fallback):
+            root = fallback
+
+    config["path"] = root
+    names = config.get("names", {})
+    if isinstance(names, list):
+        names = dict(enumerate(names))
+    config["names"] = names
+    return config
+
+
+def split_image_dir(config, split):
+    """Return the image directory of a split ('train', 'val' or 'test')"""
+    split_path = config.get(split)
+    if split_path is None:
+        raise KeyError(f"Split '{split}' is not defined in the data config")
+    split_path = _normalize(split_path)
+    if not os.path.isabs(split_path):
+        split_path = os.path.join(config["path"], split_path)
+    return split_path
+
+
+def image_to_label_path(image_path):
+    """Map .../images/<split>/x.jpg to .../labels/<split>/x.txt (YOLO convention)"""
+    parts = image_path.split(os.sep)
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i] == "images":
+            parts[i] = "labels"
+            break
+    return os.path.splitext(os.sep.join(parts))[0] + ".txt"
+
+
+def list_split_images(config, split):
+    """Return a sorted list of image files in a split"""
+    image_dir = split_image_dir(config, split)
+    images = []
+    for dirpath, _, filenames in os.walk(image_dir):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                images.append(os.path.join(dirpath, filename))
+    return sorted(images)
+
+
+def write_resolved_config(config, output_path):
+    """Write a copy of the data config with the resolved absolute root path and native split paths"""
+    resolved = dict(config)
+    resolved["path"] = os.path.abspath(config["path"])
+    for split in ("train", "val", "test"):
+        if isinstance(resolved.get(split), str):
+            resolved[split] = _normalize(resolved[split])
+    with open(output_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(resolved, f, sort_keys=False)
+    return output_path
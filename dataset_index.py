@@ -0,0 +1,282 @@
+"""
+Dataset indexer and integrity checker
+Scans the images/ and labels/ splits of animal_data.yaml with a process pool,
+validates every label file and reports per-class instance counts and box-size
+histograms. The index is persisted so later scans only re-examine files whose
+size or mtime changed
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from dataset_config import (DEFAULT_DATA_CONFIG, image_to_label_path, list_split_images,
+                            load_data_config, split_image_dir)
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset_index.json")
+INDEX_VERSION = 2  # 2: segmentation polygon rows are accepted
+SPLITS = ("train", "val", "test")
+
+# Relative box size sqrt(w * h) of the image
+SIZE_BINS = (0.0, 0.02, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1.0)
+# COCO-style absolute size buckets by pixel area
+SMALL_AREA = 32 * 32
+MEDIUM_AREA = 96 * 96
+
+
+def _stamp(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def check_pair(task):
+    """Worker: validate one image and its label file; returns an index record"""
+    image_path, label_path, num_classes = task
+    record = {"image_stamp": _stamp(image_path), "label_stamp": _stamp(label_path),
+              "width": 0, "height": 0, "boxes": [], "errors": [], "warnings": []}
+
+    image = cv2.imread(image_path)
+    if image is None:
+        record["errors"].append("image cannot be decoded")
+    else:
+        record["height"], record["width"] = image.shape[:2]
+
+    if record["label_stamp"] is None:
+        record["warnings"].append("no label file (treated as background)")
+        return record
+
+    seen = set()
+    with open(label_path, "r", encoding="utf-8", errors="replace") as f:
+        for line_number, line in enumerate(f, 1):
+            values = line.split()
+            if not values:
+                continue
+            where = f"line {line_number}"
+            try:
+                numbers = [float(v) for v in values]
+            except ValueError:
+                record["errors"].append(f"{where}: non-numeric value")
+                continue
+            polygon = len(numbers) >= 7 and len(numbers) % 2 == 1
+            if len(numbers) != 5 and not polygon:
+                record["errors"].append(f"{where}: expected 5 values (box) or class + 3 or more "
+                                        f"x y pairs (polygon), found {len(numbers)}")
+                continue
+
+            class_id = numbers[0]
+            if not class_id.is_integer() or not 0 <= class_id < num_classes:
+                record["errors"].append(f"{where}: class id {values[0]} outside 0-{num_classes - 1}")
+                continue
+            if not all(0.0 <= v <= 1.0 for v in numbers[1:]):
+                record["errors"].append(f"{where}: coordinates not normalized to [0, 1]")
+                continue
+            if polygon:
+                # Reduced to its bounding box, as dataset_cache.parse_label_file and Ultralytics do
+                xs, ys = numbers[1::2], numbers[2::2]
+                x1, x2, y1, y2 = min(xs), max(xs), min(ys), max(ys)
+                cx, cy, w, h = (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1
+            else:
+                cx, cy, w, h = numbers[1:]
+            if w <= 0 or h <= 0:
+                record["errors"].append(f"{where}: zero-size box")
+                continue
+            if (cx - w / 2 < -1e-3 or cx + w / 2 > 1 + 1e-3
+                    or cy - h / 2 < -1e-3 or cy + h / 2 > 1 + 1e-3):
+                record["warnings"].append(f"{where}: box extends past the image border")
+
+            key = tuple(values)
+            if key in seen:
+                record["warnings"].append(f"{where}: duplicate box")
+                continue
+            seen.add(key)
+            record["boxes"].append([int(class_id), w, h])
+
+    return record
+
+
+def _orphan_labels(image_dir, image_paths):
+    """Label files of a split that have no matching image"""
+    label_dir = image_to_label_path(os.path.join(image_dir, "x.jpg"))
+    label_dir = os.path.dirname(label_dir)
+    expected = {os.path.normcase(image_to_label_path(path)) for path in image_paths}
+    orphans = []
+    for dirpath, _, filenames in os.walk(label_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if filename.endswith(".txt") and os.path.normcase(path) not in expected:
+                orphans.append(path)
+    return sorted(orphans)
+
+
+def load_index(index_path, data_config):
+    """Previous index, or an empty one if missing, unreadable or built for another dataset"""
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION and index.get("data_config") == os.path.abspath(data_config):
+            return index
+    except (OSError, ValueError):
+        pass
+    return {"version": INDEX_VERSION, "data_config": os.path.abspath(data_config), "splits": {}}
+
+
+def save_index(index, index_path):
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+
+def index_dataset(data_config=DEFAULT_DATA_CONFIG, index_path=DEFAULT_INDEX_PATH, workers=None,
+                  splits=SPLITS):
+    """Scan the splits, reusing unchanged records from the persisted index; returns (index, rescanned)"""
+    config = load_data_config(data_config)
+    num_classes = len(config["names"])
+    index = load_index(index_path, data_config)
+    if index.get("num_classes") != num_classes:
+        index["splits"] = {}  # Class list changed; every label must be revalidated
+    index["num_classes"] = num_classes
+
+    rescanned = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for split in splits:
+            if config.get(split) is None:
+                continue
+            image_dir = split_image_dir(config, split)
+            images = list_split_images(config, split) if os.path.isdir(image_dir) else []
+            previous = index["splits"].get(split, {}).get("files", {})
+
+            files, tasks = {}, []
+            for image_path in images:
+                relative = os.path.relpath(image_path, image_dir).replace(os.sep, "/")
+                label_path = image_to_label_path(image_path)
+                record = previous.get(relative)
+                if (record is not None and record["image_stamp"] == _stamp(image_path)
+                        and record["label_stamp"] == _stamp(label_path)):
+                    files[relative] = record
+                else:
+                    tasks.append((relative, (image_path, label_path, num_classes)))
+
+            for (relative, _), record in zip(tasks, executor.map(check_pair, [task for _, task in tasks],
+                                                                  chunksize=16)):
+                files[relative] = record
+            rescanned += len(tasks)
+
+            index["splits"][split] = {
+                "image_dir": image_dir,
+                "files": dict(sorted(files.items())),
+                "orphan_labels": _orphan_labels(image_dir, images) if images else [],
+            }
+
+    save_index(index, index_path)
+    return index, rescanned
+
+
+def split_report(split_index, names):
+    """Per-class instance counts, box-size histograms and problems of one split"""
+    num_classes = len(names)
+    instances = np.zeros(num_classes, dtype=np.int64)
+    images_per_class = np.zeros(num_classes, dtype=np.int64)
+    relative_sizes, pixel_areas = [], []
+    errors, warnings = [], []
+    unlabeled = 0
+
+    for relative, record in split_index["files"].items():
+        errors.extend(f"{relative}: {message}" for message in record["errors"])
+        warnings.extend(f"{relative}: {message}" for message in record["warnings"])
+        if not record["boxes"]:
+            unlabeled += 1
+            continue
+        boxes = np.asarray(record["boxes"], dtype=np.float64)
+        classes = boxes[:, 0].astype(np.int64)
+        instances += np.bincount(classes, minlength=num_classes)
+        images_per_class[np.unique(classes)] += 1
+        relative_sizes.append(np.sqrt(boxes[:, 1] * boxes[:, 2]))
+        pixel_areas.append(boxes[:, 1] * record["width"] * boxes[:, 2] * record["height"])
+    errors.extend(f"{path}: label file without matching image" for path in split_index["orphan_labels"])
+
+    relative_sizes = np.concatenate(relative_sizes) if relative_sizes else np.zeros(0)
+    pixel_areas = np.concatenate(pixel_areas) if pixel_areas else np.zeros(0)
+    histogram, _ = np.histogram(relative_sizes, bins=SIZE_BINS)
+
+    return {
+        "images": len(split_index["files"]),
+        "unlabeled_images": unlabeled,
+        "instances": int(instances.sum()),
+        "classes": {names[i]: {"instances": int(instances[i]), "images": int(images_per_class[i])}
+                    for i in range(num_classes)},
+        "size_histogram": {f"{SIZE_BINS[i]:.2f}-{SIZE_BINS[i + 1]:.2f}": int(count)
+                           for i, count in enumerate(histogram)},
+        "size_buckets": {
+            "small": int(np.count_nonzero(pixel_areas < SMALL_AREA)),
+            "medium": int(np.count_nonzero((pixel_areas >= SMALL_AREA) & (pixel_areas < MEDIUM_AREA))),
+            "large": int(np.count_nonzero(pixel_areas >= MEDIUM_AREA)),
+        },
+        "errors": errors,
+        "warnings": warnings,
+    }
+
+
+def dataset_report(index, names):
+    return {split: split_report(split_index, names) for split, split_index in index["splits"].items()}
+
+
+def print_report(report, max_problems=20):
+    for split, summary in report.items():
+        print("\n" + "=" * 60)
+        print(f"{split.upper()}: {summary['images']} images, {summary['instances']} boxes, "
+              f"{summary['unlabeled_images']} without boxes")
+        print("=" * 60)
+        for name, counts in summary["classes"].items():
+            print(f"  {name:<14} {counts['instances']:>7} boxes in {counts['images']:>6} images")
+        print("  Box size sqrt(w*h) relative to image:")
+        peak = max(summary["size_histogram"].values()) or 1
+        for size_bin, count in summary["size_histogram"].items():
+            print(f"    {size_bin}  {count:>7}  {'#' * int(round(30 * count / peak))}")
+        buckets = summary["size_buckets"]
+        print(f"  Small (<32px): {buckets['small']}, medium: {buckets['medium']}, large (>=96px): {buckets['large']}")
+
+        for label, problems in (("ERRORS", summary["errors"]), ("Warnings", summary["warnings"])):
+            if problems:
+                print(f"  {label} ({len(problems)}):")
+                for problem in problems[:max_problems]:
+                    print(f"    {problem}")
+                if len(problems) > max_problems:
+                    print(f"    ... {len(problems) - max_problems} more")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Index and validate the dataset splits")
+    parser.add_argument("--data", default=DEFAULT_DATA_CONFIG, help="Dataset YAML")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Persisted index file")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all CPU cores)")
+    parser.add_argument("--splits", nargs="+", default=list(SPLITS), help="Splits to scan")
+    parser.add_argument("--report", help="Also write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_data_config(args.data)
+    index, rescanned = index_dataset(args.data, args.index, args.workers, args.splits)
+    report = dataset_report(index, config["names"])
+    print_report(report)
+    total = sum(summary["images"] for summary in report.values())
+    print(f"\nIndexed {total} images ({rescanned} new or changed) -> {args.index}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if any(summary["errors"] for summary in report.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
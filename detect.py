@@ -1,12 +1,60 @@
+import time
+
+# Startup reference for time-to-ready / time-to-first-detection
+APP_START = time.perf_counter()
+
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import cv2
-from PIL import Image, ImageTk
 import numpy as np
-from ultralytics import YOLO
 import os
+import json
 import threading
-import time
+from animal_classes import CLASS_NAMES, CARNIVOROUS_ANIMALS
+from video_pipeline import VideoPipeline, DROP_POLICIES, DROP_OLDEST, source_fps
+from annotator import Annotator, ClassTable
+from detection_cache import CachedDetector, DetectionCache, hash_file
+from tk_display import CanvasDisplay
+from tracker import TrackedDetector
+from tiled_inference import TiledDetector
+from motion_gate import MotionGate, MotionGatedDetector
+from model_formats import MODEL_FILETYPES, load_detector
+from metrics import Metrics
+from detection_log import DetectionLogWriter
+from video_export import EXPORT_MODES, EXPORT_OFF, VideoExporter
+from shared_frames import SharedMemoryDecoder, frame_shape
+from adaptive_resolution import ResolutionController
+
+# Frames in flight between inference and the display: render queue + renderer + Tk
+VIDEO_BUFFER_COUNT = 5
+
+# How often the performance line under the status label is refreshed
+METRICS_REFRESH_MS = 500
+
+# Remembers the last model so startup never blocks on a file dialog
+SETTINGS_PATH = os.path.join(os.path.expanduser("~"), ".animal_detection", "settings.json")
+DEFAULT_MODEL = 'yolov8n.pt'
+IMAGE_SIZE = 416  # Matches IMAGE_SIZE in train_yolo.py
+# Thresholds the GUI detects at; same as batch_detect.py's defaults so cache keys agree
+CONFIDENCE = 0.25
+NMS_IOU = 0.7
+
+def load_settings():
+    """Read persisted GUI settings"""
+    try:
+        with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_settings(settings):
+    """Persist GUI settings"""
+    try:
+        os.makedirs(os.path.dirname(SETTINGS_PATH), exist_ok=True)
+        with open(SETTINGS_PATH, "w", encoding="utf-8") as f:
+            json.dump(settings, f, indent=2)
+    except OSError as e:
+        print(f"Could not save settings: {str(e)}")
 
 class AnimalDetectionApp:
     def __init__(self, root):
@@ -16,29 +64,56 @@ class AnimalDetectionApp:
         self.root.configure(bg='#f0f0f0')
         
         # Animal classes from your dataset
-        self.class_names = {
-            0: "Dog", 1: "Cat", 2: "Zebra", 3: "Lion", 4: "Leopard",
-            5: "Cheetah", 6: "Tiger", 7: "Bear", 8: "Brown Bear", 9: "Butterfly",
-            10: "Canary", 11: "Crocodile", 12: "Polar Bear", 13: "Bull", 14: "Camel",
-            15: "Crab", 16: "Chicken", 17: "Centipede", 18: "Cattle", 19: "Caterpillar", 20: "Duck"
-        }
+        self.class_names = dict(CLASS_NAMES)
         
         # Carnivorous animals (highlighted in red)
-        self.carnivorous_animals = {
-            "Lion", "Leopard", "Cheetah", "Tiger", "Bear", "Brown Bear", 
-            "Polar Bear", "Crocodile", "Cat"
-        }
+        self.carnivorous_animals = set(CARNIVOROUS_ANIMALS)
+        self.class_table = ClassTable(self.class_names, self.carnivorous_animals)
+        
+        # Image and video paths draw into separate reusable buffers; video needs
+        # enough of them to cover frames still queued for display
+        self.image_annotator = Annotator(self.class_table, show_count=False)
+        self.video_annotator = Annotator(self.class_table, buffer_count=VIDEO_BUFFER_COUNT)
         
         # Initialize variables
         self.model = None
+        self.model_loading = False
+        self.ready_s = None
+        self.first_detection_s = None
+        self.cached_detector = None
         self.current_image = None
+        self.current_image_hash = None
         self.current_video_path = None
         self.video_cap = None
         self.is_playing = False
-        self.detection_thread = None
+        self.video_pipeline = None
+        self.tracked_detector = None
+        self.frame_processor = None
+        # Steps the video input size to hold the latency budget (None = fixed IMAGE_SIZE)
+        self.resolution_controller = None
+        
+        # Playback position kept across pause/resume (None = start from the range start)
+        self.resume_frame = None
+        # Detection log / video export of the current playback, kept across pauses;
+        # the run id fences off render threads of pipelines that were replaced
+        self.video_session = None
+        self.video_run = 0
+        self.session_lock = threading.Lock()
+        
+        # Per-stage timings, counters and queue depths for the status line
+        self.metrics = Metrics()
+        
+        # Detection results keyed on image, weights and inference parameters
+        self.detection_cache = DetectionCache()
         
         self.setup_ui()
-        self.load_model()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Show the window first; load the last-used (or default) model in the background
+        model_path = load_settings().get("last_model_path")
+        if not model_path or not os.path.exists(model_path):
+            model_path = DEFAULT_MODEL
+        self.root.after(0, lambda: self.start_model_load(model_path))
     
     def setup_ui(self):
         # Main title
@@ -71,6 +146,19 @@ class AnimalDetectionApp:
                                    bg='#9C27B0', fg='white', padx=20)
         self.detect_btn.grid(row=0, column=3, padx=5)
         
+        # Tiled inference keeps distant animals visible in high-resolution stills
+        self.tiled_var = tk.BooleanVar(value=False)
+        self.tiled_check = tk.Checkbutton(control_frame, text="Tiled (high-res)", variable=self.tiled_var,
+                                          font=("Arial", 10), bg='#f0f0f0')
+        self.tiled_check.grid(row=0, column=4, padx=5)
+        
+        # Save annotated video output: everything, or only clips around detections
+        tk.Label(control_frame, text="Save video:", font=("Arial", 10),
+                 bg='#f0f0f0').grid(row=0, column=5, padx=(15, 5))
+        self.export_mode_var = tk.StringVar(value=EXPORT_OFF)
+        ttk.Combobox(control_frame, textvariable=self.export_mode_var, values=EXPORT_MODES,
+                     state='readonly', width=15).grid(row=0, column=6, padx=5)
+        
         # Video controls
         video_control_frame = tk.Frame(self.root, bg='#f0f0f0')
         video_control_frame.pack(pady=5)
@@ -85,15 +173,82 @@ class AnimalDetectionApp:
                                   bg='#F44336', fg='white', state='disabled')
         self.pause_btn.grid(row=0, column=1, padx=5)
         
+        # What to do with frames when detection can't keep up
+        tk.Label(video_control_frame, text="When behind:", font=("Arial", 10),
+                 bg='#f0f0f0').grid(row=0, column=2, padx=(15, 5))
+        self.drop_policy_var = tk.StringVar(value=DROP_OLDEST)
+        self.drop_policy_combo = ttk.Combobox(video_control_frame, textvariable=self.drop_policy_var,
+                                              values=DROP_POLICIES, state='readonly', width=12)
+        self.drop_policy_combo.grid(row=0, column=3, padx=5)
+        
+        # Run the detector every N frames and track animals in between
+        tk.Label(video_control_frame, text="Detect every N frames:", font=("Arial", 10),
+                 bg='#f0f0f0').grid(row=0, column=4, padx=(15, 5))
+        self.detect_interval_var = tk.IntVar(value=1)
+        self.detect_interval_spin = tk.Spinbox(video_control_frame, from_=1, to=30, width=4,
+                                               textvariable=self.detect_interval_var)
+        self.detect_interval_spin.grid(row=0, column=5, padx=5)
+        
+        # Skip inference on frames where nothing moved
+        self.motion_gate_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(video_control_frame, text="Skip static frames", variable=self.motion_gate_var,
+                       font=("Arial", 10), bg='#f0f0f0').grid(row=0, column=6, padx=(15, 5))
+        tk.Label(video_control_frame, text="Sensitivity:", font=("Arial", 10),
+                 bg='#f0f0f0').grid(row=0, column=7, padx=(5, 0))
+        self.motion_sensitivity_var = tk.DoubleVar(value=0.5)
+        tk.Scale(video_control_frame, variable=self.motion_sensitivity_var, from_=0.0, to=1.0,
+                 resolution=0.05, orient=tk.HORIZONTAL, length=100, showvalue=False,
+                 bg='#f0f0f0').grid(row=0, column=8, padx=5)
+        
+        # Stream every detection to a columnar log next to the video
+        self.log_detections_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(video_control_frame, text="Log detections", variable=self.log_detections_var,
+                       font=("Arial", 10), bg='#f0f0f0').grid(row=0, column=9, padx=(15, 5))
+        
+        # Frame range; Pause keeps the position, Rewind goes back to the range start
+        range_frame = tk.Frame(self.root, bg='#f0f0f0')
+        range_frame.pack(pady=(0, 5))
+        self.rewind_btn = tk.Button(range_frame, text="Rewind", command=self.rewind_video,
+                                    font=("Arial", 10), state='disabled')
+        self.rewind_btn.grid(row=0, column=0, padx=5)
+        tk.Label(range_frame, text="From frame:", font=("Arial", 10),
+                 bg='#f0f0f0').grid(row=0, column=1, padx=(15, 5))
+        self.start_frame_var = tk.IntVar(value=0)
+        tk.Spinbox(range_frame, from_=0, to=10**9, textvariable=self.start_frame_var,
+                   width=8).grid(row=0, column=2, padx=5)
+        tk.Label(range_frame, text="To frame (0 = end):", font=("Arial", 10),
+                 bg='#f0f0f0').grid(row=0, column=3, padx=(15, 5))
+        self.end_frame_var = tk.IntVar(value=0)
+        tk.Spinbox(range_frame, from_=0, to=10**9, textvariable=self.end_frame_var,
+                   width=8).grid(row=0, column=4, padx=5)
+        
+        # Decode in another process, sharing frames through shared memory instead of pickling them
+        self.process_decode_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(range_frame, text="Decode in separate process", variable=self.process_decode_var,
+                       font=("Arial", 10), bg='#f0f0f0').grid(row=0, column=5, padx=(15, 5))
+        
+        # Per-frame inference budget; the input size is adapted to stay under it
+        tk.Label(range_frame, text="Latency budget ms (0 = off):", font=("Arial", 10),
+                 bg='#f0f0f0').grid(row=0, column=6, padx=(15, 5))
+        self.latency_budget_var = tk.IntVar(value=0)
+        tk.Spinbox(range_frame, from_=0, to=2000, increment=10, textvariable=self.latency_budget_var,
+                   width=6).grid(row=0, column=7, padx=5)
+        
         # Progress bar
         self.progress = ttk.Progressbar(self.root, mode='indeterminate')
         self.progress.pack(pady=5, fill=tk.X, padx=50)
         
         # Status label
-        self.status_label = tk.Label(self.root, text="Ready to load model...", 
+        self.status_label = tk.Label(self.root, text="Starting...", 
                                     font=("Arial", 10), bg='#f0f0f0', fg='#666')
         self.status_label.pack(pady=5)
         
+        # Live performance figures (FPS and per-stage ms)
+        self.metrics_label = tk.Label(self.root, text="", font=("Consolas", 9),
+                                      bg='#f0f0f0', fg='#888')
+        self.metrics_label.pack()
+        self.root.after(METRICS_REFRESH_MS, self.update_metrics_label)
+        
         # Display frame
         display_frame = tk.Frame(self.root, bg='#f0f0f0')
         display_frame.pack(expand=True, fill=tk.BOTH, padx=20, pady=10)
@@ -115,34 +270,103 @@ class AnimalDetectionApp:
         
         self.detected_canvas = tk.Canvas(self.detected_frame, bg='white')
         self.detected_canvas.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
+        
+        # Persistent canvas images, updated in place
+        self.original_display = CanvasDisplay(self.original_canvas)
+        self.detected_display = CanvasDisplay(self.detected_canvas, metrics=self.metrics)
     
     def load_model(self):
-        """Load the YOLO model"""
+        """Ask for a YOLO model and load it in the background"""
+        # You can change this path to your trained model
+        model_path = filedialog.askopenfilename(
+            title="Select YOLO Model",
+            filetypes=MODEL_FILETYPES
+        )
+        
+        if model_path:
+            self.start_model_load(model_path, announce=True)
+    
+    def start_model_load(self, model_path, announce=False):
+        """Import the heavy libraries, load and warm up the model on a background thread"""
+        if self.model_loading:
+            return
+        self.model_loading = True
+        self.load_model_btn.config(state='disabled')
+        self.status_label.config(text=f"Loading model: {os.path.basename(model_path)}...")
+        self.progress.start()
+        
+        thread = threading.Thread(target=self._load_model_worker, args=(model_path, announce),
+                                  name="model-loader", daemon=True)
+        thread.start()
+    
+    def _load_model_worker(self, model_path, announce):
+        """Background model loading (loader thread)"""
+        def progress(text):
+            self.root.after(0, lambda: self.status_label.config(text=text))
+        
         try:
-            self.status_label.config(text="Loading model...")
-            self.progress.start()
+            progress("Importing detection libraries (PyTorch, Ultralytics)...")
+            import ultralytics  # noqa: F401 - the slow part of the first load
             
-            # You can change this path to your trained model
-            model_path = filedialog.askopenfilename(
-                title="Select YOLO Model",
-                filetypes=[("Model files", "*.pt"), ("All files", "*.*")]
-            )
+            progress(f"Loading model: {os.path.basename(model_path)}...")
+            model = load_detector(model_path)
+            cached_detector = CachedDetector(model, model_path, self.detection_cache, self.class_table,
+                                             imgsz=IMAGE_SIZE, conf=CONFIDENCE, iou=NMS_IOU)
             
-            if model_path:
-                self.model = YOLO(model_path)
-                self.status_label.config(text=f"Model loaded successfully: {os.path.basename(model_path)}")
-                messagebox.showinfo("Success", "Model loaded successfully!")
-            else:
-                # If no model selected, try to use YOLOv8 pre-trained model
-                self.model = YOLO('yolov8n.pt')  # You can change this to your custom model
-                self.status_label.config(text="Using default YOLOv8 model")
-                
-            self.progress.stop()
+            # The first forward pass pays for graph and kernel initialization; do it now
+            progress("Warming up model...")
+            warmup = np.zeros((IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+            model.predict(warmup, imgsz=IMAGE_SIZE, verbose=False)
             
+            self.root.after(0, lambda: self._on_model_loaded(model, cached_detector, model_path, announce))
         except Exception as e:
-            self.progress.stop()
-            self.status_label.config(text="Error loading model")
-            messagebox.showerror("Error", f"Failed to load model: {str(e)}")
+            self.root.after(0, lambda e=e: self._on_model_failed(model_path, e))
+    
+    def _on_model_loaded(self, model, cached_detector, model_path, announce):
+        """Install the loaded model (Tk thread)"""
+        self.model = model
+        self.cached_detector = cached_detector
+        self.model_loading = False
+        self.progress.stop()
+        self.load_model_btn.config(state='normal')
+        
+        if self.ready_s is None:
+            self.ready_s = time.perf_counter() - APP_START
+        self.record_startup_metrics()
+        ready_s = self.ready_s
+        self.status_label.config(text=f"Ready - model loaded: {os.path.basename(model_path)} "
+                                      f"({ready_s:.1f}s since start)")
+        
+        settings = load_settings()
+        settings["last_model_path"] = model_path
+        save_settings(settings)
+        
+        if announce:
+            messagebox.showinfo("Success", "Model loaded successfully!")
+    
+    def _on_model_failed(self, model_path, error):
+        """Report a failed background load (Tk thread)"""
+        self.model_loading = False
+        self.progress.stop()
+        self.load_model_btn.config(state='normal')
+        self.status_label.config(text="Error loading model")
+        messagebox.showerror("Error", f"Failed to load model {os.path.basename(model_path)}: {str(error)}")
+    
+    def record_startup_metrics(self):
+        """Startup gauges survive the per-video metrics reset"""
+        if self.ready_s is not None:
+            self.metrics.set_gauge("time_to_ready_s", round(self.ready_s, 3))
+        if self.first_detection_s is not None:
+            self.metrics.set_gauge("time_to_first_detection_s", round(self.first_detection_s, 3))
+    
+    def record_first_detection(self):
+        """Report time-to-first-detection once per session"""
+        if self.first_detection_s is not None:
+            return
+        self.first_detection_s = time.perf_counter() - APP_START
+        self.record_startup_metrics()
+        # The metrics line is idle outside video playback; a playing video replaces it with live stats
+        self.metrics_label.config(text=f"Time to first detection: {self.first_detection_s:.2f}s")
     
     def load_image(self):
         """Load an image for detection"""
@@ -154,12 +378,16 @@ class AnimalDetectionApp:
         if file_path:
             try:
                 self.current_image = cv2.imread(file_path)
+                self.current_image_hash = hash_file(file_path)
                 self.display_original_image(self.current_image)
                 self.status_label.config(text=f"Image loaded: {os.path.basename(file_path)}")
                 
-                # Reset video-related variables
+                # Reset video-related variables; finish the video's log and export
+                self.stop_video()
+                self.end_video_session()
+                self.resume_frame = None
+                self.tracked_detector = None
                 self.current_video_path = None
-                self.is_playing = False
                 self.play_btn.config(state='disabled')
                 self.pause_btn.config(state='disabled')
                 
@@ -175,6 +403,10 @@ class AnimalDetectionApp:
         
         if file_path:
             try:
+                self.stop_video()
+                self.end_video_session()
+                self.resume_frame = None
+                self.tracked_detector = None
                 self.current_video_path = file_path
                 self.video_cap = cv2.VideoCapture(file_path)
                 
@@ -182,6 +414,7 @@ class AnimalDetectionApp:
                 ret, frame = self.video_cap.read()
                 if ret:
                     self.current_image = frame
+                    self.current_image_hash = None
                     self.display_original_image(frame)
                     self.status_label.config(text=f"Video loaded: {os.path.basename(file_path)}")
                     
@@ -196,70 +429,19 @@ class AnimalDetectionApp:
     
     def display_original_image(self, image):
         """Display original image on canvas"""
-        try:
-            # Resize image to fit canvas
-            height, width = image.shape[:2]
-            canvas_width = self.original_canvas.winfo_width()
-            canvas_height = self.original_canvas.winfo_height()
-            
-            if canvas_width > 1 and canvas_height > 1:
-                # Calculate scaling factor
-                scale = min(canvas_width/width, canvas_height/height, 1.0)
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                
-                # Resize image
-                resized_image = cv2.resize(image, (new_width, new_height))
-                
-                # Convert BGR to RGB
-                rgb_image = cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(rgb_image)
-                photo = ImageTk.PhotoImage(pil_image)
-                
-                # Clear canvas and display image
-                self.original_canvas.delete("all")
-                self.original_canvas.create_image(canvas_width//2, canvas_height//2, 
-                                                image=photo, anchor=tk.CENTER)
-                self.original_canvas.image = photo  # Keep a reference
-            
-        except Exception as e:
-            print(f"Error displaying original image: {str(e)}")
+        self.original_display.show(image)
     
     def display_detected_image(self, image):
         """Display detected image on canvas"""
-        try:
-            # Resize image to fit canvas
-            height, width = image.shape[:2]
-            canvas_width = self.detected_canvas.winfo_width()
-            canvas_height = self.detected_canvas.winfo_height()
-            
-            if canvas_width > 1 and canvas_height > 1:
-                # Calculate scaling factor
-                scale = min(canvas_width/width, canvas_height/height, 1.0)
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                
-                # Resize image
-                resized_image = cv2.resize(image, (new_width, new_height))
-                
-                # Convert BGR to RGB
-                rgb_image = cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
-                pil_image = Image.fromarray(rgb_image)
-                photo = ImageTk.PhotoImage(pil_image)
-                
-                # Clear canvas and display image
-                self.detected_canvas.delete("all")
-                self.detected_canvas.create_image(canvas_width//2, canvas_height//2, 
-                                                image=photo, anchor=tk.CENTER)
-                self.detected_canvas.image = photo  # Keep a reference
-            
-        except Exception as e:
-            print(f"Error displaying detected image: {str(e)}")
+        self.detected_display.show(image)
     
     def detect_animals(self):
         """Perform animal detection on current image"""
         if self.model is None:
-            messagebox.showerror("Error", "Please load a model first!")
+            if self.model_loading:
+                messagebox.showinfo("Please wait", "The model is still loading.")
+            else:
+                messagebox.showerror("Error", "Please load a model first!")
             return
         
         if self.current_image is None:
@@ -270,56 +452,20 @@ class AnimalDetectionApp:
             self.status_label.config(text="Detecting animals...")
             self.progress.start()
             
-            # Perform detection
-            results = self.model(self.current_image)
+            # Perform detection (cached results are reused)
+            tiler = None
+            if self.tiled_var.get():
+                tiler = TiledDetector(self.model, table=self.class_table, conf=CONFIDENCE, iou=NMS_IOU)
+            detections = self.cached_detector.detect(self.current_image, self.current_image_hash, tiler)
             
             # Process results
-            detected_image = self.current_image.copy()
-            carnivorous_count = 0
-            detected_animals = []
-            
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        # Get box coordinates
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                        confidence = box.conf[0].cpu().numpy()
-                        class_id = int(box.cls[0].cpu().numpy())
-                        
-                        # Get class name
-                        class_name = self.class_names.get(class_id, f"Class_{class_id}")
-                        detected_animals.append(class_name)
-                        
-                        # Check if carnivorous
-                        is_carnivorous = class_name in self.carnivorous_animals
-                        if is_carnivorous:
-                            carnivorous_count += 1
-                        
-                        # Choose color (red for carnivorous, green for others)
-                        color = (0, 0, 255) if is_carnivorous else (0, 255, 0)
-                        
-                        # Draw bounding box
-                        cv2.rectangle(detected_image, (x1, y1), (x2, y2), color, 2)
-                        
-                        # Draw label
-                        label = f"{class_name}: {confidence:.2f}"
-                        if is_carnivorous:
-                            label += " (CARNIVOROUS)"
-                        
-                        # Calculate text size and draw background
-                        (text_width, text_height), baseline = cv2.getTextSize(
-                            label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-                        
-                        cv2.rectangle(detected_image, (x1, y1 - text_height - baseline - 5),
-                                    (x1 + text_width, y1), color, -1)
-                        
-                        # Draw text
-                        cv2.putText(detected_image, label, (x1, y1 - baseline - 2),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            detected_image = self.image_annotator.annotate(self.current_image, detections)
+            carnivorous_count = detections.carnivorous_count
+            detected_animals = detections.class_names(self.class_table)
             
             # Display detected image
             self.display_detected_image(detected_image)
+            self.record_first_detection()
             
             # Show carnivorous count popup
             if carnivorous_count > 0:
@@ -331,7 +477,10 @@ class AnimalDetectionApp:
                                   f"No carnivorous animals detected.\n\n" +
                                   f"Detected animals: {', '.join(set(detected_animals)) if detected_animals else 'None'}")
             
-            self.status_label.config(text="Detection completed!")
+            stats = self.detection_cache.stats()
+            self.status_label.config(text=f"Detection completed! (cache hits: "
+                                          f"{stats['memory_hits'] + stats['disk_hits']}, "
+                                          f"misses: {stats['misses']})")
             self.progress.stop()
             
         except Exception as e:
@@ -346,83 +495,257 @@ class AnimalDetectionApp:
             return
         
         if self.model is None:
-            messagebox.showerror("Error", "Please load a model first!")
+            if self.model_loading:
+                messagebox.showinfo("Please wait", "The model is still loading.")
+            else:
+                messagebox.showerror("Error", "Please load a model first!")
+            return
+        
+        start_frame, end_frame = self.frame_range()
+        resuming = self.resume_frame is not None
+        if resuming:
+            start_frame = self.resume_frame
+        if end_frame is not None and start_frame >= end_frame:
+            messagebox.showinfo("Video", "Nothing left to play in the selected frame range.")
             return
         
+        # Make sure a previous run has released the capture; seeking it while a
+        # slow read() is still in progress would race on the same VideoCapture
+        if self.video_pipeline is not None:
+            self.video_pipeline.stop()
+            if not self.video_pipeline.join_decoder(timeout=1.0):
+                self.status_label.config(text="Still stopping the previous playback - press Play again")
+                return
+        
         self.is_playing = True
         self.play_btn.config(state='disabled')
         self.pause_btn.config(state='normal')
+        self.rewind_btn.config(state='normal')
+        with self.session_lock:
+            self.video_run += 1
+            run = self.video_run
+        
+        try:
+            detect_interval = max(1, self.detect_interval_var.get())
+        except tk.TclError:
+            detect_interval = 1
+        # A resumed run keeps its tracks, so animals aren't counted twice
+        tracker = self.tracked_detector.tracker if resuming and self.tracked_detector is not None else None
+        self.tracked_detector = TrackedDetector(self.detect_frame, interval=detect_interval, tracker=tracker)
+        self.frame_processor = self.tracked_detector
+        if self.motion_gate_var.get():
+            self.frame_processor = MotionGatedDetector(self.tracked_detector,
+                                                       self.make_motion_gate(),
+                                                       metrics=self.metrics)
+        
+        self.metrics.reset()
+        self.record_startup_metrics()
+        
+        try:
+            budget_ms = self.latency_budget_var.get()
+        except tk.TclError:
+            budget_ms = 0
+        self.resolution_controller = ResolutionController(budget_ms, initial=IMAGE_SIZE) if budget_ms > 0 else None
+        self.metrics.set_gauge("imgsz", IMAGE_SIZE)
         
-        # Start video processing in a separate thread
-        self.detection_thread = threading.Thread(target=self.process_video)
-        self.detection_thread.daemon = True
-        self.detection_thread.start()
+        if not resuming:
+            self.end_video_session()
+            self.start_video_session()
+        
+        decoder = None
+        shape = frame_shape(self.video_cap) if self.process_decode_var.get() else None
+        if shape is not None:
+            decoder = SharedMemoryDecoder(self.current_video_path, shape, start_frame, end_frame)
+        
+        # Start the decode / inference / render pipeline
+        self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        self.video_pipeline = VideoPipeline(self.video_cap,
+                                            infer=self.annotate_video_frame,
+                                            render=lambda index, frame, output: self.render_video_frame(
+                                                index, frame, output, run, shared=decoder is not None),
+                                            on_finished=self.on_video_finished,
+                                            policy=self.drop_policy_var.get(),
+                                            metrics=self.metrics,
+                                            end_frame=end_frame,
+                                            decoder=decoder)
+        self.video_pipeline.start()
+        self.status_label.config(text=f"{'Resuming' if resuming else 'Playing'} from frame {start_frame}")
+    
+    def frame_range(self):
+        """(start, end) from the range controls; end is None for 'to the end'"""
+        try:
+            start = max(0, self.start_frame_var.get())
+        except tk.TclError:
+            start = 0
+        try:
+            end = self.end_frame_var.get()
+        except tk.TclError:
+            end = 0
+        return start, (end if end > 0 else None)
+    
+    def start_video_session(self):
+        """Open the detection log / video export for a playback from the range start"""
+        detection_log = None
+        if self.log_detections_var.get():
+            log_dir = os.path.splitext(self.current_video_path)[0] + "_detections"
+            try:
+                detection_log = DetectionLogWriter(log_dir, fps=source_fps(self.video_cap),
+                                                   source=self.current_video_path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Cannot write detection log: {str(e)}")
+        
+        exporter = None
+        if self.export_mode_var.get() != EXPORT_OFF:
+            # Encoded on its own thread; frames are dropped rather than stalling playback
+            exporter = VideoExporter(self.current_video_path, self.export_mode_var.get(),
+                                     source_fps(self.video_cap), metrics=self.metrics)
+        
+        with self.session_lock:
+            self.video_session = (detection_log, exporter)
+    
+    def end_video_session(self):
+        """Close the current detection log / video export; returns a summary line"""
+        with self.session_lock:
+            session, self.video_session = self.video_session, None
+        if session is None:
+            return ""
+        
+        detection_log, exporter = session
+        summary = []
+        try:
+            if detection_log is not None:
+                detection_log.close()
+                summary.append(f"logged {detection_log.frames} frames, {detection_log.detections} detections "
+                               f"to {os.path.basename(detection_log.log_dir)}")
+        finally:
+            # A failing log must not leave the mp4 without its trailer
+            if exporter is not None:
+                exporter.close()
+        if exporter is not None:
+            summary.append(f"saved {exporter.summary()}")
+        return ", ".join(summary)
     
     def pause_video(self):
-        """Pause video playback"""
-        self.is_playing = False
+        """Pause video playback, keeping the position for the next Play"""
+        pipeline = self.video_pipeline
+        self.stop_video()
+        if pipeline is not None and self.is_video_session_open():
+            last_index = pipeline.last_index
+            if last_index is not None:
+                self.resume_frame = last_index + 1
+            elif self.resume_frame is None:
+                self.resume_frame = self.frame_range()[0]
+            self.status_label.config(text=f"Paused at frame {self.resume_frame} "
+                                          f"(Play resumes, Rewind starts over)")
         self.play_btn.config(state='normal')
         self.pause_btn.config(state='disabled')
     
-    def process_video(self):
-        """Process video frames with detection"""
+    def rewind_video(self):
+        """Stop and go back to the start of the frame range"""
+        self.stop_video()
+        summary = self.end_video_session()
+        self.resume_frame = None
+        self.tracked_detector = None
+        self.play_btn.config(state='normal')
+        self.pause_btn.config(state='disabled')
+        self.status_label.config(text="Rewound to the start of the range" + (f" ({summary})" if summary else ""))
+    
+    def on_close(self):
+        """Stop playback and close the session's detection log before the window goes away"""
+        pipeline = self.video_pipeline
+        self.stop_video()
+        if pipeline is not None:
+            # Let a frame being rendered reach the writer and the shared decoder shut down
+            pipeline.join(timeout=2.0)
         try:
-            self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Reset to beginning
-            
-            while self.is_playing:
-                ret, frame = self.video_cap.read()
-                if not ret:
-                    break
-                
-                # Perform detection on frame
-                results = self.model(frame)
-                detected_frame = frame.copy()
-                carnivorous_count = 0
-                
-                for result in results:
-                    boxes = result.boxes
-                    if boxes is not None:
-                        for box in boxes:
-                            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                            confidence = box.conf[0].cpu().numpy()
-                            class_id = int(box.cls[0].cpu().numpy())
-                            
-                            class_name = self.class_names.get(class_id, f"Class_{class_id}")
-                            is_carnivorous = class_name in self.carnivorous_animals
-                            
-                            if is_carnivorous:
-                                carnivorous_count += 1
-                            
-                            color = (0, 0, 255) if is_carnivorous else (0, 255, 0)
-                            
-                            cv2.rectangle(detected_frame, (x1, y1), (x2, y2), color, 2)
-                            
-                            label = f"{class_name}: {confidence:.2f}"
-                            if is_carnivorous:
-                                label += " (CARN)"
-                            
-                            cv2.putText(detected_frame, label, (x1, y1 - 10),
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                
-                # Update display
-                self.root.after(0, lambda f=frame: self.display_original_image(f))
-                self.root.after(0, lambda f=detected_frame: self.display_detected_image(f))
-                
-                # Add carnivorous count to frame
-                if carnivorous_count > 0:
-                    cv2.putText(detected_frame, f"Carnivorous: {carnivorous_count}", 
-                              (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                
-                # Control frame rate
-                time.sleep(0.03)  # ~30 FPS
-            
-            # Reset video controls
-            self.root.after(0, lambda: self.play_btn.config(state='normal'))
-            self.root.after(0, lambda: self.pause_btn.config(state='disabled'))
-            
-        except Exception as e:
-            print(f"Error processing video: {str(e)}")
-            self.is_playing = False
+            # Flushes buffered log rows (and meta.json) and finishes the annotated video and open event clip
+            self.end_video_session()
+        finally:
+            self.root.destroy()
+    
+    def is_video_session_open(self):
+        with self.session_lock:
+            return self.video_session is not None
+    
+    def stop_video(self):
+        """Stop the running video pipeline, if any"""
+        self.is_playing = False
+        if self.video_pipeline is not None:
+            self.video_pipeline.stop()
+    
+    def detect_frame(self, frame):
+        """Run the model on one frame and return its detections"""
+        # Video frames almost never repeat, so hashing and caching them would only cost time and disk
+        controller = self.resolution_controller
+        if controller is None:
+            with self.metrics.time("infer"):
+                return self.cached_detector.predict(frame)
+        
+        # The controller sees only the model call: the cost that actually changes with imgsz
+        start = time.perf_counter()
+        results = self.cached_detector.run_model(frame, imgsz=controller.imgsz)
+        elapsed = time.perf_counter() - start
+        self.metrics.observe("infer", elapsed)
+        self.metrics.set_gauge("imgsz", controller.observe(elapsed))
+        with self.metrics.time("postprocess"):
+            return self.cached_detector.extract(results)
+    
+    def make_motion_gate(self):
+        """Build a motion gate from the sensitivity slider (1.0 = most sensitive)"""
+        sensitivity = min(1.0, max(0.0, self.motion_sensitivity_var.get()))
+        # Changed-pixel fraction needed to count as motion: 5% at 0.0 down to 0.05% at 1.0
+        min_changed = 0.05 * (0.01 ** sensitivity)
+        return MotionGate(min_changed=min_changed)
+    
+    def annotate_video_frame(self, frame):
+        """Detect or track animals in a video frame (inference thread)"""
+        detections = self.frame_processor.process(frame)
+        # Count distinct tracked carnivores rather than per-frame boxes
+        carnivores_seen = self.tracked_detector.tracker.distinct_carnivores
+        with self.metrics.time("annotate"):
+            annotated = self.video_annotator.annotate(frame, detections, carnivores_seen=carnivores_seen)
+        return annotated, detections
+    
+    def render_video_frame(self, index, frame, output, run, shared=False):
+        """Hand a processed frame to the Tk thread (render thread)"""
+        detected_frame, detections = output
+        with self.session_lock:
+            if run == self.video_run and self.video_session is not None:
+                detection_log, exporter = self.video_session
+                if detection_log is not None:
+                    detection_log.append(index, index / detection_log.fps, detections)
+                if exporter is not None:
+                    exporter.write(index, detected_frame, detections)
+        # Only the latest pending frame per canvas gets drawn; a shared slot is
+        # reused as soon as this returns, so the display gets its own copy
+        self.original_display.submit(frame.copy() if shared else frame)
+        self.detected_display.submit(detected_frame)
+        if self.first_detection_s is None:
+            self.root.after(0, self.record_first_detection)
+    
+    def update_metrics_label(self):
+        """Refresh the performance line while video is playing"""
+        if self.is_playing:
+            self.metrics_label.config(text=self.metrics.status_line())
+        self.root.after(METRICS_REFRESH_MS, self.update_metrics_label)
+    
+    def on_video_finished(self, pipeline):
+        """Pipeline stopped (render thread): hand over to the Tk thread, which owns the playback state"""
+        self.root.after(0, lambda: self.finish_video(pipeline))
+    
+    def finish_video(self, pipeline):
+        """Reset video controls once the pipeline stops (Tk thread)"""
+        if pipeline is not self.video_pipeline:
+            return
+        self.is_playing = False
+        if not pipeline.stopped:
+            # Reached the end of the video or range: the next Play starts over
+            summary = self.end_video_session()
+            self.resume_frame = None
+            self.tracked_detector = None
+            self.status_label.config(text="Video finished" + (f" - {summary}" if summary else ""))
+        self.play_btn.config(state='normal')
+        self.pause_btn.config(state='disabled')
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,294 @@
+"""
+Content-addressed detection cache
+Results are keyed on image content hash + model weights hash + inference
+parameters, with an in-memory LRU tier in front of a size-bounded disk tier
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from annotator import DEFAULT_TABLE, Detections, extract_detections
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "animal_detection", "detections")
+DEFAULT_MEMORY_ENTRIES = 1024
+DEFAULT_DISK_BYTES = 256 * 1024 * 1024
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def _digest():
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_file(path):
+    """Content hash of a file"""
+    digest = _digest()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_array(image):
+    """Content hash of a decoded image (pixels, shape and dtype)"""
+    digest = _digest()
+    digest.update(f"{image.shape}{image.dtype}".encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+_model_hashes = {}
+
+
+def hash_model(model_path):
+    """Hash of the weights file (or every file of an exported model directory), memoized by mtime/size"""
+    if not model_path or not os.path.exists(model_path):
+        # e.g. a hub name Ultralytics resolves itself
+        return hashlib.blake2b(str(model_path).encode(), digest_size=16).hexdigest()
+
+    if os.path.isdir(model_path):
+        files = sorted(os.path.join(dirpath, name)
+                       for dirpath, _, names in os.walk(model_path) for name in names)
+    else:
+        files = [model_path]
+
+    stamp = tuple((f, os.path.getmtime(f), os.path.getsize(f)) for f in files)
+    cached = _model_hashes.get(model_path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    digest = _digest()
+    for f in files:
+        digest.update(os.path.relpath(f, model_path).encode() if f != model_path else b"")
+        digest.update(hash_file(f).encode())
+    value = digest.hexdigest()
+    _model_hashes[model_path] = (stamp, value)
+    return value
+
+
+def _allocated_size(stat):
+    """Disk space a file takes: small entries still occupy whole filesystem blocks"""
+    blocks = getattr(stat, "st_blocks", None)
+    return max(stat.st_size, blocks * 512) if blocks is not None else stat.st_size
+
+
+def make_key(content_hash, model_hash, params):
+    """Combine image hash, model hash and inference parameters into a cache key"""
+    digest = _digest()
+    digest.update(content_hash.encode())
+    digest.update(model_hash.encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def detections_to_array(detections):
+    """Pack detections as an (N, 6) float32 array: x1, y1, x2, y2, conf, cls"""
+    return np.concatenate([detections.xyxy.astype(np.float32),
+                           detections.conf.astype(np.float32)[:, None],
+                           detections.cls.astype(np.float32)[:, None]], axis=1)
+
+
+def array_to_detections(data, table=DEFAULT_TABLE):
+    """Inverse of detections_to_array"""
+    if len(data) == 0:
+        return Detections.empty()
+    cls = data[:, 5].astype(np.int64)
+    return Detections(data[:, :4].copy(), data[:, 4].copy(), cls, table.is_carnivorous(cls))
+
+
+class DetectionCache:
+    """Two-tier (memory LRU + disk) cache of packed detection arrays"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, memory_entries=DEFAULT_MEMORY_ENTRIES,
+                 disk_bytes=DEFAULT_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_size = None
+
+    def stats(self):
+        """Hit/miss counters for reporting"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npy")
+
+    def get(self, key):
+        """Return the cached array for `key` or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, data)
+            return data
+
+    def put(self, key, data):
+        """Store an array in both tiers"""
+        data = np.asarray(data, dtype=np.float32)
+        with self._lock:
+            self._remember(key, data)
+        if self.cache_dir and self.disk_bytes > 0:
+            self._write_disk(key, data)
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            data = np.load(path, allow_pickle=False)
+            # Refresh mtime so eviction is least-recently-used
+            os.utime(path)
+            return data
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, data):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, data, allow_pickle=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not write detection cache entry: {str(e)}")
+            return
+
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = self._scan_disk_size()
+            else:
+                self._disk_size += _allocated_size(os.stat(path))
+            over_budget = self._disk_size > self.disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _scan_disk_size(self):
+        total = 0
+        for dirpath, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".npy"):
+                    try:
+                        total += _allocated_size(os.stat(os.path.join(dirpath, name)))
+                    except OSError:
+                        continue
+        return total
+
+    def _evict_disk(self):
+        """Delete least recently used files until the disk tier is under 90% of its budget"""
+        entries = []
+        for dirpath, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".npy"):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, _allocated_size(stat), path))
+
+        total = sum(size for _, size, _ in entries)
+        target = int(self.disk_bytes * 0.9)
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+        with self._lock:
+            self._disk_size = total
+
+
+class CachedDetector:
+    """Looks detections up in a DetectionCache before calling the model"""
+
+    def __init__(self, model, model_path, cache, table=DEFAULT_TABLE, **predict_args):
+        self.model = model
+        self.cache = cache
+        self.table = table
+        self.predict_args = predict_args
+        self.model_hash = hash_model(model_path)
+
+    def key_for(self, content_hash, tiler=None, imgsz=None):
+        params = self.predict_args
+        if imgsz is not None:
+            params = {**params, "imgsz": imgsz}
+        if tiler is not None:
+            params = {**params, "tiled": tiler.params()}
+        return make_key(content_hash, self.model_hash, params)
+
+    def lookup(self, content_hash, tiler=None, imgsz=None):
+        """Return cached Detections or None"""
+        data = self.cache.get(self.key_for(content_hash, tiler, imgsz))
+        return None if data is None else array_to_detections(data, self.table)
+
+    def store(self, content_hash, detections, tiler=None, imgsz=None):
+        self.cache.put(self.key_for(content_hash, tiler, imgsz), detections_to_array(detections))
+
+    def run_model(self, image, imgsz=None):
+        """The model's raw results for one image (no cache, no post-processing)"""
+        predict_args = self.predict_args if imgsz is None else {**self.predict_args, "imgsz": imgsz}
+        return self.model.predict(image, verbose=False, **predict_args)
+
+    def extract(self, results):
+        return extract_detections(results[0], self.table)
+
+    def predict(self, image, tiler=None, imgsz=None):
+        """Run the model on one image without the cache, e.g. for video frames that never repeat"""
+        if tiler is not None:
+            return tiler.detect(image)
+        return self.extract(self.run_model(image, imgsz))
+
+    def detect(self, image, content_hash=None, tiler=None, imgsz=None):
+        """
+        Detect on one image; `content_hash` defaults to the hash of its pixels
+
+        With a TiledDetector the image is run tile by tile and cached under its own key.
+        `imgsz` overrides the input size given at construction for this call.
+        """
+        if content_hash is None:
+            content_hash = hash_array(image)
+        detections = self.lookup(content_hash, tiler, imgsz)
+        if detections is None:
+            detections = self.predict(image, tiler, imgsz)
+            self.store(content_hash, detections, tiler, imgsz)
+        return detections
@@ -0,0 +1,336 @@
+"""
+Compact columnar detection log
+Detections of long videos are streamed to disk as fixed-width per-column files
+(frame index, timestamp, class id, confidence, carnivorous flag, box) in
+chunked appends, so memory stays bounded. A per-frame table records every
+processed frame, including ones without detections, for interval reports.
+The reader memory-maps the columns and answers time-range and class queries
+without loading the whole log
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+LOG_VERSION = 1
+META_FILE = "meta.json"
+DEFAULT_CHUNK_ROWS = 4096
+DEFAULT_INTERVAL_S = 60.0
+
+# name -> (dtype, values per row)
+DETECTION_COLUMNS = {
+    "frame": ("<i8", 1),
+    "time": ("<f8", 1),
+    "cls": ("<i2", 1),
+    "conf": ("<f4", 1),
+    "carnivorous": ("u1", 1),
+    "box": ("<f4", 4),
+}
+FRAME_COLUMNS = {
+    "frame_index": ("<i8", 1),
+    "frame_time": ("<f8", 1),
+    "frame_detections": ("<u2", 1),
+    "frame_carnivores": ("<u2", 1),
+}
+
+
+def _column_path(log_dir, name):
+    return os.path.join(log_dir, f"{name}.bin")
+
+
+class _ColumnChunks:
+    """Fixed-size in-memory chunk per column, appended to its file when full"""
+
+    def __init__(self, log_dir, columns, chunk_rows, resume_rows=None):
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.rows_written = 0
+        self._fill = 0
+        self._buffers = {name: np.zeros((chunk_rows, width) if width > 1 else chunk_rows, dtype=dtype)
+                         for name, (dtype, width) in columns.items()}
+        if resume_rows is None:
+            self._files = {name: open(_column_path(log_dir, name), "wb") for name in columns}
+            return
+
+        # Continue an existing log: drop anything written after the resume point
+        self._files = {}
+        for name, (dtype, width) in columns.items():
+            f = open(_column_path(log_dir, name), "r+b")
+            f.truncate(resume_rows * np.dtype(dtype).itemsize * width)
+            f.seek(0, os.SEEK_END)
+            self._files[name] = f
+        self.rows_written = resume_rows
+
+    @property
+    def rows(self):
+        return self.rows_written + self._fill
+
+    def append(self, values):
+        """Append rows given as {column: array}; all arrays have the same length"""
+        count = len(next(iter(values.values())))
+        offset = 0
+        while offset < count:
+            take = min(count - offset, self.chunk_rows - self._fill)
+            for name, column in values.items():
+                self._buffers[name][self._fill:self._fill + take] = column[offset:offset + take]
+            self._fill += take
+            offset += take
+            if self._fill == self.chunk_rows:
+                self.flush()
+
+    def flush(self):
+        if self._fill:
+            for name, buffer in self._buffers.items():
+                self._files[name].write(buffer[:self._fill].tobytes())
+            self.rows_written += self._fill
+            self._fill = 0
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+
+class DetectionLogWriter:
+    """
+    Streams detections of one video to a log directory
+
+    Rows are buffered in chunks of `chunk_rows` and appended to the column
+    files; meta.json is rewritten after each flush with the committed row
+    counts, so a log cut short by a crash is still readable up to the last flush.
+    `resume_rows=(detections, frames)` continues an existing log from those row
+    counts, e.g. as recorded in a checkpoint.
+    """
+
+    def __init__(self, log_dir, fps=None, source=None, chunk_rows=DEFAULT_CHUNK_ROWS, resume_rows=None):
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_dir = log_dir
+        self.fps = fps
+        self.source = source
+        detection_rows, frame_rows = resume_rows if resume_rows is not None else (None, None)
+        self._detections = _ColumnChunks(log_dir, DETECTION_COLUMNS, chunk_rows, detection_rows)
+        self._frames = _ColumnChunks(log_dir, FRAME_COLUMNS, chunk_rows, frame_rows)
+        self._closed = False
+        self._write_meta()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def frames(self):
+        return self._frames.rows
+
+    @property
+    def detections(self):
+        return self._detections.rows
+
+    def append(self, frame_index, timestamp, detections):
+        """Record one processed frame and its Detections"""
+        count = len(detections)
+        carnivores = detections.carnivorous_count
+        committed = (self._detections.rows_written, self._frames.rows_written)
+        if count:
+            self._detections.append({
+                "frame": np.full(count, frame_index, dtype=np.int64),
+                "time": np.full(count, timestamp, dtype=np.float64),
+                "cls": detections.cls,
+                "conf": detections.conf,
+                "carnivorous": detections.carnivorous,
+                "box": detections.xyxy,
+            })
+        self._frames.append({
+            "frame_index": (frame_index,),
+            "frame_time": (timestamp,),
+            "frame_detections": (min(count, 65535),),
+            "frame_carnivores": (min(carnivores, 65535),),
+        })
+        if committed != (self._detections.rows_written, self._frames.rows_written):
+            # A chunk just went to disk
+            self._write_meta()
+
+    def flush(self):
+        self._detections.flush()
+        self._frames.flush()
+        self._write_meta()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._detections.close()
+        self._frames.close()
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            "version": LOG_VERSION,
+            "source": self.source,
+            "fps": self.fps,
+            "detections": self._detections.rows_written,
+            "frames": self._frames.rows_written,
+            "columns": {name: list(spec) for name, spec in {**DETECTION_COLUMNS, **FRAME_COLUMNS}.items()},
+        }
+        tmp_path = os.path.join(self.log_dir, META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.log_dir, META_FILE))
+
+
+def _open_column(log_dir, name, spec, rows):
+    dtype, width = spec
+    if rows == 0:
+        return np.zeros((0, width) if width > 1 else 0, dtype=dtype)
+    shape = (rows, width) if width > 1 else (rows,)
+    return np.memmap(_column_path(log_dir, name), dtype=dtype, mode="r", shape=shape)
+
+
+class DetectionLog:
+    """Read-only, memory-mapped view of a detection log"""
+
+    def __init__(self, log_dir):
+        with open(os.path.join(log_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != LOG_VERSION:
+            raise ValueError(f"Unsupported detection log version: {meta.get('version')}")
+        self.log_dir = log_dir
+        self.source = meta.get("source")
+        self.fps = meta.get("fps")
+        self.columns = {name: _open_column(log_dir, name, spec, meta["detections"])
+                        for name, spec in DETECTION_COLUMNS.items()}
+        self.frame_columns = {name: _open_column(log_dir, name, spec, meta["frames"])
+                              for name, spec in FRAME_COLUMNS.items()}
+
+    def __len__(self):
+        return len(self.columns["frame"])
+
+    @property
+    def frames(self):
+        return len(self.frame_columns["frame_index"])
+
+    @property
+    def duration(self):
+        times = self.frame_columns["frame_time"]
+        return float(times[-1]) if len(times) else 0.0
+
+    def _time_slice(self, times, start, end):
+        # Frames are logged in order, so timestamps are sorted
+        lo = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+        hi = len(times) if end is None else int(np.searchsorted(times, end, side="left"))
+        return lo, hi
+
+    def query(self, start=None, end=None, classes=None, carnivorous_only=False, min_conf=0.0):
+        """
+        Detections with start <= time < end, optionally restricted to class ids
+        or carnivores; returns {column: array} holding only the matching rows
+        """
+        lo, hi = self._time_slice(self.columns["time"], start, end)
+        mask = np.ones(hi - lo, dtype=bool)
+        if classes is not None:
+            mask &= np.isin(self.columns["cls"][lo:hi], np.asarray(list(classes), dtype=np.int16))
+        if carnivorous_only:
+            mask &= self.columns["carnivorous"][lo:hi].astype(bool)
+        if min_conf > 0:
+            mask &= self.columns["conf"][lo:hi] >= min_conf
+        return {name: np.asarray(column[lo:hi][mask]) for name, column in self.columns.items()}
+
+    def interval_counts(self, interval_s=DEFAULT_INTERVAL_S, start=None, end=None, block_rows=1 << 20):
+        """
+        Per-interval carnivore report from the frame table: frames processed,
+        carnivorous detections and the most carnivores seen in one frame
+        """
+        times_column = self.frame_columns["frame_time"]
+        lo, hi = self._time_slice(times_column, start, end)
+        if hi <= lo:
+            return []
+        origin = float(times_column[lo]) if start is None else float(start)
+        last_bin = int((float(times_column[hi - 1]) - origin) // interval_s)
+
+        frames = np.zeros(last_bin + 1, dtype=np.int64)
+        detections = np.zeros(last_bin + 1, dtype=np.int64)
+        carnivores = np.zeros(last_bin + 1, dtype=np.int64)
+        peak = np.zeros(last_bin + 1, dtype=np.int64)
+
+        # Processed in blocks so hours of footage don't need the whole table in memory
+        for block_start in range(lo, hi, block_rows):
+            block_end = min(hi, block_start + block_rows)
+            bins = ((np.asarray(times_column[block_start:block_end]) - origin) // interval_s).astype(np.int64)
+            frame_carnivores = np.asarray(self.frame_columns["frame_carnivores"][block_start:block_end],
+                                          dtype=np.int64)
+            frame_detections = np.asarray(self.frame_columns["frame_detections"][block_start:block_end],
+                                          dtype=np.int64)
+            frames += np.bincount(bins, minlength=last_bin + 1)
+            detections += np.bincount(bins, weights=frame_detections, minlength=last_bin + 1).astype(np.int64)
+            carnivores += np.bincount(bins, weights=frame_carnivores, minlength=last_bin + 1).astype(np.int64)
+            np.maximum.at(peak, bins, frame_carnivores)
+
+        return [{
+            "start_s": round(origin + i * interval_s, 3),
+            "end_s": round(origin + (i + 1) * interval_s, 3),
+            "frames": int(frames[i]),
+            "detections": int(detections[i]),
+            "carnivorous_detections": int(carnivores[i]),
+            "max_carnivores_in_frame": int(peak[i]),
+        } for i in range(last_bin + 1)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Query a detection log")
+    parser.add_argument("log_dir", help="Detection log directory")
+    parser.add_argument("--start", type=float, help="Start time in seconds")
+    parser.add_argument("--end", type=float, help="End time in seconds")
+    parser.add_argument("--classes", nargs="+", help="Class names or ids to include")
+    parser.add_argument("--carnivorous", action="store_true", help="Only carnivorous detections")
+    parser.add_argument("--min-conf", type=float, default=0.0, help="Minimum confidence")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL_S,
+                        help="Interval length in seconds for the carnivore report")
+    parser.add_argument("--report", help="Write the per-interval carnivore report as JSON")
+    parser.add_argument("--limit", type=int, default=20, help="Detections to print")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from animal_classes import CLASS_NAMES, class_name_for
+
+    args = parse_args(argv)
+    log = DetectionLog(args.log_dir)
+    print(f"{log.source or args.log_dir}: {log.frames} frames, {len(log)} detections, "
+          f"{log.duration:.1f}s")
+
+    classes = None
+    if args.classes:
+        ids = {name.lower(): class_id for class_id, name in CLASS_NAMES.items()}
+        try:
+            classes = [int(value) if value.isdigit() else ids[value.lower()] for value in args.classes]
+        except KeyError as e:
+            print(f"Unknown class: {e.args[0]}")
+            return 1
+
+    rows = log.query(args.start, args.end, classes, args.carnivorous, args.min_conf)
+    print(f"{len(rows['frame'])} matching detection(s)")
+    for i in range(min(args.limit, len(rows["frame"]))):
+        x1, y1, x2, y2 = rows["box"][i]
+        print(f"  {rows['time'][i]:9.2f}s  frame {rows['frame'][i]:>7}  "
+              f"{class_name_for(int(rows['cls'][i])):<12} {rows['conf'][i]:.2f}  "
+              f"[{x1:.0f}, {y1:.0f}, {x2:.0f}, {y2:.0f}]")
+
+    report = log.interval_counts(args.interval, args.start, args.end)
+    print(f"\nCarnivores per {args.interval:g}s interval:")
+    for entry in report:
+        print(f"  {entry['start_s']:9.1f}s - {entry['end_s']:9.1f}s  {entry['frames']:>6} frames  "
+              f"{entry['carnivorous_detections']:>6} carnivorous  (max {entry['max_carnivores_in_frame']} in a frame)")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
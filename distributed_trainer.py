@@ -0,0 +1,113 @@
+"""
+Trainers for distributed CPU training
+DetectionTrainer variants that join a gloo process group instead of going
+through Ultralytics' CUDA-only DDP launcher. Imported by the worker processes
+of distributed_training.py after RANK/WORLD_SIZE are set
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import torch  # type: ignore
+import torch.distributed as dist  # type: ignore
+from torch import nn  # type: ignore
+from ultralytics.models.yolo.detect import DetectionTrainer  # type: ignore
+
+from cached_training import CachedDetectionTrainer
+
+DEFAULT_TIMEOUT_S = 3 * 60 * 60  # Rank 0 validates while the others wait at the next collective
+
+
+class _CPUDistributedDataParallel(nn.parallel.DistributedDataParallel):
+    """DDP that ignores device_ids, which only apply to GPU modules"""
+
+    def __init__(self, module, device_ids=None, **kwargs):
+        super().__init__(module, **kwargs)
+
+
+@contextmanager
+def _cpu_ddp():
+    """Make BaseTrainer._setup_train's GPU-style DDP wrap work for a CPU model"""
+    original = nn.parallel.DistributedDataParallel
+    nn.parallel.DistributedDataParallel = _CPUDistributedDataParallel
+    try:
+        yield
+    finally:
+        nn.parallel.DistributedDataParallel = original
+
+
+class _DistributedCPUMixin:
+    """
+    Runs BaseTrainer's training loop in an already started worker process
+
+    `batch` is per worker; the effective batch is batch * WORLD_SIZE, which
+    BaseTrainer uses for gradient accumulation and weight decay scaling.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.world_size = int(os.environ.get("WORLD_SIZE", 1))
+        self.batch_size = self.args.batch * self.world_size
+
+    def train(self):
+        # The base class would spawn torch.distributed.run for CUDA devices instead
+        self._do_train(self.world_size)
+
+    def _setup_ddp(self, world_size):
+        self.device = torch.device("cpu")
+        if not dist.is_initialized():
+            dist.init_process_group(backend="gloo", init_method="env://",
+                                    rank=int(os.environ["RANK"]), world_size=world_size,
+                                    timeout=timedelta(seconds=DEFAULT_TIMEOUT_S))
+
+    def _setup_train(self, world_size):
+        with _cpu_ddp():
+            super()._setup_train(world_size)
+
+
+class DistributedCPUTrainer(_DistributedCPUMixin, DetectionTrainer):
+    """DetectionTrainer for one worker of a gloo process group"""
+
+
+class DistributedCachedCPUTrainer(_DistributedCPUMixin, CachedDetectionTrainer):
+    """CachedDetectionTrainer for one worker of a gloo process group"""
+
+
+class ThroughputMeter:
+    """Training callbacks that time the batch loop of each epoch (validation excluded)"""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.images = 0
+        self.seconds = 0.0
+        self.epochs = []
+        self._epoch_start = None
+        self._epoch_batches = 0
+
+    def attach(self, model):
+        model.add_callback("on_train_epoch_start", self.on_epoch_start)
+        model.add_callback("on_train_batch_end", self.on_batch_end)
+        model.add_callback("on_train_epoch_end", self.on_epoch_end)
+
+    def on_epoch_start(self, trainer):
+        self._epoch_start = time.perf_counter()
+        self._epoch_batches = 0
+
+    def on_batch_end(self, trainer):
+        self._epoch_batches += 1
+
+    def on_epoch_end(self, trainer):
+        if self._epoch_start is None:
+            return
+        elapsed = time.perf_counter() - self._epoch_start
+        images = self._epoch_batches * self.batch_size
+        self.images += images
+        self.seconds += elapsed
+        self.epochs.append(round(images / elapsed, 2) if elapsed > 0 else 0.0)
+        self._epoch_start = None
+
+    @property
+    def images_per_s(self):
+        return round(self.images / self.seconds, 2) if self.seconds > 0 else 0.0
@@ -0,0 +1,235 @@
+"""
+Distributed CPU training
+Starts several training processes per machine, each pinned to its own slice of
+cores, and joins them (optionally across machines) in a gloo process group.
+Gradients are averaged across workers, so the effective batch size is the
+per-worker batch times the number of workers
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+
+from multi_stream import core_slice, worker_threads
+
+DEFAULT_MASTER_ADDR = "127.0.0.1"
+DEFAULT_MASTER_PORT = 29500
+
+
+def default_workers_per_node():
+    """Half the cores as processes, leaving each at least two threads, at most 4 workers"""
+    return max(1, min(4, (os.cpu_count() or 1) // 2))
+
+
+def train_worker(local_rank, options, train_args, results):
+    """
+    Worker process: one rank of the process group
+
+    Spawn re-imports the parent's __main__ in the child before this runs, so that
+    module must not import ultralytics at the top level: Ultralytics reads RANK
+    once, at import time, and would treat every worker as a single-process run.
+    """
+    rank = options["node_rank"] * options["nproc_per_node"] + local_rank
+    # Read by Ultralytics and torch.distributed at import / init time
+    os.environ.update({
+        "RANK": str(rank),
+        "LOCAL_RANK": str(local_rank),
+        "WORLD_SIZE": str(options["world_size"]),
+        "LOCAL_WORLD_SIZE": str(options["nproc_per_node"]),
+        "MASTER_ADDR": options["master_addr"],
+        "MASTER_PORT": str(options["master_port"]),
+    })
+    threads = options["threads"]
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    cores = options.get("cores")
+    if cores:
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+
+    import torch  # type: ignore
+    import torch.distributed as dist  # type: ignore
+    from ultralytics import YOLO  # type: ignore
+
+    from distributed_trainer import DistributedCachedCPUTrainer, DistributedCPUTrainer, ThroughputMeter
+
+    torch.set_num_threads(threads)
+
+    report = {"rank": rank, "local_rank": local_rank, "threads": threads,
+              "cores": sorted(cores) if cores else None}
+    meter = ThroughputMeter(train_args["batch"])
+    try:
+        from ultralytics.utils import RANK as ultralytics_rank  # type: ignore
+        if ultralytics_rank != rank:
+            raise RuntimeError(f"ultralytics was imported before RANK was set (it sees rank {ultralytics_rank}); "
+                               f"the launching script must import it lazily")
+        model = YOLO(options["model"])
+        meter.attach(model)
+        trainer = DistributedCachedCPUTrainer if options["cached"] else DistributedCPUTrainer
+        model.train(trainer=trainer, **train_args)
+        if rank == 0:
+            report["save_dir"] = str(model.trainer.save_dir)
+    except Exception as e:
+        report["error"] = str(e)
+    finally:
+        if dist.is_available() and dist.is_initialized():
+            dist.destroy_process_group()
+
+    report.update(images=meter.images, seconds=round(meter.seconds, 2),
+                  images_per_s=meter.images_per_s, epoch_images_per_s=meter.epochs)
+    results.put(report)
+
+
+def train_distributed(model, data, nproc_per_node=None, nnodes=1, node_rank=0,
+                      master_addr=DEFAULT_MASTER_ADDR, master_port=DEFAULT_MASTER_PORT,
+                      threads_per_worker=None, pin_cores=True, cached=False, **train_args):
+    """
+    Train this machine's share of a distributed run; returns a summary dict
+
+    `batch` in train_args is per worker. Every machine runs the same call with
+    its own `node_rank`; node 0 hosts the rendezvous at master_addr:master_port,
+    writes checkpoints and validates, and its summary carries `save_dir`.
+    """
+    nproc_per_node = nproc_per_node or default_workers_per_node()
+    world_size = nnodes * nproc_per_node
+    threads = worker_threads(nproc_per_node, threads_per_worker)
+    train_args = dict(train_args, data=data, device="cpu", amp=False)
+    train_args.setdefault("batch", 8)
+    options = {
+        "model": model,
+        "cached": cached,
+        "node_rank": node_rank,
+        "nproc_per_node": nproc_per_node,
+        "world_size": world_size,
+        "master_addr": master_addr,
+        "master_port": master_port,
+        "threads": threads,
+    }
+
+    # Spawn gives each worker a clean interpreter (no forked torch thread pools)
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = []
+    for local_rank in range(nproc_per_node):
+        worker_options = dict(options)
+        if pin_cores:
+            worker_options["cores"] = core_slice(local_rank, threads)
+        process = context.Process(target=train_worker, name=f"train-rank-{local_rank}",
+                                  args=(local_rank, worker_options, train_args, results))
+        process.start()
+        processes.append(process)
+
+    reports = {}
+    try:
+        while len(reports) < len(processes):
+            try:
+                report = results.get(timeout=5)
+            except queue.Empty:
+                # A worker that died without reporting would leave the others waiting forever
+                for local_rank, process in enumerate(processes):
+                    if local_rank not in reports and not process.is_alive():
+                        reports[local_rank] = {"rank": node_rank * nproc_per_node + local_rank,
+                                               "local_rank": local_rank,
+                                               "error": f"worker exited with code {process.exitcode}"}
+                continue
+            reports[report["local_rank"]] = report
+            if "error" in report:
+                # Peers block in collectives once one rank is gone; don't wait for them
+                for process in processes:
+                    if process.is_alive():
+                        process.terminate()
+    finally:
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+    workers = [reports[local_rank] for local_rank in sorted(reports)]
+    save_dirs = [report["save_dir"] for report in workers if report.get("save_dir")]
+    return {
+        "world_size": world_size,
+        "node_rank": node_rank,
+        "batch_per_worker": train_args["batch"],
+        "effective_batch": train_args["batch"] * world_size,
+        "threads_per_worker": threads,
+        "workers": workers,
+        "images_per_s": round(sum(report.get("images_per_s", 0.0) for report in workers), 2),
+        "save_dir": save_dirs[0] if save_dirs else None,
+        "errors": [f"rank {report['rank']}: {report['error']}" for report in workers if "error" in report],
+    }
+
+
+def print_summary(summary):
+    print("\n" + "=" * 60)
+    print(f"DISTRIBUTED TRAINING (node {summary['node_rank']}, world size {summary['world_size']})")
+    print("=" * 60)
+    print(f"Batch: {summary['batch_per_worker']} per worker, {summary['effective_batch']} effective")
+    for report in summary["workers"]:
+        cores = f"cores {report['cores']}" if report.get("cores") else "unpinned"
+        if "error" in report:
+            print(f"  rank {report['rank']:>3}: FAILED - {report['error']}")
+        else:
+            print(f"  rank {report['rank']:>3}: {report['images_per_s']:8.1f} images/s "
+                  f"({report['images']} images in {report['seconds']:.0f}s, {cores})")
+    print(f"This node: {summary['images_per_s']:.1f} images/s")
+    if summary["save_dir"]:
+        print(f"Results: {summary['save_dir']}")
+    print("=" * 60)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train on CPU with several processes, optionally on several machines")
+    parser.add_argument("--model", default="yolov8n.pt", help="Model to train")
+    parser.add_argument("--data", help="Dataset YAML (default: the dataset cache if prepared, else animal_data.yaml)")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--imgsz", type=int, default=416)
+    parser.add_argument("--batch", type=int, default=8, help="Batch size per worker")
+    parser.add_argument("--workers", type=int, default=0, help="Dataloader workers per training process")
+    parser.add_argument("--nproc-per-node", type=int, default=default_workers_per_node(),
+                        help="Training processes on this machine")
+    parser.add_argument("--threads-per-worker", type=int, help="Torch threads per process (default: cores / processes)")
+    parser.add_argument("--no-pin", action="store_true", help="Don't pin processes to CPU cores")
+    parser.add_argument("--nnodes", type=int, default=1, help="Number of machines")
+    parser.add_argument("--node-rank", type=int, default=0, help="This machine's index (0 hosts the rendezvous)")
+    parser.add_argument("--master-addr", default=DEFAULT_MASTER_ADDR, help="Address of node 0")
+    parser.add_argument("--master-port", type=int, default=DEFAULT_MASTER_PORT, help="Rendezvous port on node 0")
+    parser.add_argument("--project", default="animal_detection_cpu")
+    parser.add_argument("--name", default="yolov8_animals_cpu_ddp")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from train_autotune import DEFAULT_CACHE_CONFIG
+
+    args = parse_args(argv)
+    cached = args.data is None and os.path.exists(DEFAULT_CACHE_CONFIG)
+
+    with tempfile.TemporaryDirectory(prefix="animal_distributed_") as work_dir:
+        if cached:
+            data = DEFAULT_CACHE_CONFIG
+        else:
+            from dataset_config import DEFAULT_DATA_CONFIG, load_data_config, write_resolved_config
+            data = write_resolved_config(load_data_config(args.data or DEFAULT_DATA_CONFIG),
+                                         os.path.join(work_dir, "data.yaml"))
+
+        print(f"Starting {args.nproc_per_node} worker(s) on node {args.node_rank} of {args.nnodes} "
+              f"(rendezvous {args.master_addr}:{args.master_port})...")
+        summary = train_distributed(args.model, data, nproc_per_node=args.nproc_per_node, nnodes=args.nnodes,
+                                    node_rank=args.node_rank, master_addr=args.master_addr,
+                                    master_port=args.master_port, threads_per_worker=args.threads_per_worker,
+                                    pin_cores=not args.no_pin, cached=cached, epochs=args.epochs,
+                                    imgsz=args.imgsz, batch=args.batch, workers=args.workers,
+                                    project=args.project, name=args.name, save_period=5)
+    print_summary(summary)
+    for error in summary["errors"]:
+        print(f"Error: {error}")
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
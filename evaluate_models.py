@@ -0,0 +1,367 @@
+"""
+Offline accuracy-versus-speed evaluation
+Runs candidate weights or exported models (.pt, .onnx, OpenVINO) over the test
+split in parallel worker processes and reports per-class AP, carnivore recall,
+CPU latency and throughput for each, so the fastest model that still meets an
+accuracy floor can be picked
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from dataset_config import DEFAULT_DATA_CONFIG, image_to_label_path, list_split_images, load_data_config
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# Low threshold so the precision-recall curve covers the whole confidence range
+EVAL_CONF = 0.001
+EVAL_IOU = 0.7
+# Confidence the GUI and batch tools run at; carnivore recall is measured here
+DEFAULT_OPERATING_CONF = 0.25
+DEFAULT_IMAGE_SIZE = 416
+
+
+def _init_worker(threads, next_index=None):
+    """Pool initializer: must run before torch is imported in the worker
+
+    With `next_index` (a shared counter) each worker takes the next slot and is
+    pinned to its own cores, so concurrent candidates don't time each other's load.
+    """
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    if next_index is not None:
+        from multi_stream import core_slice
+
+        with next_index.get_lock():
+            index = next_index.value
+            next_index.value += 1
+        cores = core_slice(index, threads)
+        if cores:
+            try:
+                os.sched_setaffinity(0, cores)
+            except OSError:
+                pass
+
+
+def ground_truth(label_path, width, height):
+    """Boxes of a YOLO label file as (class ids, pixel xyxy)"""
+    from dataset_cache import parse_label_file
+
+    rows = parse_label_file(label_path)
+    cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1).astype(np.float32)
+    return rows[:, 0].astype(np.int64), boxes
+
+
+def match_predictions(pred_boxes, pred_cls, gt_boxes, gt_cls, thresholds=IOU_THRESHOLDS):
+    """(N, T) bool: prediction i is a true positive at IoU threshold t (greedy, highest IoU first)"""
+    from tracker import box_iou
+
+    correct = np.zeros((len(pred_cls), len(thresholds)), dtype=bool)
+    if len(pred_cls) == 0 or len(gt_cls) == 0:
+        return correct
+    iou = box_iou(gt_boxes, pred_boxes) * (gt_cls[:, None] == pred_cls[None, :])
+    for t, threshold in enumerate(thresholds):
+        gt_index, pred_index = np.nonzero(iou >= threshold)
+        if not len(gt_index):
+            continue
+        order = np.argsort(-iou[gt_index, pred_index])
+        gt_index, pred_index = gt_index[order], pred_index[order]
+        _, first = np.unique(pred_index, return_index=True)
+        gt_index, pred_index = gt_index[first], pred_index[first]
+        order = np.argsort(-iou[gt_index, pred_index])
+        _, first = np.unique(gt_index[order], return_index=True)
+        correct[pred_index[order][first], t] = True
+    return correct
+
+
+def average_precision(recall, precision):
+    """COCO-style mean of the precision envelope at 101 recall points"""
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([1.0], precision, [0.0]))
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    return float(np.interp(np.linspace(0, 1, 101), recall, precision).mean())
+
+
+def ap_per_class(correct, conf, pred_cls, gt_cls, num_classes):
+    """(num_classes, T) AP array and per-class ground-truth counts"""
+    order = np.argsort(-conf)
+    correct, pred_cls = correct[order], pred_cls[order]
+    gt_counts = np.bincount(gt_cls, minlength=num_classes)[:num_classes]
+    ap = np.zeros((num_classes, correct.shape[1]))
+    for class_id in range(num_classes):
+        selected = pred_cls == class_id
+        if gt_counts[class_id] == 0 or not selected.any():
+            continue
+        tp = np.cumsum(correct[selected], axis=0)
+        fp = np.cumsum(~correct[selected], axis=0)
+        recall = tp / gt_counts[class_id]
+        precision = tp / (tp + fp)
+        for t in range(correct.shape[1]):
+            ap[class_id, t] = average_precision(recall[:, t], precision[:, t])
+    return ap, gt_counts
+
+
+def carnivore_matches(detections, gt_cls, gt_boxes, carnivorous_gt, operating_conf):
+    """Carnivore boxes found at the operating confidence: (same class, any carnivore class)"""
+    from tracker import box_iou
+
+    keep = detections.conf >= operating_conf
+    boxes, cls, carnivorous = detections.xyxy[keep], detections.cls[keep], detections.carnivorous[keep]
+    if not carnivorous_gt.any() or not len(cls):
+        return 0, 0
+    iou = box_iou(gt_boxes[carnivorous_gt], boxes)
+    same_class = (iou >= 0.5) & (gt_cls[carnivorous_gt][:, None] == cls[None, :])
+    # An alert only needs some carnivore class on the animal, e.g. Lion read as Leopard
+    any_carnivore = (iou >= 0.5) & carnivorous[None, :]
+    return int(same_class.any(axis=1).sum()), int(any_carnivore.any(axis=1).sum())
+
+
+def evaluate_candidate(task):
+    """Worker: run one model over the test images and compute its accuracy and speed"""
+    import cv2
+
+    from annotator import ClassTable, extract_detections
+    from benchmark import peak_rss_mb, summarize
+    from model_formats import load_detector, model_format
+
+    import torch  # type: ignore
+    torch.set_num_threads(task["threads"])
+
+    table = ClassTable(task["names"])
+    num_classes = len(table)
+    model = load_detector(task["model"])
+    predict_args = {"imgsz": task["imgsz"], "conf": EVAL_CONF, "iou": EVAL_IOU, "max_det": 300,
+                    "verbose": False}
+
+    warmup = np.zeros((task["imgsz"], task["imgsz"], 3), dtype=np.uint8)
+    for _ in range(task["warmup"]):
+        model.predict(warmup, **predict_args)
+
+    latencies = []
+    label_errors = []
+    all_correct, all_conf, all_cls, all_gt = [], [], [], []
+    carnivore_total = carnivore_found = carnivore_alerted = 0
+    carnivore_per_class = np.zeros((num_classes, 2), dtype=np.int64)  # found, total
+    start = time.perf_counter()
+    for image_path in task["images"]:
+        image = cv2.imread(image_path)
+        if image is None:
+            continue
+        try:
+            gt_cls, gt_boxes = ground_truth(image_to_label_path(image_path), image.shape[1], image.shape[0])
+        except (OSError, ValueError) as e:
+            # One malformed label file costs that image, not the whole candidate
+            label_errors.append(f"{image_path}: {str(e)}")
+            continue
+        t0 = time.perf_counter()
+        results = model.predict(image, **predict_args)
+        latencies.append(time.perf_counter() - t0)
+
+        detections = extract_detections(results[0], table)
+        all_correct.append(match_predictions(detections.xyxy, detections.cls, gt_boxes, gt_cls))
+        all_conf.append(detections.conf)
+        all_cls.append(detections.cls)
+        all_gt.append(gt_cls)
+
+        carnivorous_gt = table.is_carnivorous(gt_cls)
+        found, alerted = carnivore_matches(detections, gt_cls, gt_boxes, carnivorous_gt, task["operating_conf"])
+        carnivore_total += int(carnivorous_gt.sum())
+        carnivore_found += found
+        carnivore_alerted += alerted
+        if carnivorous_gt.any():
+            for class_id in np.unique(gt_cls[carnivorous_gt]):
+                in_class = carnivorous_gt & (gt_cls == class_id)
+                class_found, _ = carnivore_matches(detections, gt_cls, gt_boxes, in_class, task["operating_conf"])
+                carnivore_per_class[class_id] += (class_found, int(in_class.sum()))
+    elapsed = time.perf_counter() - start
+
+    images = len(latencies)
+    ap, gt_counts = ap_per_class(np.concatenate(all_correct) if all_correct else np.zeros((0, len(IOU_THRESHOLDS)), bool),
+                                 np.concatenate(all_conf) if all_conf else np.zeros(0),
+                                 np.concatenate(all_cls) if all_cls else np.zeros(0, np.int64),
+                                 np.concatenate(all_gt) if all_gt else np.zeros(0, np.int64),
+                                 num_classes)
+    present = gt_counts > 0
+    per_class = {table.name(i): {"instances": int(gt_counts[i]),
+                            "ap50": round(float(ap[i, 0]), 4),
+                            "ap50_95": round(float(ap[i].mean()), 4)}
+                 for i in range(num_classes) if present[i]}
+    for i in range(num_classes):
+        if present[i] and carnivore_per_class[i, 1]:
+            per_class[table.name(i)]["recall"] = round(float(carnivore_per_class[i, 0] / carnivore_per_class[i, 1]), 4)
+
+    inference_s = sum(latencies)
+    return {
+        "model": task["model"],
+        "format": model_format(task["model"]),
+        "imgsz": task["imgsz"],
+        "threads": task["threads"],
+        "images": images,
+        "map50": round(float(ap[present, 0].mean()), 4) if present.any() else 0.0,
+        "map50_95": round(float(ap[present].mean()), 4) if present.any() else 0.0,
+        "carnivore_recall": round(carnivore_found / carnivore_total, 4) if carnivore_total else None,
+        "carnivore_alert_recall": round(carnivore_alerted / carnivore_total, 4) if carnivore_total else None,
+        "carnivore_instances": carnivore_total,
+        "latency": summarize(latencies),
+        "images_per_s": round(images / inference_s, 2) if inference_s > 0 else 0.0,
+        "end_to_end_images_per_s": round(images / elapsed, 2) if elapsed > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "label_errors": label_errors,
+        "per_class": per_class,
+    }
+
+
+def invalid_label_images(data_config, split):
+    """Images of a split whose labels the dataset index (dataset_index.py) finds broken"""
+    from dataset_index import index_dataset
+
+    # Incremental: only files changed since the last index are re-examined
+    index, _ = index_dataset(data_config, splits=(split,))
+    split_index = index["splits"].get(split)
+    if split_index is None:
+        return set()
+    return {os.path.normcase(os.path.join(split_index["image_dir"], relative))
+            for relative, record in split_index["files"].items() if record["errors"]}
+
+
+def meets_floor(result, min_map50=None, min_carnivore_recall=None):
+    if min_map50 is not None and result["map50"] < min_map50:
+        return False
+    if min_carnivore_recall is not None and (result["carnivore_alert_recall"] or 0.0) < min_carnivore_recall:
+        return False
+    return True
+
+
+def evaluate_models(models, data_config=DEFAULT_DATA_CONFIG, imgsz=(DEFAULT_IMAGE_SIZE,), split="test",
+                    parallel=None, threads_per_worker=None, operating_conf=DEFAULT_OPERATING_CONF,
+                    warmup=2, limit=None, pin_cores=True):
+    """Evaluate every (model, imgsz) pair; returns results in completion order"""
+    from multi_stream import worker_threads
+
+    config = load_data_config(data_config)
+    if config.get(split) is None:
+        raise ValueError(f"{data_config} has no '{split}' split")
+    images = list_split_images(config, split)
+    invalid = invalid_label_images(data_config, split)
+    if invalid:
+        images = [path for path in images if os.path.normcase(path) not in invalid]
+        print(f"Skipping {len(invalid)} image(s) with invalid labels; run dataset_index.py for details")
+    if limit:
+        images = images[:limit]
+    if not images:
+        raise FileNotFoundError(f"No images in the '{split}' split of {data_config}")
+
+    candidates = list(itertools.product(models, imgsz))
+    parallel = max(1, min(parallel or max(1, (os.cpu_count() or 1) // 4), len(candidates)))
+    # Each worker gets a fixed share of the cores (pinned unless pin_cores is False),
+    # so latencies are comparable between candidates
+    threads = worker_threads(parallel, threads_per_worker)
+    tasks = [{"model": model, "imgsz": size, "images": images, "names": dict(config["names"]),
+              "threads": threads, "operating_conf": operating_conf, "warmup": warmup}
+             for model, size in candidates]
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    next_index = context.Value("i", 0) if pin_cores else None
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=context,
+                             initializer=_init_worker, initargs=(threads, next_index)) as executor:
+        futures = {executor.submit(evaluate_candidate, task): task for task in tasks}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"model": task["model"], "imgsz": task["imgsz"], "error": str(e)}
+            results.append(result)
+            label = f"{os.path.basename(task['model'])} @ {task['imgsz']}"
+            if "error" in result:
+                print(f"  {label}: failed - {result['error']}")
+            else:
+                print(f"  {label}: mAP50 {result['map50']:.3f}, {result['images_per_s']:.1f} images/s")
+                if result["label_errors"]:
+                    print(f"    skipped {len(result['label_errors'])} image(s) with unreadable labels")
+    return results
+
+
+def print_table(results, min_map50=None, min_carnivore_recall=None):
+    """Candidates from fastest to slowest; '*' marks those meeting the accuracy floor"""
+    ranked = sorted((r for r in results if "error" not in r), key=lambda r: -r["images_per_s"])
+    header = (f"  {'Model':<32} {'imgsz':>5} {'mAP50':>6} {'50-95':>6} {'Carn.R':>6} {'Alert':>6} "
+              f"{'p50 ms':>7} {'p95 ms':>7} {'img/s':>7}")
+    print("\n" + "=" * len(header))
+    print(header)
+    print("=" * len(header))
+    for result in ranked:
+        mark = "*" if meets_floor(result, min_map50, min_carnivore_recall) else " "
+        recall = f"{result['carnivore_recall']:.3f}" if result["carnivore_recall"] is not None else "-"
+        alert = f"{result['carnivore_alert_recall']:.3f}" if result["carnivore_alert_recall"] is not None else "-"
+        latency = result["latency"] or {}
+        print(f"{mark} {os.path.basename(result['model'].rstrip('/')):<32} {result['imgsz']:>5} "
+              f"{result['map50']:>6.3f} {result['map50_95']:>6.3f} {recall:>6} {alert:>6} "
+              f"{latency.get('p50_ms', 0):>7.1f} {latency.get('p95_ms', 0):>7.1f} {result['images_per_s']:>7.1f}")
+    print("=" * len(header))
+    for result in results:
+        if "error" in result:
+            print(f"  {result['model']} @ {result['imgsz']}: {result['error']}")
+
+    passing = [r for r in ranked if meets_floor(r, min_map50, min_carnivore_recall)]
+    if passing:
+        best = passing[0]
+        print(f"Fastest meeting the floor: {best['model']} @ {best['imgsz']} "
+              f"({best['images_per_s']:.1f} images/s, mAP50 {best['map50']:.3f})")
+    elif ranked:
+        print("No candidate meets the accuracy floor")
+    return passing[0] if passing else None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare models on the test split: accuracy versus CPU speed")
+    parser.add_argument("models", nargs="+", help="Weights or exported models (.pt, .onnx, OpenVINO)")
+    parser.add_argument("--data", default=DEFAULT_DATA_CONFIG, help="Dataset YAML")
+    parser.add_argument("--split", default="test", help="Split to evaluate on")
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[DEFAULT_IMAGE_SIZE], help="Inference sizes to try")
+    parser.add_argument("--parallel", type=int, help="Candidates evaluated at once (default: CPU cores / 4)")
+    parser.add_argument("--threads-per-worker", type=int, help="Torch threads per worker (default: cores / parallel)")
+    parser.add_argument("--no-pin", action="store_true", help="Don't pin workers to CPU cores")
+    parser.add_argument("--conf", type=float, default=DEFAULT_OPERATING_CONF,
+                        help="Operating confidence for carnivore recall")
+    parser.add_argument("--min-map50", type=float, help="Accuracy floor on mAP50")
+    parser.add_argument("--min-carnivore-recall", type=float,
+                        help="Accuracy floor on carnivore alert recall (carnivores found as any carnivore class)")
+    parser.add_argument("--limit", type=int, help="Only use the first N test images")
+    parser.add_argument("--output", default="evaluation_results.json", help="Results JSON path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"Evaluating {len(args.models) * len(args.imgsz)} candidate(s) on the '{args.split}' split...")
+    results = evaluate_models(args.models, args.data, args.imgsz, args.split, args.parallel,
+                              args.threads_per_worker, args.conf, limit=args.limit, pin_cores=not args.no_pin)
+    best = print_table(results, args.min_map50, args.min_carnivore_recall)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "data": os.path.abspath(args.data),
+        "split": args.split,
+        "operating_conf": args.conf,
+        "floor": {"map50": args.min_map50, "carnivore_recall": args.min_carnivore_recall},
+        "best": {"model": best["model"], "imgsz": best["imgsz"]} if best else None,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0 if best is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
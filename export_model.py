@@ -0,0 +1,175 @@
+"""
+Export trained weights for fast CPU inference
+Writes ONNX and optionally OpenVINO models, each with an INT8 variant
+calibrated on images from the val split of animal_data.yaml
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+from dataset_config import (DEFAULT_DATA_CONFIG, list_split_images, load_data_config,
+                            write_resolved_config)
+
+DEFAULT_IMAGE_SIZE = 416  # Matches IMAGE_SIZE in train_yolo.py
+DEFAULT_CALIBRATION_IMAGES = 200
+
+
+def letterbox(image, size, color=(114, 114, 114)):
+    """Resize keeping aspect ratio and pad to a size x size square"""
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+    pad_x = (size - new_width) // 2
+    pad_y = (size - new_height) // 2
+    output = np.full((size, size, 3), color, dtype=np.uint8)
+    output[pad_y:pad_y + new_height, pad_x:pad_x + new_width] = resized
+    return output, scale, (pad_x, pad_y)
+
+
+def to_model_input(image, imgsz):
+    """BGR image -> 1x3xHxW float32 tensor in [0, 1], as Ultralytics feeds exported models"""
+    padded, _, _ = letterbox(image, imgsz)
+    rgb = cv2.cvtColor(padded, cv2.COLOR_BGR2RGB)
+    return np.ascontiguousarray(rgb.transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+def calibration_images(data_config, count, seed=0):
+    """Pick up to `count` images from the val split for INT8 calibration"""
+    config = load_data_config(data_config)
+    images = list_split_images(config, "val")
+    if not images:
+        raise FileNotFoundError("No validation images found for INT8 calibration")
+    random.Random(seed).shuffle(images)
+    return images[:count]
+
+
+class _CalibrationReader:
+    """onnxruntime CalibrationDataReader over a list of image files"""
+
+    def __init__(self, image_paths, input_name, imgsz):
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._paths = iter(image_paths)
+
+    def get_next(self):
+        for path in self._paths:
+            image = cv2.imread(path)
+            if image is not None:
+                return {self.input_name: to_model_input(image, self.imgsz)}
+        return None
+
+
+def export_onnx(weights, imgsz=DEFAULT_IMAGE_SIZE):
+    """Export PyTorch weights to ONNX with a dynamic batch dimension"""
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    return model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+
+
+def quantize_onnx_int8(onnx_path, image_paths, imgsz=DEFAULT_IMAGE_SIZE, output_path=None):
+    """Static INT8 quantization of an ONNX model, calibrated on real images"""
+    import onnxruntime  # type: ignore
+    from onnxruntime.quantization import (CalibrationMethod, QuantFormat, QuantType,  # type: ignore
+                                          quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process  # type: ignore
+
+    if output_path is None:
+        output_path = os.path.splitext(onnx_path)[0] + "_int8.onnx"
+
+    session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    del session
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Shape inference + graph optimization give the quantizer a cleaner graph
+        prepared_path = os.path.join(tmp_dir, "prepared.onnx")
+        quant_pre_process(onnx_path, prepared_path)
+
+        quantize_static(
+            prepared_path,
+            output_path,
+            _CalibrationReader(image_paths, input_name, imgsz),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+            calibrate_method=CalibrationMethod.MinMax,
+            # Only the convolutions; the box decoding head stays in float for accuracy
+            op_types_to_quantize=["Conv"],
+        )
+    return output_path
+
+
+def export_openvino(weights, data_config=DEFAULT_DATA_CONFIG, imgsz=DEFAULT_IMAGE_SIZE, int8=False):
+    """Export to OpenVINO; with int8=True Ultralytics calibrates on the val split via NNCF"""
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    if not int8:
+        return model.export(format="openvino", imgsz=imgsz)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Ultralytics needs a data YAML whose path exists on this machine
+        resolved = write_resolved_config(load_data_config(data_config),
+                                         os.path.join(tmp_dir, "animal_data.yaml"))
+        return model.export(format="openvino", imgsz=imgsz, int8=True, data=resolved)
+
+
+def export_all(weights, data_config=DEFAULT_DATA_CONFIG, imgsz=DEFAULT_IMAGE_SIZE,
+               int8=True, openvino=False, calibration_count=DEFAULT_CALIBRATION_IMAGES):
+    """Run every requested export and return {name: path}"""
+    exported = {}
+
+    print(f"Exporting ONNX model from {weights}...")
+    exported["onnx"] = export_onnx(weights, imgsz)
+
+    if int8:
+        print(f"Quantizing ONNX model to INT8 ({calibration_count} calibration images)...")
+        images = calibration_images(data_config, calibration_count)
+        exported["onnx_int8"] = quantize_onnx_int8(exported["onnx"], images, imgsz)
+
+    if openvino:
+        print("Exporting OpenVINO model...")
+        exported["openvino"] = export_openvino(weights, data_config, imgsz, int8=False)
+        if int8:
+            print("Exporting OpenVINO INT8 model...")
+            exported["openvino_int8"] = export_openvino(weights, data_config, imgsz, int8=True)
+
+    return exported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export trained weights for CPU inference")
+    parser.add_argument("weights", help="Trained PyTorch weights (e.g. .../weights/best.pt)")
+    parser.add_argument("--data", default=DEFAULT_DATA_CONFIG, help="Dataset YAML for calibration")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMAGE_SIZE, help="Export image size")
+    parser.add_argument("--no-int8", action="store_true", help="Skip INT8 quantization")
+    parser.add_argument("--openvino", action="store_true", help="Also export OpenVINO models")
+    parser.add_argument("--calibration-images", type=int, default=DEFAULT_CALIBRATION_IMAGES,
+                        help="Number of val images used for INT8 calibration")
+    args = parser.parse_args(argv)
+
+    exported = export_all(args.weights, args.data, args.imgsz, int8=not args.no_int8,
+                          openvino=args.openvino, calibration_count=args.calibration_images)
+
+    print("\n" + "=" * 60)
+    print("EXPORTED MODELS")
+    print("=" * 60)
+    for name, path in exported.items():
+        print(f"{name:>14}: {path}")
+    print("=" * 60)
+    print("Load any of these in detect.py or batch_detect.py --model")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
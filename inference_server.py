@@ -0,0 +1,332 @@
+"""
+Local HTTP inference server with dynamic micro-batching
+Concurrent requests are queued and run through the model together, bounded
+by a maximum batch size and a maximum wait time
+
+    POST /detect   raw image bytes (JPEG/PNG/...) -> JSON detections
+    GET  /health   model and queue status
+    GET  /metrics  latency histograms and counters
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from annotator import extract_detections
+from metrics import Metrics
+from model_formats import load_detector
+
+DEFAULT_IMAGE_SIZE = 416
+MAX_BODY_BYTES = 50 * 1024 * 1024
+
+
+class QueueFull(Exception):
+    """Raised when the batcher is at its queue limit (backpressure)"""
+
+
+class PendingRequest:
+    """One queued image waiting for its batch"""
+
+    __slots__ = ("image", "enqueued", "done", "detections", "error", "batch_size", "infer_s", "cancelled")
+
+    def __init__(self, image):
+        self.image = image
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.detections = None
+        self.error = None
+        self.batch_size = 0
+        self.infer_s = 0.0
+        self.cancelled = False
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into batches for a single forward pass
+
+    A batch is dispatched as soon as it holds `max_batch` images or the oldest
+    request has waited `max_wait_ms`. At most `max_queue` requests may wait;
+    beyond that submit() raises QueueFull. Requests whose client gave up are
+    cancelled and dropped instead of being run.
+    """
+
+    def __init__(self, model, predict_args, max_batch=8, max_wait_ms=10, max_queue=64, metrics=None):
+        self.model = model
+        self.predict_args = predict_args
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.metrics = metrics if metrics is not None else Metrics()
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join()
+
+    @property
+    def queue_depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    @property
+    def full(self):
+        """True if submit() would currently raise QueueFull"""
+        with self._cond:
+            return self._at_limit()
+
+    def submit(self, image):
+        """Queue an image; returns a PendingRequest to wait on"""
+        request = PendingRequest(image)
+        with self._cond:
+            if self._at_limit():
+                self.metrics.incr("rejected")
+                raise QueueFull()
+            self._pending.append(request)
+            self.metrics.set_gauge("queue_depth", len(self._pending))
+            self._cond.notify_all()
+        return request
+
+    def cancel(self, request):
+        """Give up on a request (e.g. its client timed out); it is dropped before the next batch"""
+        with self._cond:
+            request.cancelled = True
+
+    def _drop_cancelled(self):
+        """Remove cancelled requests from the queue; caller holds the lock"""
+        if any(request.cancelled for request in self._pending):
+            live = [request for request in self._pending if not request.cancelled]
+            self.metrics.incr("cancelled", len(self._pending) - len(live))
+            self._pending = deque(live)
+            self.metrics.set_gauge("queue_depth", len(self._pending))
+
+    def _at_limit(self):
+        """Caller holds the lock"""
+        if len(self._pending) < self.max_queue:
+            return False
+        # Abandoned requests must not hold queue slots against new ones
+        self._drop_cancelled()
+        return len(self._pending) >= self.max_queue
+
+    def _next_batch(self):
+        """Block until a batch is ready according to the size/time bounds"""
+        with self._cond:
+            while True:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return []
+                self._drop_cancelled()
+                if self._pending:
+                    break
+
+            deadline = self._pending[0].enqueued + self.max_wait
+            while self._running and len(self._pending) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Requests cancelled while the batch was filling don't take a slot in it
+            self._drop_cancelled()
+            count = min(self.max_batch, len(self._pending))
+            batch = [self._pending.popleft() for _ in range(count)]
+            self.metrics.set_gauge("queue_depth", len(self._pending))
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if not self._running:
+                    break
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = self.model.predict([request.image for request in batch],
+                                             verbose=False, **self.predict_args)
+                infer_s = time.perf_counter() - start
+                for request, result in zip(batch, results):
+                    request.detections = extract_detections(result)
+            except Exception as e:
+                infer_s = time.perf_counter() - start
+                for request in batch:
+                    request.error = str(e)
+
+            self.metrics.observe("infer_batch", infer_s)
+            self.metrics.incr("batches")
+            self.metrics.incr("batched_images", len(batch))
+            self.metrics.set_gauge("last_batch_size", len(batch))
+            for request in batch:
+                request.batch_size = len(batch)
+                request.infer_s = infer_s
+                request.done.set()
+
+        # Fail anything still queued at shutdown
+        with self._cond:
+            while self._pending:
+                request = self._pending.popleft()
+                request.error = "server shutting down"
+                request.done.set()
+
+
+def make_handler(batcher, metrics, request_timeout):
+    """Build the request handler class bound to a batcher"""
+
+    class DetectionHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.rstrip("/")
+            if path == "/health":
+                self._send_json(200, {"status": "ok", "queue_depth": batcher.queue_depth,
+                                      "max_batch": batcher.max_batch, "max_queue": batcher.max_queue})
+            elif path == "/metrics":
+                self._send_json(200, metrics.snapshot())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/detect":
+                self._send_json(404, {"error": "not found"})
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except (TypeError, ValueError):
+                length = -1
+            if length < 0:
+                # The body can't be skipped without a valid length
+                self.close_connection = True
+                self._send_json(400, {"error": "invalid Content-Length"})
+                return
+            if length == 0:
+                self._send_json(400, {"error": "empty request body"})
+                return
+            if length > MAX_BODY_BYTES:
+                self.close_connection = True
+                self._send_json(413, {"error": "image too large"})
+                return
+            if batcher.full:
+                # Refuse before reading and decoding an image that can't be queued
+                metrics.incr("rejected")
+                self.close_connection = True
+                self._send_json(503, {"error": "server busy, retry later"}, {"Retry-After": "1"})
+                return
+
+            started = time.perf_counter()
+            data = np.frombuffer(self.rfile.read(length), dtype=np.uint8)
+            image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+            if image is None:
+                self._send_json(400, {"error": "could not decode image"})
+                return
+            metrics.observe("decode", time.perf_counter() - started)
+
+            try:
+                request = batcher.submit(image)
+            except QueueFull:
+                self._send_json(503, {"error": "server busy, retry later"}, {"Retry-After": "1"})
+                return
+
+            if not request.done.wait(request_timeout):
+                batcher.cancel(request)
+                metrics.incr("timeouts")
+                self._send_json(504, {"error": "inference timed out"})
+                return
+            if request.error is not None:
+                metrics.incr("errors")
+                self._send_json(500, {"error": request.error})
+                return
+
+            detections = request.detections
+            metrics.observe("request", time.perf_counter() - started)
+            metrics.frame_done()
+            self._send_json(200, {
+                "width": int(image.shape[1]),
+                "height": int(image.shape[0]),
+                "carnivorous_count": detections.carnivorous_count,
+                "detections": detections.to_records(),
+                "batch_size": request.batch_size,
+                "infer_ms": round(request.infer_s * 1000.0, 2),
+                "total_ms": round((time.perf_counter() - started) * 1000.0, 2),
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return DetectionHandler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local animal detection server with micro-batching")
+    parser.add_argument("--model", default="yolov8n.pt", help="YOLO weights (.pt, .onnx or OpenVINO model)")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (localhost by default)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMAGE_SIZE, help="Inference image size")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    parser.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold")
+    parser.add_argument("--max-batch", type=int, default=8, help="Maximum images per forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0,
+                        help="Maximum time the first request of a batch waits for more")
+    parser.add_argument("--max-queue", type=int, default=64,
+                        help="Requests allowed to wait before new ones get HTTP 503")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # The model is loaded and warmed up once, before accepting requests
+    print(f"Loading model: {args.model}")
+    model = load_detector(args.model)
+    predict_args = {"imgsz": args.imgsz, "conf": args.conf, "iou": args.iou}
+    model.predict(np.zeros((args.imgsz, args.imgsz, 3), dtype=np.uint8), verbose=False, **predict_args)
+
+    metrics = Metrics()
+    batcher = MicroBatcher(model, predict_args, max_batch=args.max_batch,
+                           max_wait_ms=args.max_wait_ms, max_queue=args.max_queue,
+                           metrics=metrics).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher, metrics, args.timeout))
+    server.daemon_threads = True
+    print(f"Serving on http://{args.host}:{args.port} (POST /detect, GET /health, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        batcher.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
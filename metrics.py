@@ -0,0 +1,231 @@
+"""
+Low-overhead runtime metrics
+Rolling per-stage latency histograms, counters and gauges, with a compact
+status line for the GUI and a local HTTP endpoint / periodic JSON dump for
+headless runs
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_WINDOW = 300
+
+
+class RollingHistogram:
+    """Latency samples over the last `window` observations"""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self._samples = deque(maxlen=window)
+        self.total_count = 0
+        self.total_seconds = 0.0
+
+    def observe(self, seconds):
+        self._samples.append(seconds)
+        self.total_count += 1
+        self.total_seconds += seconds
+
+    def summary(self):
+        """Mean and p50/p95/p99 of the window in milliseconds"""
+        if not self._samples:
+            return {"count": self.total_count}
+        values = sorted(self._samples)
+        last = len(values) - 1
+
+        def percentile(p):
+            return round(values[min(last, int(round(p / 100.0 * last)))] * 1000.0, 3)
+
+        return {
+            "count": self.total_count,
+            "mean_ms": round(sum(values) / len(values) * 1000.0, 3),
+            "p50_ms": percentile(50),
+            "p95_ms": percentile(95),
+            "p99_ms": percentile(99),
+        }
+
+    @property
+    def mean_ms(self):
+        return sum(self._samples) / len(self._samples) * 1000.0 if self._samples else 0.0
+
+
+class Metrics:
+    """Thread-safe registry of stage timings, counters and gauges"""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+        self._frame_times = deque(maxlen=window)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = RollingHistogram(self.window)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Context manager that records the duration of a block under `stage`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def incr(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def set_gauge(self, gauge, value):
+        with self._lock:
+            self._gauges[gauge] = value
+
+    def frame_done(self):
+        """Mark one output frame complete; drives the FPS figure"""
+        now = time.perf_counter()
+        with self._lock:
+            self._frame_times.append(now)
+            self._counters["frames_processed"] = self._counters.get("frames_processed", 0) + 1
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def gauge(self, name, default=None):
+        with self._lock:
+            return self._gauges.get(name, default)
+
+    def stage_mean_ms(self, stage):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            return histogram.mean_ms if histogram is not None else 0.0
+
+    def fps(self):
+        with self._lock:
+            if len(self._frame_times) < 2:
+                return 0.0
+            span = self._frame_times[-1] - self._frame_times[0]
+            return (len(self._frame_times) - 1) / span if span > 0 else 0.0
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._stages.clear()
+            self._counters.clear()
+            self._gauges.clear()
+            self._frame_times.clear()
+
+    def snapshot(self):
+        """All metrics as a JSON-serialisable dict"""
+        fps = self.fps()
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "uptime_s": round(time.time() - self.started, 3),
+                "fps": round(fps, 2),
+                "stages": {name: histogram.summary() for name, histogram in self._stages.items()},
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+            }
+
+    def status_line(self, stages=("decode", "infer", "annotate", "display")):
+        """Compact one-line summary, e.g. for the GUI"""
+        parts = [f"FPS {self.fps():.1f}"]
+        with self._lock:
+            imgsz = self._gauges.get("imgsz")
+            if imgsz is not None:
+                parts.append(f"imgsz {imgsz}")
+            for stage in stages:
+                histogram = self._stages.get(stage)
+                if histogram is not None:
+                    parts.append(f"{stage} {histogram.mean_ms:.1f}ms")
+            dropped = self._counters.get("frames_dropped", 0)
+            static = self._counters.get("frames_skipped_static")
+            queues = [f"{name[:-len('_depth')]} {value}" for name, value in sorted(self._gauges.items())
+                      if name.endswith("_depth")]
+        parts.append(f"dropped {dropped}")
+        if static is not None:
+            parts.append(f"static skipped {static}")
+        if queues:
+            parts.append("queues " + ", ".join(queues))
+        return " | ".join(parts)
+
+
+class MetricsServer:
+    """Serves Metrics.snapshot() as JSON on http://127.0.0.1:<port>/metrics"""
+
+    def __init__(self, metrics, port=9100, host="127.0.0.1"):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.rstrip("/") not in ("", "/metrics"):
+                    handler.send_error(404)
+                    return
+                body = json.dumps(metrics.snapshot()).encode()
+                handler.send_response(200)
+                handler.send_header("Content-Type", "application/json")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class JsonDumper:
+    """Periodically writes Metrics.snapshot() to a JSON file (atomically replaced)"""
+
+    def __init__(self, metrics, path, interval=5.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-dump", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the thread and write a final snapshot"""
+        self._stop_event.set()
+        self._thread.join()
+        self.dump()
+
+    def dump(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.metrics.snapshot(), f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: could not write metrics to {self.path}: {str(e)}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.dump()
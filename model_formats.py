@@ -0,0 +1,41 @@
+"""
+Loading detectors from any supported weights format
+PyTorch (.pt), ONNX (.onnx) and OpenVINO (*_openvino_model directory) all go
+through the same Ultralytics YOLO front end
+"""
+
+import os
+
+# File dialog filters for the GUI
+MODEL_FILETYPES = [
+    ("Model files", "*.pt *.onnx *.xml"),
+    ("PyTorch weights", "*.pt"),
+    ("ONNX models", "*.onnx"),
+    ("OpenVINO models", "*.xml"),
+    ("All files", "*.*"),
+]
+
+
+def resolve_model_path(model_path):
+    """Map an OpenVINO .xml file to its model directory; other paths are unchanged"""
+    if model_path.lower().endswith(".xml"):
+        return os.path.dirname(os.path.abspath(model_path))
+    return model_path
+
+
+def model_format(model_path):
+    """Return 'openvino', 'onnx' or 'pytorch' for a weights path"""
+    model_path = resolve_model_path(model_path)
+    if os.path.isdir(model_path) or model_path.rstrip("/\\").endswith("_openvino_model"):
+        return "openvino"
+    if model_path.lower().endswith(".onnx"):
+        return "onnx"
+    return "pytorch"
+
+
+def load_detector(model_path):
+    """Load a YOLO detector from .pt, .onnx or OpenVINO weights"""
+    from ultralytics import YOLO
+
+    # Exported formats carry no task metadata guarantee, so state it explicitly
+    return YOLO(resolve_model_path(model_path), task="detect")
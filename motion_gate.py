@@ -0,0 +1,114 @@
+"""
+Motion-gated inference
+Compares a small grayscale copy of each frame against an adaptive background
+and skips the detector when the scene hasn't meaningfully changed
+"""
+
+import cv2
+import numpy as np
+
+DEFAULT_WIDTH = 160
+DEFAULT_PIXEL_THRESHOLD = 25
+DEFAULT_MIN_CHANGED = 0.005
+DEFAULT_FORCE_EVERY = 50
+
+
+class MotionGate:
+    """
+    Cheap change detector on a downscaled grayscale frame
+
+    A pixel counts as changed when it differs from the background by more than
+    `pixel_threshold` after removing the global brightness shift; a frame counts as
+    changed when more than `min_changed` of its pixels did. The background adapts
+    slowly (`learning_rate`) so wind and gradual lighting changes fade out.
+    Every `force_every` frames a detection is forced regardless.
+    """
+
+    def __init__(self, width=DEFAULT_WIDTH, pixel_threshold=DEFAULT_PIXEL_THRESHOLD,
+                 min_changed=DEFAULT_MIN_CHANGED, force_every=DEFAULT_FORCE_EVERY,
+                 learning_rate=0.05):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.force_every = force_every
+        self.learning_rate = learning_rate
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.skipped = 0
+        self.last_changed_fraction = 0.0
+        self._background = None
+        self._since_detect = 0
+
+    @property
+    def skip_ratio(self):
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def stats(self):
+        return {"frames": self.frames, "skipped": self.skipped,
+                "skip_ratio": round(self.skip_ratio, 4),
+                "last_changed_fraction": round(self.last_changed_fraction, 5)}
+
+    def _small_gray(self, frame):
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, int(round(height * self.width / width))))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+        return small.astype(np.float32)
+
+    def should_detect(self, frame):
+        """Return True if the detector should run on this frame"""
+        self.frames += 1
+        small = self._small_gray(frame)
+
+        if self._background is None or self._background.shape != small.shape:
+            self._background = small
+            self._since_detect = 0
+            self.last_changed_fraction = 1.0
+            return True
+
+        difference = small - self._background
+        # Remove the global brightness shift (clouds, auto exposure)
+        difference -= float(difference.mean())
+        changed = float(np.count_nonzero(np.abs(difference) > self.pixel_threshold)) / difference.size
+        self.last_changed_fraction = changed
+
+        cv2.accumulateWeighted(small, self._background, self.learning_rate)
+
+        self._since_detect += 1
+        if changed >= self.min_changed or self._since_detect >= self.force_every:
+            self._since_detect = 0
+            return True
+
+        self.skipped += 1
+        return False
+
+
+class MotionGatedDetector:
+    """
+    Wraps a frame processor (e.g. TrackedDetector) and reuses its last
+    detections for frames the motion gate considers static
+    """
+
+    def __init__(self, processor, gate=None, metrics=None):
+        self.processor = processor
+        self.gate = gate or MotionGate()
+        self.metrics = metrics
+        self._last = None
+
+    def reset(self):
+        self.gate.reset()
+        self._last = None
+        if hasattr(self.processor, "reset"):
+            self.processor.reset()
+
+    def process(self, frame):
+        changed = self.gate.should_detect(frame)
+        if changed or self._last is None:
+            self._last = self.processor.process(frame)
+        elif self.metrics is not None:
+            self.metrics.incr("frames_skipped_static")
+        return self._last
@@ -0,0 +1,321 @@
+"""
+Multi-stream detection across CPU cores
+Each video source (file path or stream URL) gets its own worker process with
+its own model instance and a fixed torch thread budget; a coordinator process
+aggregates detections and carnivore counts
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+
+DEFAULT_IMAGE_SIZE = 416
+
+
+def worker_threads(num_streams, requested=None):
+    """Torch intra-op threads per worker so workers together don't oversubscribe the CPU"""
+    if requested:
+        return requested
+    return max(1, (os.cpu_count() or 1) // max(1, num_streams))
+
+
+def core_slice(worker_index, threads):
+    """CPU ids reserved for a worker, or None if affinity can't be set on this platform"""
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    cores = sorted(os.sched_getaffinity(0))
+    start = (worker_index * threads) % len(cores)
+    return {cores[(start + i) % len(cores)] for i in range(threads)}
+
+
+def _limit_threads(threads, cores):
+    """Must run before torch is imported in the worker"""
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    if cores:
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+
+
+def stream_worker(stream_id, source, options, results, stop_event):
+    """Worker process: decode one source, detect, and send per-frame summaries to the coordinator"""
+    _limit_threads(options["threads"], options.get("cores"))
+    # Ctrl+C reaches the whole process group; the coordinator stops workers via stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import cv2
+    import torch  # type: ignore
+
+    from annotator import extract_detections
+    from model_formats import load_detector
+    from tracker import TrackedDetector
+
+    torch.set_num_threads(options["threads"])
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Already set by an import
+
+    started = time.perf_counter()
+    frames = 0
+    try:
+        model = load_detector(options["model"])
+        predict_args = {"imgsz": options["imgsz"], "conf": options["conf"], "verbose": False}
+
+        def detect(frame):
+            return extract_detections(model.predict(frame, **predict_args)[0])
+
+        tracked = TrackedDetector(detect, interval=options["detect_every"])
+
+        video_cap = cv2.VideoCapture(source)
+        if not video_cap.isOpened():
+            raise IOError(f"Could not open video source: {source}")
+
+        fps = video_cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frame_index = 0
+        try:
+            while not stop_event.is_set():
+                if frame_index % options["stride"] != 0:
+                    # Skipped frames are only grabbed, not decoded
+                    if not video_cap.grab():
+                        break
+                else:
+                    ret, frame = video_cap.read()
+                    if not ret:
+                        break
+                    detections = tracked.process(frame)
+                    frames += 1
+                    results.put(("frame", stream_id, {
+                        "frame": frame_index,
+                        "timestamp": round(frame_index / fps, 3) if fps > 0 else None,
+                        "carnivorous_count": detections.carnivorous_count,
+                        "distinct_carnivores": tracked.tracker.distinct_carnivores,
+                        "distinct_animals": tracked.tracker.distinct_animals,
+                        "detections": detections.to_records(),
+                    }))
+                frame_index += 1
+        finally:
+            video_cap.release()
+
+        elapsed = time.perf_counter() - started
+        results.put(("done", stream_id, {
+            "frames": frames,
+            "detector_runs": tracked.detector_runs,
+            "elapsed_s": round(elapsed, 3),
+            "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+            "distinct_carnivores": tracked.tracker.distinct_carnivores,
+            "distinct_animals": tracked.tracker.distinct_animals,
+        }))
+    except Exception as e:
+        results.put(("error", stream_id, {"error": str(e), "frames": frames}))
+
+
+class StreamStats:
+    """Coordinator-side aggregate for one stream"""
+
+    def __init__(self, source):
+        self.source = source
+        self.frames = 0
+        self.detections = 0
+        self.carnivorous_detections = 0
+        self.max_carnivores_in_frame = 0
+        self.distinct_carnivores = 0
+        self.distinct_animals = 0
+        self.finished = None
+        self.error = None
+
+    def add_frame(self, record):
+        self.frames += 1
+        self.detections += len(record["detections"])
+        self.carnivorous_detections += record["carnivorous_count"]
+        self.max_carnivores_in_frame = max(self.max_carnivores_in_frame, record["carnivorous_count"])
+        self.distinct_carnivores = record["distinct_carnivores"]
+        self.distinct_animals = record["distinct_animals"]
+
+    def as_dict(self):
+        summary = {
+            "source": self.source,
+            "frames": self.frames,
+            "detections": self.detections,
+            "carnivorous_detections": self.carnivorous_detections,
+            "max_carnivores_in_frame": self.max_carnivores_in_frame,
+            "distinct_carnivores": self.distinct_carnivores,
+            "distinct_animals": self.distinct_animals,
+        }
+        if self.finished:
+            summary.update(fps=self.finished["fps"], elapsed_s=self.finished["elapsed_s"],
+                           detector_runs=self.finished["detector_runs"])
+        if self.error:
+            summary["error"] = self.error
+        return summary
+
+
+class MultiStreamRunner:
+    """Starts one worker process per source and aggregates their results"""
+
+    def __init__(self, sources, model="yolov8n.pt", imgsz=DEFAULT_IMAGE_SIZE, conf=0.25,
+                 threads_per_worker=None, detect_every=1, stride=1, pin_cores=True,
+                 queue_size=256):
+        self.sources = list(sources)
+        self.threads = worker_threads(len(self.sources), threads_per_worker)
+        self.options = {
+            "model": model,
+            "imgsz": imgsz,
+            "conf": conf,
+            "threads": self.threads,
+            "detect_every": detect_every,
+            "stride": stride,
+        }
+        self.pin_cores = pin_cores
+        self.stats = {i: StreamStats(source) for i, source in enumerate(self.sources)}
+
+        # Spawn gives each worker a clean interpreter (no forked torch thread pools)
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue(maxsize=queue_size)
+        self._stop_event = self._context.Event()
+        self._processes = []
+        self._remaining = set(self.stats)
+
+    def start(self):
+        for stream_id, source in enumerate(self.sources):
+            options = dict(self.options)
+            if self.pin_cores:
+                options["cores"] = core_slice(stream_id, self.threads)
+            process = self._context.Process(target=stream_worker, name=f"stream-{stream_id}",
+                                            args=(stream_id, source, options, self._results, self._stop_event),
+                                            daemon=True)
+            process.start()
+            self._processes.append(process)
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+
+    def results(self, poll_interval=0.5):
+        """Yield (stream_id, frame_record) until every worker has finished
+
+        Can be called again after an interrupted iteration (e.g. to drain the
+        queue after stop()); workers that already reported are not waited for.
+        """
+        remaining = self._remaining
+        while remaining:
+            try:
+                kind, stream_id, payload = self._results.get(timeout=poll_interval)
+            except queue.Empty:
+                # A worker that died without reporting must not hang the coordinator
+                for stream_id in list(remaining):
+                    process = self._processes[stream_id]
+                    if not process.is_alive() and process.exitcode not in (0, None):
+                        self.stats[stream_id].error = f"worker exited with code {process.exitcode}"
+                        remaining.discard(stream_id)
+                continue
+
+            stats = self.stats[stream_id]
+            if kind == "frame":
+                stats.add_frame(payload)
+                yield stream_id, payload
+            elif kind == "done":
+                stats.finished = payload
+                stats.distinct_carnivores = payload["distinct_carnivores"]
+                stats.distinct_animals = payload["distinct_animals"]
+                remaining.discard(stream_id)
+            else:
+                stats.error = payload["error"]
+                remaining.discard(stream_id)
+
+        for process in self._processes:
+            process.join(timeout=5)
+
+    def summary(self):
+        streams = [stats.as_dict() for stats in self.stats.values()]
+        return {
+            "streams": streams,
+            "total_frames": sum(s["frames"] for s in streams),
+            "total_carnivorous_detections": sum(s["carnivorous_detections"] for s in streams),
+            "total_distinct_carnivores": sum(s["distinct_carnivores"] for s in streams),
+            "threads_per_worker": self.threads,
+        }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Detect animals in several video streams in parallel")
+    parser.add_argument("sources", nargs="+", help="Video files or stream URLs")
+    parser.add_argument("--model", default="yolov8n.pt", help="YOLO weights (.pt, .onnx or OpenVINO model)")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMAGE_SIZE, help="Inference image size")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    parser.add_argument("--threads-per-worker", type=int,
+                        help="Torch threads per worker (default: CPU cores / streams)")
+    parser.add_argument("--detect-every", type=int, default=1,
+                        help="Run the detector every N processed frames, tracking in between")
+    parser.add_argument("--stride", type=int, default=1, help="Process every N-th frame")
+    parser.add_argument("--no-pin", action="store_true", help="Don't pin workers to CPU cores")
+    parser.add_argument("--output", help="Write per-frame records as JSON Lines")
+    parser.add_argument("--summary", help="Write the aggregated summary as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    runner = MultiStreamRunner(args.sources, model=args.model, imgsz=args.imgsz, conf=args.conf,
+                               threads_per_worker=args.threads_per_worker,
+                               detect_every=args.detect_every, stride=args.stride,
+                               pin_cores=not args.no_pin)
+    print(f"Starting {len(args.sources)} worker(s) with {runner.threads} thread(s) each...")
+    runner.start()
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    last_report = time.perf_counter()
+    try:
+        for stream_id, record in runner.results():
+            if output is not None:
+                output.write(json.dumps({"stream": stream_id, "source": args.sources[stream_id],
+                                         **record}) + "\n")
+            if time.perf_counter() - last_report >= 5.0:
+                last_report = time.perf_counter()
+                frames = sum(stats.frames for stats in runner.stats.values())
+                carnivores = sum(stats.distinct_carnivores for stats in runner.stats.values())
+                print(f"  {frames} frame(s) processed, {carnivores} distinct carnivore(s) so far")
+    except KeyboardInterrupt:
+        print("Stopping workers...")
+        runner.stop()
+        # Workers finish their current frame and report; their totals are in the "done" payloads
+        for stream_id, record in runner.results():
+            if output is not None:
+                output.write(json.dumps({"stream": stream_id, "source": args.sources[stream_id],
+                                         **record}) + "\n")
+    finally:
+        if output is not None:
+            output.close()
+
+    summary = runner.summary()
+    print("\n" + "=" * 60)
+    print("MULTI-STREAM SUMMARY")
+    print("=" * 60)
+    for stream in summary["streams"]:
+        line = (f"{os.path.basename(str(stream['source']))}: {stream['frames']} frames, "
+                f"{stream['distinct_carnivores']} distinct carnivore(s)")
+        if "fps" in stream:
+            line += f", {stream['fps']:.1f} FPS"
+        if "error" in stream:
+            line += f"  ERROR: {stream['error']}"
+        print(line)
+    print(f"Total distinct carnivores: {summary['total_distinct_carnivores']}")
+    print("=" * 60)
+
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+    return 1 if any("error" in stream for stream in summary["streams"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
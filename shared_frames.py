@@ -0,0 +1,244 @@
+"""
+Shared-memory frame ring
+A decoder process reads video frames straight into preallocated slots of one
+multiprocessing.shared_memory block; only slot numbers travel over the queues,
+so the consumer gets NumPy views of the frames without pickling or copying them
+"""
+
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+DEFAULT_SLOTS = 8
+POLL_INTERVAL_S = 0.1
+
+
+def frame_shape(video_cap):
+    """(height, width, 3) of the capture's frames, or None if the container doesn't say"""
+    import cv2
+
+    width = int(video_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(video_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if width <= 0 or height <= 0:
+        return None
+    return height, width, 3
+
+
+def _attach(name):
+    # Only the creating process may unlink the block; keep attachers out of the resource tracker
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameRing:
+    """Fixed number of equally sized frame slots in one shared memory block"""
+
+    def __init__(self, slots, shape, dtype=np.uint8, name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        if self.owner:
+            size = slots * int(np.prod(self.shape)) * self.dtype.itemsize
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = _attach(name)
+        self._frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def spec(self):
+        """Picklable description for attach() in another process"""
+        return {"name": self.name, "slots": self.slots, "shape": self.shape, "dtype": self.dtype.str}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec["slots"], spec["shape"], spec["dtype"], name=spec["name"])
+
+    def slot(self, index):
+        """Writable view of one slot"""
+        return self._frames[index]
+
+    def close(self):
+        """Unmap the block (and remove it, in the creating process)"""
+        self._frames = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # A consumer still holds a view; the mapping goes away with it
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _take_slot(free_slots, stop_event, timeout):
+    """Next free slot, waiting up to `timeout` seconds (None = until stopped)"""
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    while not stop_event.is_set():
+        wait = POLL_INTERVAL_S
+        if deadline is not None:
+            wait = min(wait, deadline - time.perf_counter())
+            if wait <= 0:
+                try:
+                    return free_slots.get_nowait()
+                except queue.Empty:
+                    return None
+        try:
+            return free_slots.get(timeout=wait)
+        except queue.Empty:
+            continue
+    return None
+
+
+def decode_worker(video_path, ring_spec, start_frame, end_frame, realtime, free_slots, ready,
+                  stop_event, dropped):
+    """Decoder process: read frames into free slots and announce ("frame", index, slot)"""
+    import cv2
+
+    from video_pipeline import source_fps
+
+    ring = SharedFrameRing.attach(ring_spec)
+    video_cap = cv2.VideoCapture(video_path)
+    index = start_frame
+    try:
+        if not video_cap.isOpened():
+            ready.put(("error", f"Could not open video: {video_path}", None))
+            return
+        if start_frame:
+            video_cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        frame_interval = 1.0 / source_fps(video_cap)
+        next_due = time.perf_counter()
+        while not stop_event.is_set():
+            if end_frame is not None and index >= end_frame:
+                break
+
+            # A live source can't wait for a slow consumer: skip the frame once it is due
+            timeout = max(0.0, next_due - time.perf_counter()) + frame_interval if realtime else None
+            slot = _take_slot(free_slots, stop_event, timeout)
+            if slot is None:
+                if stop_event.is_set() or not video_cap.grab():
+                    break
+                with dropped.get_lock():
+                    dropped.value += 1
+            else:
+                view = ring.slot(slot)
+                ret, frame = video_cap.read(view)
+                if not ret:
+                    free_slots.put(slot)
+                    break
+                if not np.may_share_memory(frame, view):
+                    # The decoder allocated its own buffer (e.g. a format conversion)
+                    if frame.shape != view.shape:
+                        free_slots.put(slot)
+                        ready.put(("error", f"Frame size changed to {frame.shape} at frame {index}", None))
+                        return
+                    np.copyto(view, frame)
+                ready.put(("frame", index, slot))
+            index += 1
+
+            if realtime:
+                next_due += frame_interval
+                delay = next_due - time.perf_counter()
+                if delay > 0:
+                    stop_event.wait(delay)
+                elif delay < -frame_interval:
+                    next_due = time.perf_counter()
+        ready.put(("end", index, None))
+    except Exception as e:
+        ready.put(("error", str(e), None))
+    finally:
+        video_cap.release()
+        ring.close()
+
+
+class SharedMemoryDecoder:
+    """
+    Decodes a video in a separate process into a SharedFrameRing
+
+    frames() yields (index, slot, frame) where `frame` is a view of the slot;
+    hand the slot back with release(slot) once nothing reads the view any more.
+    When every slot is in use the decoder skips frames in `realtime` mode
+    (counted in frames_dropped) and waits otherwise.
+    """
+
+    def __init__(self, video_path, shape, start_frame=0, end_frame=None, slots=DEFAULT_SLOTS, realtime=True):
+        self.video_path = video_path
+        self.start_frame = start_frame
+        self.error = None
+        self.ring = SharedFrameRing(slots, shape)
+
+        # Spawn gives the decoder a clean interpreter (no forked Tk or torch state)
+        context = multiprocessing.get_context("spawn")
+        self._free_slots = context.Queue()
+        for slot in range(slots):
+            self._free_slots.put(slot)
+        self._ready = context.Queue()
+        self._stop_event = context.Event()
+        self._dropped = context.Value("i", 0)
+        self._closed = False
+        self._process = context.Process(
+            target=decode_worker, name="shared-decoder",
+            args=(video_path, self.ring.spec(), start_frame, end_frame, realtime,
+                  self._free_slots, self._ready, self._stop_event, self._dropped),
+            daemon=True)
+
+    @property
+    def frames_dropped(self):
+        return self._dropped.value
+
+    def start(self):
+        self._process.start()
+        return self
+
+    def frames(self):
+        """Yield (index, slot, frame view) until the video ends, fails or stop() is called"""
+        exited = False
+        while True:
+            try:
+                kind, value, slot = self._ready.get(timeout=POLL_INTERVAL_S)
+            except queue.Empty:
+                if exited:
+                    if self._process.exitcode not in (0, None):
+                        self.error = f"decoder exited with code {self._process.exitcode}"
+                    return
+                # One more poll after the process is gone picks up anything still in flight
+                exited = not self._process.is_alive()
+                continue
+
+            if kind == "frame":
+                yield value, slot, self.ring.slot(slot)
+            else:
+                if kind == "error":
+                    self.error = value
+                return
+
+    def release(self, slot):
+        """Hand a slot back to the decoder"""
+        if not self._closed:
+            self._free_slots.put(slot)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def close(self, timeout=5.0):
+        """Stop the decoder process and free the ring; views must no longer be in use"""
+        if self._closed:
+            return
+        self._closed = True
+        self.stop()
+        if self._process.pid is not None:
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join(1.0)
+        self.ring.close()
@@ -0,0 +1,145 @@
+"""
+Tiled (sliced) inference for high-resolution images
+Cuts the image into overlapping tiles at the training image size, runs the
+tiles as batches, maps boxes back to full-image coordinates and merges
+duplicates across tile borders
+"""
+
+import numpy as np
+
+from annotator import DEFAULT_TABLE, Detections, extract_detections
+from tracker import box_iou
+
+DEFAULT_TILE_SIZE = 416  # Matches IMAGE_SIZE in train_yolo.py
+DEFAULT_OVERLAP = 0.2
+DEFAULT_TILE_BATCH = 8
+MERGE_METHODS = ("nms", "wbf")
+
+
+def tile_origins(width, height, tile_size, overlap):
+    """Top-left corners of overlapping tiles covering the image; the last row/column is edge aligned"""
+    stride = max(1, int(tile_size * (1.0 - overlap)))
+
+    def axis(length):
+        if length <= tile_size:
+            return [0]
+        starts = list(range(0, length - tile_size, stride))
+        starts.append(length - tile_size)
+        return starts
+
+    return [(x, y) for y in axis(height) for x in axis(width)]
+
+
+def box_ios(boxes_a, boxes_b):
+    """Pairwise intersection over the smaller box; matches a cut-off partial box to its full box"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).clip(0).prod(axis=1)
+    area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).clip(0).prod(axis=1)
+    return intersection / np.maximum(np.minimum(area_a[:, None], area_b[None, :]), 1e-9)
+
+
+def merge_boxes(xyxy, conf, cls, threshold=0.5, method="nms", metric="ios"):
+    """
+    Class-aware greedy merge of overlapping boxes
+
+    nms keeps the highest-confidence box of each cluster; wbf replaces it with the
+    confidence-weighted average of the cluster. Returns (xyxy, conf, cls).
+    """
+    if method not in MERGE_METHODS:
+        raise ValueError(f"Unknown merge method: {method}")
+    if len(xyxy) == 0:
+        return xyxy, conf, cls
+
+    overlap = box_ios(xyxy, xyxy) if metric == "ios" else box_iou(xyxy, xyxy)
+    same_class = cls[:, None] == cls[None, :]
+    clusters = (overlap >= threshold) & same_class
+
+    order = np.argsort(-conf, kind="stable")
+    suppressed = np.zeros(len(xyxy), dtype=bool)
+    merged_boxes, merged_conf, merged_cls = [], [], []
+
+    for index in order:
+        if suppressed[index]:
+            continue
+        members = clusters[index] & ~suppressed
+        members[index] = True
+        suppressed |= members
+
+        if method == "wbf":
+            weights = conf[members]
+            merged_boxes.append((xyxy[members] * weights[:, None]).sum(axis=0) / weights.sum())
+        else:
+            merged_boxes.append(xyxy[index])
+        merged_conf.append(conf[index])
+        merged_cls.append(cls[index])
+
+    return (np.asarray(merged_boxes, dtype=np.float32), np.asarray(merged_conf, dtype=np.float32),
+            np.asarray(merged_cls, dtype=np.int64))
+
+
+class TiledDetector:
+    """
+    Runs a YOLO model over overlapping tiles of a large image
+
+    With `include_full_image` the downscaled whole image is detected too, so
+    animals larger than a tile are still found.
+    """
+
+    def __init__(self, model, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_OVERLAP,
+                 max_batch=DEFAULT_TILE_BATCH, merge_method="nms", merge_threshold=0.5,
+                 include_full_image=True, table=DEFAULT_TABLE, **predict_args):
+        if not 0.0 <= overlap < 1.0:
+            raise ValueError("overlap must be in [0, 1)")
+        self.model = model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_batch = max(1, max_batch)
+        self.merge_method = merge_method
+        self.merge_threshold = merge_threshold
+        self.include_full_image = include_full_image
+        self.table = table
+        self.predict_args = predict_args
+
+    def params(self):
+        """Settings that change the result, e.g. for cache keys"""
+        return {"tile_size": self.tile_size, "overlap": self.overlap, "merge": self.merge_method,
+                "merge_threshold": self.merge_threshold, "full_image": self.include_full_image,
+                **self.predict_args}
+
+    def _predict(self, images):
+        return self.model.predict(images, imgsz=self.tile_size, verbose=False, **self.predict_args)
+
+    def detect(self, image):
+        """Detect on one image and return merged full-image Detections"""
+        height, width = image.shape[:2]
+        origins = tile_origins(width, height, self.tile_size, self.overlap)
+
+        boxes, scores, classes = [], [], []
+        for start in range(0, len(origins), self.max_batch):
+            chunk = origins[start:start + self.max_batch]
+            tiles = [image[y:y + self.tile_size, x:x + self.tile_size] for x, y in chunk]
+            for (x, y), result in zip(chunk, self._predict(tiles)):
+                detections = extract_detections(result, self.table)
+                if len(detections):
+                    boxes.append(detections.xyxy + np.array([x, y, x, y], dtype=np.float32))
+                    scores.append(detections.conf)
+                    classes.append(detections.cls)
+
+        if self.include_full_image and len(origins) > 1:
+            detections = extract_detections(self._predict([image])[0], self.table)
+            if len(detections):
+                boxes.append(detections.xyxy)
+                scores.append(detections.conf)
+                classes.append(detections.cls)
+
+        if not boxes:
+            return Detections.empty()
+
+        xyxy, conf, cls = merge_boxes(np.concatenate(boxes), np.concatenate(scores),
+                                      np.concatenate(classes), self.merge_threshold, self.merge_method)
+        np.clip(xyxy, 0, [width, height, width, height], out=xyxy)
+        return Detections(xyxy, conf, cls, self.table.is_carnivorous(cls))
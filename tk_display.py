@@ -0,0 +1,138 @@
+"""
+Tk canvas display for OpenCV frames
+Keeps one canvas image item and PhotoImage per canvas and updates them in place,
+coalescing updates so only the latest frame is drawn
+"""
+
+import threading
+import tkinter as tk
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+
+class CanvasDisplay:
+    """Shows BGR frames on a Tk canvas, scaled to fit and centered"""
+
+    def __init__(self, canvas, metrics=None):
+        self.canvas = canvas
+        self.metrics = metrics
+        self.frames_submitted = 0
+        self.frames_shown = 0
+
+        self._photo = None
+        self._item = None
+        self._canvas_size = None
+        self._layout_key = None
+        self._layout = None
+        self._resized = None
+        self._rgb = None
+        self._last_image = None
+
+        self._lock = threading.Lock()
+        self._pending = None
+        self._scheduled = False
+
+        canvas.bind("<Configure>", self._on_configure, add="+")
+
+    @property
+    def frames_skipped(self):
+        return self.frames_submitted - self.frames_shown
+
+    def submit(self, image):
+        """Queue a frame for display; safe to call from worker threads"""
+        with self._lock:
+            self.frames_submitted += 1
+            self._pending = image
+            if self._scheduled:
+                # A flush is already queued and will pick up this newer frame
+                return
+            self._scheduled = True
+        self.canvas.after(0, self._flush)
+
+    def _flush(self):
+        with self._lock:
+            image = self._pending
+            self._pending = None
+            self._scheduled = False
+        if image is not None:
+            if self.metrics is not None:
+                with self.metrics.time("display"):
+                    self.show(image)
+            else:
+                self.show(image)
+            self.frames_shown += 1
+
+    def show(self, image):
+        """Draw a frame immediately; must be called on the Tk thread"""
+        try:
+            self._last_image = image
+            canvas_width, canvas_height = self._get_canvas_size()
+            if canvas_width <= 1 or canvas_height <= 1:
+                return
+
+            new_width, new_height, center = self._get_layout(image.shape[:2], canvas_width, canvas_height)
+
+            if (new_width, new_height) != (image.shape[1], image.shape[0]):
+                self._resized = _reuse(self._resized, (new_height, new_width) + image.shape[2:], image.dtype)
+                cv2.resize(image, (new_width, new_height), dst=self._resized, interpolation=cv2.INTER_AREA)
+                image = self._resized
+
+            self._rgb = _reuse(self._rgb, image.shape, image.dtype)
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._rgb)
+            pil_image = Image.fromarray(self._rgb)
+
+            if self._photo is not None and (self._photo.width(), self._photo.height()) == (new_width, new_height):
+                # Same size: update the existing photo in place
+                self._photo.paste(pil_image)
+            else:
+                self._photo = ImageTk.PhotoImage(pil_image)
+                if self._item is not None:
+                    self.canvas.itemconfig(self._item, image=self._photo)
+
+            if self._item is None:
+                self.canvas.delete("all")
+                self._item = self.canvas.create_image(*center, image=self._photo, anchor=tk.CENTER)
+            else:
+                self.canvas.coords(self._item, *center)
+
+        except Exception as e:
+            print(f"Error displaying image: {str(e)}")
+
+    def clear(self):
+        """Remove the displayed frame"""
+        with self._lock:
+            self._pending = None
+        self.canvas.delete("all")
+        self._item = None
+        self._photo = None
+        self._last_image = None
+
+    def _get_canvas_size(self):
+        if self._canvas_size is None:
+            self._canvas_size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        return self._canvas_size
+
+    def _get_layout(self, image_size, canvas_width, canvas_height):
+        """Return the scaled size and center point, cached until the canvas or frame size changes"""
+        key = (image_size, canvas_width, canvas_height)
+        if key != self._layout_key:
+            height, width = image_size
+            scale = min(canvas_width / width, canvas_height / height, 1.0)
+            self._layout = (max(1, int(width * scale)), max(1, int(height * scale)),
+                            (canvas_width // 2, canvas_height // 2))
+            self._layout_key = key
+        return self._layout
+
+    def _on_configure(self, event):
+        self._canvas_size = (event.width, event.height)
+        if self._last_image is not None:
+            self.show(self._last_image)
+
+
+def _reuse(buffer, shape, dtype):
+    """Return `buffer` if it matches shape and dtype, otherwise a new array"""
+    if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+        return np.empty(shape, dtype=dtype)
+    return buffer
@@ -0,0 +1,194 @@
+"""
+Lightweight IoU tracker
+Propagates boxes between detector runs with a constant-velocity model and keeps
+a stable track ID per animal, so the detector can run only every N frames
+"""
+
+import numpy as np
+
+from annotator import Detections
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU between two (N, 4) and (M, 4) xyxy arrays"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+
+    area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).clip(0).prod(axis=1)
+    area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).clip(0).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+
+class IoUTracker:
+    """
+    Greedy IoU matching with an alpha-beta (constant velocity) box filter
+
+    update()  - feed fresh detections from the model
+    predict() - advance all tracks one frame without running the model
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=15, alpha=0.6, beta=0.3,
+                 confidence_decay=0.95, min_hits=2):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.alpha = alpha
+        self.beta = beta
+        self.confidence_decay = confidence_decay
+        self.min_hits = min_hits
+        self.reset()
+
+    def reset(self):
+        self._next_id = 1
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.velocity = np.zeros((0, 4), dtype=np.float32)
+        self.conf = np.zeros(0, dtype=np.float32)
+        self.cls = np.zeros(0, dtype=np.int64)
+        self.carnivorous = np.zeros(0, dtype=bool)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.missed = np.zeros(0, dtype=np.int64)
+        self.frames_since_update = 0
+
+        # Distinct animals that were confirmed (seen on at least min_hits detector runs)
+        self.confirmed_ids = set()
+        self.confirmed_carnivore_ids = set()
+
+    @property
+    def confidence(self):
+        """Mean confidence of live tracks; 0 when nothing is tracked"""
+        return float(self.conf.mean()) if len(self.conf) else 0.0
+
+    @property
+    def distinct_animals(self):
+        return len(self.confirmed_ids)
+
+    @property
+    def distinct_carnivores(self):
+        return len(self.confirmed_carnivore_ids)
+
+    def _advance(self):
+        """Move every track one frame along its velocity"""
+        self.boxes = self.boxes + self.velocity
+        self.conf = self.conf * self.confidence_decay
+
+    def predict(self):
+        """Propagate tracks for a frame the detector skipped"""
+        self._advance()
+        self.frames_since_update += 1
+        return self._current()
+
+    def update(self, detections):
+        """Match new detections to tracks and return them with track IDs"""
+        steps = self.frames_since_update + 1
+        self.frames_since_update = 0
+
+        # Predict to the current frame before matching
+        predicted = self.boxes + self.velocity
+        iou = box_iou(predicted, detections.xyxy)
+        # Never match across classes
+        iou[self.cls[:, None] != detections.cls[None, :]] = 0.0
+
+        track_match = np.full(len(self.ids), -1, dtype=np.int64)
+        det_matched = np.zeros(len(detections), dtype=bool)
+        if iou.size:
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                t, d = np.unravel_index(flat, iou.shape)
+                if iou[t, d] < self.iou_threshold:
+                    break
+                if track_match[t] < 0 and not det_matched[d]:
+                    track_match[t] = d
+                    det_matched[d] = True
+
+        # Matched tracks: alpha-beta correction of position and per-frame velocity
+        matched = track_match >= 0
+        if matched.any():
+            residual = detections.xyxy[track_match[matched]] - predicted[matched]
+            self.velocity[matched] += self.beta * residual / steps
+            predicted[matched] += self.alpha * residual
+            self.conf[matched] = detections.conf[track_match[matched]]
+            self.hits[matched] += 1
+            self.missed[matched] = 0
+
+        # Unmatched tracks coast along their velocity
+        unmatched = ~matched
+        self.boxes = predicted
+        self.conf[unmatched] *= self.confidence_decay
+        self.missed[unmatched] += 1
+
+        # New tracks for unmatched detections
+        new = ~det_matched
+        count = int(new.sum())
+        if count:
+            self.boxes = np.concatenate([self.boxes, detections.xyxy[new]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((count, 4), dtype=np.float32)])
+            self.conf = np.concatenate([self.conf, detections.conf[new]])
+            self.cls = np.concatenate([self.cls, detections.cls[new]])
+            self.carnivorous = np.concatenate([self.carnivorous, detections.carnivorous[new]])
+            self.ids = np.concatenate([self.ids, np.arange(self._next_id, self._next_id + count)])
+            self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int64)])
+            self.missed = np.concatenate([self.missed, np.zeros(count, dtype=np.int64)])
+            self._next_id += count
+
+        # Drop tracks that have been lost for too long
+        keep = self.missed <= self.max_missed
+        for name in ("boxes", "velocity", "conf", "cls", "carnivorous", "ids", "hits", "missed"):
+            setattr(self, name, getattr(self, name)[keep])
+
+        confirmed = self.hits >= self.min_hits
+        self.confirmed_ids.update(self.ids[confirmed].tolist())
+        self.confirmed_carnivore_ids.update(self.ids[confirmed & self.carnivorous].tolist())
+
+        return self._current()
+
+    def _current(self):
+        """Tracks seen on the last detector run, as Detections with track IDs"""
+        visible = self.missed == 0
+        return Detections(self.boxes[visible].copy(), self.conf[visible].copy(),
+                          self.cls[visible].copy(), self.carnivorous[visible].copy(),
+                          track_ids=self.ids[visible].copy())
+
+
+class TrackedDetector:
+    """
+    Runs the detector every `interval` frames and tracks boxes in between
+
+    The detector also runs early when the tracker's confidence falls below
+    `min_confidence`, e.g. after animals leave or new ones enter the scene.
+    """
+
+    def __init__(self, detect, interval=1, min_confidence=0.3, tracker=None):
+        self.detect = detect
+        self.interval = max(1, interval)
+        self.min_confidence = min_confidence
+        self.tracker = tracker or IoUTracker()
+        self.frames = 0
+        self.detector_runs = 0
+        self._since_detect = None
+
+    def reset(self):
+        self.tracker.reset()
+        self.frames = 0
+        self.detector_runs = 0
+        self._since_detect = None
+
+    def should_detect(self):
+        if self._since_detect is None or self._since_detect + 1 >= self.interval:
+            return True
+        tracker = self.tracker
+        return len(tracker.ids) > 0 and tracker.confidence < self.min_confidence
+
+    def process(self, frame):
+        """Return tracked detections for the next frame"""
+        self.frames += 1
+        if self.should_detect():
+            self.detector_runs += 1
+            self._since_detect = 0
+            return self.tracker.update(self.detect(frame))
+
+        self._since_detect += 1
+        return self.tracker.predict()
@@ -0,0 +1,261 @@
+"""
+CPU training throughput autotuner
+Runs short timed training probes over batch size, dataloader workers, torch
+threads and image size, each in a fresh process, and writes the fastest
+configuration that fits the memory budget for train_yolo.py to use
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmark import peak_rss_mb
+from dataset_config import DEFAULT_DATA_CONFIG, load_data_config, write_resolved_config
+
+DEFAULT_TUNED_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "train_autotune.json")
+DEFAULT_CACHE_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset_cache", "data.yaml")
+DEFAULT_WARMUP_BATCHES = 3
+DEFAULT_MEASURE_BATCHES = 10
+
+
+class _ProbeDone(Exception):
+    """Raised from a training callback once enough batches were timed"""
+
+
+def live_children_rss_mb():
+    """Current total RSS of this process's live children (dataloader workers), or None if unavailable"""
+    try:
+        import psutil  # type: ignore
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        total = 0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue  # Exited while we looked
+        return total / (1024 * 1024)
+
+    if not os.path.isdir("/proc"):
+        return None
+    pid = os.getpid()
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The command name may contain spaces; fields after it are fixed
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            if ppid != pid:
+                continue
+            with open(f"/proc/{entry}/statm", "r") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            continue
+    return total / (1024 * 1024)
+
+
+def children_peak_rss_mb():
+    """Largest peak RSS of finished child processes (dataloader workers), where available"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+    except ImportError:
+        return 0.0
+
+
+def run_probe(probe):
+    """Probe process: train for a few batches with one configuration and time them"""
+    threads = probe["threads"]
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+
+    import torch  # type: ignore
+    from ultralytics import YOLO  # type: ignore
+
+    torch.set_num_threads(threads)
+
+    state = {"batches": 0, "start": None, "end": None, "workers": probe["workers"], "children_mb": None}
+    total_batches = probe["warmup_batches"] + probe["measure_batches"]
+
+    def on_train_start(trainer):
+        # Some Ultralytics versions force workers=0 on CPU; record what was actually used
+        state["workers"] = trainer.args.workers
+
+    def on_train_batch_end(trainer):
+        state["batches"] += 1
+        # Sampled while the dataloader workers are alive: once _ProbeDone abandons the
+        # loader they are never waited on, so RUSAGE_CHILDREN would not count them
+        children_mb = live_children_rss_mb()
+        if children_mb is not None:
+            state["children_mb"] = max(state["children_mb"] or 0.0, children_mb)
+        if state["batches"] == probe["warmup_batches"]:
+            state["start"] = time.perf_counter()
+        elif state["batches"] >= total_batches:
+            state["end"] = time.perf_counter()
+            raise _ProbeDone()
+
+    model = YOLO(probe["model"])
+    model.add_callback("on_train_start", on_train_start)
+    model.add_callback("on_train_batch_end", on_train_batch_end)
+
+    train_args = dict(data=probe["data"], epochs=1, imgsz=probe["imgsz"], batch=probe["batch"],
+                      workers=probe["workers"], device="cpu", amp=False, val=False, plots=False,
+                      save=False, verbose=False, project=probe["project"], name="probe", exist_ok=True)
+    if probe["cached"]:
+        from cached_training import CachedDetectionTrainer
+        train_args["trainer"] = CachedDetectionTrainer
+
+    error = None
+    try:
+        model.train(**train_args)
+    except _ProbeDone:
+        pass
+    except Exception as e:
+        error = str(e)
+
+    result = {key: probe[key] for key in ("batch", "workers", "threads", "imgsz")}
+    result["effective_workers"] = state["workers"]
+    # Dataloader workers are separate processes; without live samples, count each at the largest child's peak
+    children_mb = state["children_mb"]
+    if children_mb is None:
+        children_mb = children_peak_rss_mb() * max(0, state["workers"])
+    result["peak_rss_mb"] = round((peak_rss_mb() or 0.0) + children_mb, 1)
+    if state["end"] is not None:
+        elapsed = state["end"] - state["start"]
+        result["images_per_s"] = round(probe["measure_batches"] * probe["batch"] / elapsed, 2)
+    else:
+        result["images_per_s"] = None
+        result["error"] = error or "training ended before enough batches were timed (dataset too small?)"
+    return result
+
+
+def build_probes(args, data, cached, project):
+    probes = []
+    for batch, workers, threads, imgsz in itertools.product(args.batch_sizes, args.workers,
+                                                             args.threads, args.imgsz):
+        probes.append({"model": args.model, "data": data, "cached": cached, "project": project,
+                       "batch": batch, "workers": workers, "threads": threads, "imgsz": imgsz,
+                       "warmup_batches": args.warmup_batches, "measure_batches": args.measure_batches})
+    return probes
+
+
+def select_best(results, memory_budget_mb):
+    """Fastest probe within the memory budget (None if nothing fits)"""
+    feasible = [r for r in results if r["images_per_s"] and r["peak_rss_mb"] <= memory_budget_mb]
+    return max(feasible, key=lambda r: r["images_per_s"]) if feasible else None
+
+
+def default_memory_budget_mb():
+    """80% of physical memory, or 4 GB if it can't be determined"""
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        return int(total * 0.8 / (1024 * 1024))
+    except (AttributeError, ValueError, OSError):
+        try:
+            import psutil  # type: ignore
+            return int(psutil.virtual_memory().total * 0.8 / (1024 * 1024))
+        except ImportError:
+            return 4096
+
+
+def load_tuned_config(path=DEFAULT_TUNED_CONFIG):
+    """Settings written by the autotuner, or None if it hasn't been run on this machine"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            tuned = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if tuned.get("cpu_count") != multiprocessing.cpu_count():
+        print(f"Ignoring {path}: it was tuned on a machine with {tuned.get('cpu_count')} cores")
+        return None
+    return tuned
+
+
+def parse_args(argv=None):
+    cores = multiprocessing.cpu_count()
+    parser = argparse.ArgumentParser(description="Find the fastest CPU training configuration")
+    parser.add_argument("--model", default="yolov8n.pt", help="Model to train")
+    parser.add_argument("--data", default=DEFAULT_DATA_CONFIG, help="Dataset YAML")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Probe the raw dataset even if the preprocessed cache exists")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[2, 4, 8, 16])
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({0, min(2, cores), min(4, cores)}))
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({max(1, cores // 2), cores}))
+    parser.add_argument("--imgsz", type=int, nargs="+", default=[416],
+                        help="Image sizes to probe (smaller is faster but less accurate)")
+    parser.add_argument("--warmup-batches", type=int, default=DEFAULT_WARMUP_BATCHES)
+    parser.add_argument("--measure-batches", type=int, default=DEFAULT_MEASURE_BATCHES)
+    parser.add_argument("--memory-budget-mb", type=int, default=default_memory_budget_mb(),
+                        help="Peak memory allowed for training (default: 80%% of RAM)")
+    parser.add_argument("--output", default=DEFAULT_TUNED_CONFIG, help="Where to write the chosen config")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cached = not args.no_cache and os.path.exists(DEFAULT_CACHE_CONFIG)
+
+    with tempfile.TemporaryDirectory(prefix="animal_autotune_") as work_dir:
+        if cached:
+            data = DEFAULT_CACHE_CONFIG
+        else:
+            data = write_resolved_config(load_data_config(args.data), os.path.join(work_dir, "data.yaml"))
+        probes = build_probes(args, data, cached, os.path.join(work_dir, "runs"))
+        print(f"Running {len(probes)} training probe(s) on {'the dataset cache' if cached else data}...")
+
+        results = []
+        # A fresh process per probe isolates thread settings and peak memory
+        context = multiprocessing.get_context("spawn")
+        for i, probe in enumerate(probes, 1):
+            label = f"batch {probe['batch']}, workers {probe['workers']}, threads {probe['threads']}, imgsz {probe['imgsz']}"
+            print(f"[{i}/{len(probes)}] {label}")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_probe, probe).result()
+            results.append(result)
+            if result["images_per_s"] is None:
+                print(f"    failed: {result['error']}")
+            else:
+                print(f"    {result['images_per_s']:.1f} images/s, peak {result['peak_rss_mb']:.0f} MB")
+
+    best = select_best(results, args.memory_budget_mb)
+    if best is None:
+        print(f"No configuration fit the {args.memory_budget_mb} MB memory budget")
+        return 1
+
+    tuned = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cpu_count": multiprocessing.cpu_count(),
+        "memory_budget_mb": args.memory_budget_mb,
+        "batch": best["batch"],
+        "workers": best["effective_workers"],
+        "threads": best["threads"],
+        "imgsz": best["imgsz"],
+        "images_per_s": best["images_per_s"],
+        "peak_rss_mb": best["peak_rss_mb"],
+        "probes": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(tuned, f, indent=2)
+
+    print("\n" + "=" * 60)
+    print(f"Best: batch {best['batch']}, workers {best['effective_workers']}, threads {best['threads']}, "
+          f"imgsz {best['imgsz']} -> {best['images_per_s']:.1f} images/s, peak {best['peak_rss_mb']:.0f} MB")
+    print(f"Written to {args.output} (used by train_yolo.py)")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,30 +3,60 @@ CPU-Optimized YOLOv8 Animal Detection Training Script
 Specifically designed for systems without CUDA GPU support
 """
 
-from ultralytics import YOLO # type: ignore
 import os
+import shutil
+import tempfile
 import yaml # type: ignore
-import torch # type: ignore
 from pathlib import Path
 import multiprocessing
 
-def train_yolo_model_cpu_optimized():
-    """Train YOLOv8 model optimized for CPU"""
+def train_yolo_model_cpu_optimized(distributed=None):
+    """Train YOLOv8 model optimized for CPU
+    
+    With `distributed` (keyword arguments for distributed_training.train_distributed,
+    e.g. nproc_per_node, nnodes, node_rank, master_addr) training runs in several
+    processes and BATCH_SIZE is per process.
+    """
+    
+    # Imported here, not at the top: distributed workers are spawned and re-import
+    # this script, and Ultralytics must not see it before each worker sets RANK
+    import torch # type: ignore
+    from ultralytics import YOLO # type: ignore
+    
+    from dataset_config import DEFAULT_DATA_CONFIG, load_data_config, write_resolved_config
     
     # CPU-Optimized Configuration
-    DATA_CONFIG = r"C:\Users\Lutifah\Desktop\INTERSHIP\Animal_Detection_YOLOV8-main\animal_data.yaml"
+    DATA_CONFIG = DEFAULT_DATA_CONFIG  # animal_data.yaml next to this script
     MODEL_SIZE = "yolov8n.pt"  # Use nano model for faster CPU training
     EPOCHS = 5  # Reduced epochs for CPU
     IMAGE_SIZE = 416  # Smaller image size for faster processing
     BATCH_SIZE = 2  # Small batch size for CPU
     
+    # Decode/resize images once into memory-mapped shards instead of every epoch,
+    # with the same long-side resize Ultralytics applies when it loads a JPEG
+    from dataset_cache import DEFAULT_CACHE_DIR
+    USE_DATASET_CACHE = True
+    DATASET_CACHE_DIR = DEFAULT_CACHE_DIR  # The cache menu option 3 prepares
+    
     # CPU optimization settings
     num_workers = min(4, multiprocessing.cpu_count())  # Limit workers
+    num_threads = torch.get_num_threads()
+    
+    # Measured settings from train_autotune.py replace the defaults above
+    from train_autotune import load_tuned_config
+    tuned = load_tuned_config()
+    if tuned is not None:
+        BATCH_SIZE = tuned["batch"]
+        IMAGE_SIZE = tuned["imgsz"]
+        num_workers = tuned["workers"]
+        num_threads = tuned["threads"]
+        torch.set_num_threads(num_threads)
     
     # Project and run names
     PROJECT_NAME = "animal_detection_cpu"
     RUN_NAME = "yolov8_animals_cpu"
     
+    work_dir = tempfile.mkdtemp(prefix="animal_train_")
     try:
         # Check system capabilities
         print("="*60)
@@ -48,6 +78,10 @@ def train_yolo_model_cpu_optimized():
             print("Please make sure the data.yaml file is in the correct location.")
             return
         
+        # The committed dataset root is machine specific: give Ultralytics (and every
+        # distributed rank) a copy with the root resolved on this machine
+        resolved_data = write_resolved_config(load_data_config(DATA_CONFIG), os.path.join(work_dir, "data.yaml"))
+        
         # Display training configuration
         print("\\n" + "="*60)
         print("CPU-OPTIMIZED TRAINING CONFIGURATION")
@@ -58,6 +92,17 @@ def train_yolo_model_cpu_optimized():
         print(f"Image Size: {IMAGE_SIZE} (optimized for CPU)")
         print(f"Batch Size: {BATCH_SIZE} (CPU optimized)")
         print(f"Workers: {num_workers}")
+        if distributed is not None:
+            from distributed_training import default_workers_per_node
+            processes = distributed.get("nproc_per_node") or default_workers_per_node()
+            world_size = processes * distributed.get("nnodes", 1)
+            print(f"Distributed: {processes} process(es) on this machine, world size {world_size}, "
+                  f"effective batch {BATCH_SIZE * world_size}")
+        else:
+            print(f"Torch Threads: {num_threads}")
+        if tuned is not None:
+            print(f"Settings: autotuned on {tuned['created']} ({tuned['images_per_s']:.1f} images/s)")
+        print(f"Dataset Cache: {DATASET_CACHE_DIR if USE_DATASET_CACHE else 'disabled'}")
         print(f"Device: CPU")
         print(f"Project: {PROJECT_NAME}")
         print(f"Run Name: {RUN_NAME}")
@@ -84,8 +129,7 @@ def train_yolo_model_cpu_optimized():
         print("\\nStarting CPU-optimized training...")
         print("Note: This will take significantly longer than GPU training.")
         
-        results = model.train(
-            data=DATA_CONFIG,
+        train_args = dict(
             epochs=EPOCHS,
             imgsz=IMAGE_SIZE,
             batch=BATCH_SIZE,
@@ -109,13 +153,47 @@ def train_yolo_model_cpu_optimized():
             close_mosaic=5,  # Disable mosaic augmentation in last epochs
         )
         
+        train_data = resolved_data
+        if USE_DATASET_CACHE:
+            from dataset_cache import prepare_dataset_cache
+            
+            print("\nUpdating preprocessed dataset cache (only changed images are decoded)...")
+            train_data, counts = prepare_dataset_cache(DATA_CONFIG, DATASET_CACHE_DIR, IMAGE_SIZE)
+            for split_counts in counts:
+                print(f"  {split_counts['split']}: {split_counts['processed']} processed, "
+                      f"{split_counts['reused']} reused")
+        
+        if distributed is not None:
+            from distributed_training import print_summary, train_distributed
+            
+            summary = train_distributed(MODEL_SIZE, train_data, cached=USE_DATASET_CACHE,
+                                        **distributed, **train_args)
+            print_summary(summary)
+            if summary["errors"]:
+                print(f"Error during training: {'; '.join(summary['errors'])}")
+                return None
+            if summary["save_dir"] is None:
+                # Only node 0 keeps the weights and validates
+                print("\nThis machine's share of the training is done; results are on machine 0.")
+                return summary
+            results = summary
+            save_dir = summary["save_dir"]
+            model = YOLO(os.path.join(save_dir, "weights", "best.pt"))
+        elif USE_DATASET_CACHE:
+            from cached_training import train_from_cache
+            results = train_from_cache(model, train_data, **train_args)
+            save_dir = results.save_dir
+        else:
+            results = model.train(data=train_data, **train_args)
+            save_dir = results.save_dir
+        
         print("\\nTraining completed successfully!")
-        print(f"Best model saved at: {results.save_dir}/weights/best.pt")
-        print(f"Last model saved at: {results.save_dir}/weights/last.pt")
+        print(f"Best model saved at: {save_dir}/weights/best.pt")
+        print(f"Last model saved at: {save_dir}/weights/last.pt")
         
         # Validate the model
         print("\\nValidating model...")
-        metrics = model.val()
+        metrics = model.val(data=resolved_data)
         print(f"Validation mAP50: {metrics.box.map50:.4f}")
         print(f"Validation mAP50-95: {metrics.box.map:.4f}")
         
@@ -127,6 +205,7 @@ def train_yolo_model_cpu_optimized():
         print("• CPU inference will also be slower than GPU")
         print("• Consider using the model on smaller images for faster detection")
         print("• The nano model balances speed and accuracy for CPU use")
+        print("• Use option 5 to export ONNX/OpenVINO INT8 models for faster CPU inference")
         print("="*60)
         
         return results
@@ -134,12 +213,16 @@ def train_yolo_model_cpu_optimized():
     except Exception as e:
         print(f"Error during training: {str(e)}")
         return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 def quick_cpu_test():
     """Quick test to verify CPU training setup"""
     
     print("Running quick CPU compatibility test...")
     
+    from ultralytics import YOLO # type: ignore
+    
     try:
         # Test YOLO loading
         model = YOLO("yolov8n.pt")
@@ -149,10 +232,21 @@ def quick_cpu_test():
         device = 'cpu'
         print(f" Using device: {device}")
         
-        # Test data config
-        data_config = r"C:\\Users\\Lutifah\\Desktop\\INTERSHIP\\Animal_Detection_YOLOV8-main\\animal_data.yaml"
+        # Test data config (the YAML next to this script) and dataset integrity
+        from dataset_config import DEFAULT_DATA_CONFIG, load_data_config
+        data_config = DEFAULT_DATA_CONFIG
         if os.path.exists(data_config):
             print(" Data configuration file found")
+            from dataset_index import dataset_report, index_dataset
+            
+            # Incremental: only files changed since the last check are re-examined
+            index, rescanned = index_dataset(data_config)
+            report = dataset_report(index, load_data_config(data_config)["names"])
+            for split, summary in report.items():
+                status = f"{len(summary['errors'])} error(s)" if summary["errors"] else "OK"
+                print(f" {split}: {summary['images']} images, {summary['instances']} boxes - {status}")
+            if any(summary["errors"] for summary in report.values()):
+                print(" Run 'python dataset_index.py' for the full integrity report")
         else:
             print("Data configuration file not found")
             print(f"Expected location: {data_config}")
@@ -170,6 +264,105 @@ def quick_cpu_test():
     except Exception as e:
         print(f" Error in compatibility test: {str(e)}")
 
+def distributed_training():
+    """Train with several processes on this machine, optionally joined by other machines"""
+    
+    from distributed_training import DEFAULT_MASTER_ADDR, DEFAULT_MASTER_PORT, default_workers_per_node
+    
+    default_processes = default_workers_per_node()
+    processes = input(f"\nTraining processes on this machine [{default_processes}]: ").strip()
+    nnodes = input("Number of machines [1]: ").strip()
+    distributed = {"nproc_per_node": int(processes or default_processes), "nnodes": int(nnodes or 1)}
+    if distributed["nnodes"] > 1:
+        # Every machine runs this with the same address/port and its own index
+        distributed["node_rank"] = int(input("This machine's index (0 = main machine): ").strip() or 0)
+        distributed["master_addr"] = input(f"Main machine address [{DEFAULT_MASTER_ADDR}]: ").strip() or DEFAULT_MASTER_ADDR
+        distributed["master_port"] = int(input(f"Rendezvous port [{DEFAULT_MASTER_PORT}]: ").strip() or DEFAULT_MASTER_PORT)
+    
+    train_yolo_model_cpu_optimized(distributed=distributed)
+
+def autotune_training():
+    """Probe batch size / workers / threads on this machine and save the fastest setup"""
+    
+    from train_autotune import main as autotune_main
+    
+    print("\nEach probe trains for a few batches; the full sweep can take a while.")
+    autotune_main([])
+
+def prepare_training_cache():
+    """Decode and resize the dataset once into the memory-mapped training cache"""
+    
+    from dataset_cache import DEFAULT_CACHE_DIR, DEFAULT_IMAGE_SIZE, prepare_dataset_cache
+    from train_autotune import load_tuned_config
+    
+    # Same directory and size as training (autotuned if available), so option 2 reuses what this builds
+    tuned = load_tuned_config()
+    imgsz = tuned["imgsz"] if tuned is not None else DEFAULT_IMAGE_SIZE
+    
+    try:
+        print("\nPreparing dataset cache (this decodes every changed image once)...")
+        cache_config, counts = prepare_dataset_cache(cache_dir=DEFAULT_CACHE_DIR, imgsz=imgsz)
+        print("\n" + "="*60)
+        print("DATASET CACHE")
+        print("="*60)
+        for split_counts in counts:
+            print(f"{split_counts['split']}: {split_counts['images']} images, "
+                  f"{split_counts['processed']} processed, {split_counts['reused']} reused, "
+                  f"{split_counts['failed']} failed")
+        print(f"Cache data config: {cache_config}")
+        print("="*60)
+    except Exception as e:
+        print(f"Error preparing dataset cache: {str(e)}")
+
+def export_trained_model():
+    """Export trained weights to ONNX/OpenVINO with INT8 calibration"""
+    
+    # Imported here so training does not require onnxruntime/openvino
+    from export_model import export_all
+    
+    weights = input("\nPath to trained weights (e.g. .../weights/best.pt): ").strip().strip('"')
+    if not os.path.exists(weights):
+        print(f"Weights not found: {weights}")
+        return
+    
+    openvino = input("Also export OpenVINO models? (y/n): ").lower().strip() in ['y', 'yes']
+    
+    try:
+        exported = export_all(weights, imgsz=416, int8=True, openvino=openvino)
+        print("\n" + "="*60)
+        print("EXPORTED MODELS")
+        print("="*60)
+        for name, path in exported.items():
+            print(f"{name}: {path}")
+        print("="*60)
+    except Exception as e:
+        print(f"Error during export: {str(e)}")
+
+def compress_trained_model():
+    """Prune trained weights and fine-tune the smaller model with distillation"""
+    
+    try:
+        import torch_pruning  # noqa: F401
+    except ImportError:
+        print("Channel pruning needs torch-pruning: pip install torch-pruning")
+        return
+    
+    from compress_model import DEFAULT_EPOCHS, DEFAULT_SPARSITY, compress, print_report
+    
+    weights = input("\nPath to trained weights (e.g. .../weights/best.pt): ").strip().strip('"')
+    if not os.path.exists(weights):
+        print(f"Weights not found: {weights}")
+        return
+    
+    sparsity = input(f"Fraction of channels to remove [{DEFAULT_SPARSITY}]: ").strip()
+    epochs = input(f"Distillation fine-tuning epochs [{DEFAULT_EPOCHS}]: ").strip()
+    
+    try:
+        report = compress(weights, sparsity=float(sparsity or DEFAULT_SPARSITY), epochs=int(epochs or DEFAULT_EPOCHS))
+        print_report(report)
+    except Exception as e:
+        print(f"Error during compression: {str(e)}")
+
 def main():
     """Main function for CPU-optimized training"""
     
@@ -178,15 +371,30 @@ def main():
     
     print("1. Run compatibility test")
     print("2. Start CPU-optimized training") 
-    print("3. Exit")
+    print("3. Prepare preprocessed dataset cache")
+    print("4. Autotune training throughput for this machine")
+    print("5. Export trained model for CPU inference (ONNX/OpenVINO INT8)")
+    print("6. Start distributed CPU training (several processes/machines)")
+    print("7. Compress trained model (prune + distill)")
+    print("8. Exit")
     
-    choice = input("\\nEnter your choice (1-3): ").strip()
+    choice = input("\\nEnter your choice (1-8): ").strip()
     
     if choice == '1':
         quick_cpu_test()
     elif choice == '2':
         train_yolo_model_cpu_optimized()
     elif choice == '3':
+        prepare_training_cache()
+    elif choice == '4':
+        autotune_training()
+    elif choice == '5':
+        export_trained_model()
+    elif choice == '6':
+        distributed_training()
+    elif choice == '7':
+        compress_trained_model()
+    elif choice == '8':
         print("Goodbye!")
     else:
         print("Invalid choice!")
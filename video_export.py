@@ -0,0 +1,328 @@
+"""
+Annotated video export
+Frames are encoded with cv2.VideoWriter on a dedicated encoder thread fed by a
+bounded queue, so encoding never stalls inference. EventClipWriter keeps a
+ring buffer of recent frames and writes only the segments where animals (or
+only carnivores) are present, with pre-roll and post-roll
+"""
+
+import argparse
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+from metrics import Metrics
+from video_pipeline import BLOCK, DROP_NEWEST, FrameQueue, QueueClosed, source_fps
+
+DEFAULT_FOURCC = "mp4v"
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_PRE_ROLL_S = 2.0
+DEFAULT_POST_ROLL_S = 3.0
+
+# Values of the GUI's export choice
+EXPORT_OFF = "off"
+EXPORT_FULL = "full video"
+EXPORT_ANIMAL_CLIPS = "animal clips"
+EXPORT_CARNIVORE_CLIPS = "carnivore clips"
+EXPORT_MODES = (EXPORT_OFF, EXPORT_FULL, EXPORT_ANIMAL_CLIPS, EXPORT_CARNIVORE_CLIPS)
+
+
+class AnnotatedVideoWriter:
+    """
+    Encodes frames to one video file on a background thread
+
+    write() copies the frame (annotated frames come from a reused buffer pool)
+    and queues it; when the encoder falls `queue_size` frames behind, new frames
+    are dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(self, path, fps, fourcc=DEFAULT_FOURCC, queue_size=DEFAULT_QUEUE_SIZE,
+                 policy=DROP_NEWEST, metrics=None):
+        self.path = path
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.frames_written = 0
+        self.error = None
+
+        self._queue = FrameQueue(queue_size, policy)
+        self._writer = None
+        self._thread = threading.Thread(target=self._encode_loop, name="video-encoder", daemon=True)
+        self._thread.start()
+
+    @property
+    def frames_dropped(self):
+        return self._queue.dropped
+
+    def write(self, frame):
+        """Queue a frame for encoding; returns False once the writer is closed"""
+        dropped_before = self._queue.dropped
+        accepted = self._queue.put(frame.copy())
+        if self._queue.dropped > dropped_before:
+            self.metrics.incr("frames_dropped_encoder", self._queue.dropped - dropped_before)
+        self.metrics.set_gauge("encoder_queue_depth", len(self._queue))
+        return accepted
+
+    def close(self, wait=True):
+        """Finish encoding what is queued and release the file"""
+        self._queue.close()
+        if wait:
+            self._thread.join()
+
+    def _encode_loop(self):
+        try:
+            while True:
+                try:
+                    frame = self._queue.get()
+                except QueueClosed:
+                    break
+
+                if self._writer is None:
+                    # Opened on the first frame, whose size the file must match
+                    height, width = frame.shape[:2]
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self._writer = cv2.VideoWriter(self.path, self.fourcc, self.fps, (width, height))
+                    if not self._writer.isOpened():
+                        raise IOError(f"Could not open video writer for {self.path}")
+
+                with self.metrics.time("encode"):
+                    self._writer.write(frame)
+                self.frames_written += 1
+        except Exception as e:
+            self.error = e
+            print(f"Error encoding video: {str(e)}")
+            self._queue.close()
+            self._queue.clear()
+        finally:
+            if self._writer is not None:
+                self._writer.release()
+
+
+class EventClipWriter:
+    """
+    Writes one clip per event: a stretch of frames with animals present
+
+    The last `pre_roll_s` seconds are kept in a preallocated ring buffer and
+    written at the start of each clip; a clip ends once no event has been seen
+    for `post_roll_s` seconds. With `carnivores_only` only carnivores start or
+    extend a clip.
+    """
+
+    def __init__(self, output_dir, fps, pre_roll_s=DEFAULT_PRE_ROLL_S, post_roll_s=DEFAULT_POST_ROLL_S,
+                 carnivores_only=False, prefix="clip", fourcc=DEFAULT_FOURCC,
+                 queue_size=DEFAULT_QUEUE_SIZE, policy=DROP_NEWEST, metrics=None):
+        self.output_dir = output_dir
+        self.fps = fps
+        self.pre_roll = max(0, int(round(pre_roll_s * fps)))
+        self.post_roll = max(0, int(round(post_roll_s * fps)))
+        self.carnivores_only = carnivores_only
+        self.prefix = prefix
+        self.fourcc = fourcc
+        self.queue_size = queue_size
+        self.policy = policy
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.clips = []  # (path, first frame index, last frame index)
+
+        self._ring = []
+        self._ring_indices = []
+        self._ring_next = 0
+        self._ring_count = 0
+        self._writer = None
+        self._closing = []
+        self._clip_start = None
+        self._last_event = None
+
+    def is_event(self, detections):
+        if self.carnivores_only:
+            return detections.carnivorous_count > 0
+        return len(detections) > 0
+
+    def _remember(self, index, frame):
+        if self.pre_roll == 0:
+            return
+        if not self._ring or self._ring[0].shape != frame.shape:
+            self._ring = [np.empty_like(frame) for _ in range(self.pre_roll)]
+            self._ring_indices = [0] * self.pre_roll
+            self._ring_next = 0
+            self._ring_count = 0
+        np.copyto(self._ring[self._ring_next], frame)
+        self._ring_indices[self._ring_next] = index
+        self._ring_next = (self._ring_next + 1) % self.pre_roll
+        self._ring_count = min(self._ring_count + 1, self.pre_roll)
+
+    def _drain_ring(self):
+        """Buffered frames, oldest first"""
+        start = self._ring_start()
+        for offset in range(self._ring_count):
+            slot = (start + offset) % self.pre_roll
+            yield self._ring_indices[slot], self._ring[slot]
+        self._ring_count = 0
+
+    def write(self, index, frame, detections):
+        """Feed every processed frame with its detections, in order"""
+        event = self.is_event(detections)
+        if self._writer is None:
+            if not event:
+                self._remember(index, frame)
+                return
+            self._start_clip(index)
+            for _, buffered in self._drain_ring():
+                self._writer.write(buffered)
+
+        self._writer.write(frame)
+        if event:
+            self._last_event = index
+        elif index - self._last_event >= self.post_roll:
+            self._finish_clip(index)
+
+    def _ring_start(self):
+        return (self._ring_next - self._ring_count) % self.pre_roll if self.pre_roll else 0
+
+    def _start_clip(self, index):
+        first = self._ring_indices[self._ring_start()] if self._ring_count else index
+        path = os.path.join(self.output_dir, f"{self.prefix}_{len(self.clips) + 1:04d}_f{first}.mp4")
+        # Room for the whole pre-roll burst on top of the steady-state backlog
+        queue_size = max(self.queue_size, 2 * self.pre_roll)
+        self._writer = AnnotatedVideoWriter(path, self.fps, self.fourcc, queue_size,
+                                            self.policy, metrics=self.metrics)
+        self._clip_start = first
+        self._last_event = index
+        self.metrics.incr("clips_started")
+
+    def _finish_clip(self, last_index):
+        # Don't wait for the encoder here; that would stall the caller
+        self._writer.close(wait=False)
+        self._closing.append(self._writer)
+        self.clips.append((self._writer.path, self._clip_start, last_index))
+        self._writer = None
+
+    def close(self):
+        """End any open clip and wait for all encoders to finish"""
+        if self._writer is not None:
+            self._finish_clip(self._last_event)
+        for writer in self._closing:
+            writer.close()
+        self._closing = []
+
+    @property
+    def frames_dropped(self):
+        return sum(writer.frames_dropped for writer in self._closing) + \
+            (self._writer.frames_dropped if self._writer is not None else 0)
+
+
+def export_paths(video_path, mode):
+    """Default output location next to the source video for an export mode"""
+    stem = os.path.splitext(video_path)[0]
+    if mode == EXPORT_FULL:
+        return stem + "_annotated.mp4"
+    return stem + ("_carnivore_clips" if mode == EXPORT_CARNIVORE_CLIPS else "_clips")
+
+
+class VideoExporter:
+    """Common write(index, frame, detections) / close() front end over both export modes"""
+
+    def __init__(self, video_path, mode, fps, pre_roll_s=DEFAULT_PRE_ROLL_S,
+                 post_roll_s=DEFAULT_POST_ROLL_S, output=None, policy=DROP_NEWEST, metrics=None):
+        if mode not in EXPORT_MODES or mode == EXPORT_OFF:
+            raise ValueError(f"Unknown export mode: {mode}")
+        self.mode = mode
+        self.output = output or export_paths(video_path, mode)
+        if mode == EXPORT_FULL:
+            self._full = AnnotatedVideoWriter(self.output, fps, policy=policy, metrics=metrics)
+            self._clips = None
+        else:
+            self._full = None
+            self._clips = EventClipWriter(self.output, fps, pre_roll_s, post_roll_s,
+                                          carnivores_only=mode == EXPORT_CARNIVORE_CLIPS,
+                                          policy=policy, metrics=metrics)
+
+    def write(self, index, frame, detections):
+        if self._full is not None:
+            self._full.write(frame)
+        else:
+            self._clips.write(index, frame, detections)
+
+    def close(self):
+        if self._full is not None:
+            self._full.close()
+        else:
+            self._clips.close()
+
+    def summary(self):
+        if self._full is not None:
+            return (f"{self.output}: {self._full.frames_written} frames"
+                    f"{f', {self._full.frames_dropped} dropped' if self._full.frames_dropped else ''}")
+        dropped = self._clips.frames_dropped
+        return (f"{self.output}: {len(self._clips.clips)} clip(s)"
+                f"{f', {dropped} frames dropped' if dropped else ''}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export an annotated video or event clips")
+    parser.add_argument("video", help="Input video file")
+    parser.add_argument("--model", default="yolov8n.pt", help="YOLO weights (.pt, .onnx or OpenVINO model)")
+    parser.add_argument("--output", help="Output file (full video) or directory (clips)")
+    parser.add_argument("--clips", action="store_true", help="Only write clips where animals are present")
+    parser.add_argument("--carnivores-only", action="store_true", help="Only carnivores start a clip")
+    parser.add_argument("--pre-roll", type=float, default=DEFAULT_PRE_ROLL_S, help="Seconds kept before an event")
+    parser.add_argument("--post-roll", type=float, default=DEFAULT_POST_ROLL_S, help="Seconds kept after an event")
+    parser.add_argument("--imgsz", type=int, default=416, help="Inference image size")
+    parser.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    parser.add_argument("--detect-every", type=int, default=1,
+                        help="Run the detector every N frames, tracking in between")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from annotator import Annotator, extract_detections
+    from model_formats import load_detector
+    from tracker import TrackedDetector
+
+    args = parse_args(argv)
+    video_cap = cv2.VideoCapture(args.video)
+    if not video_cap.isOpened():
+        print(f"Could not open video: {args.video}")
+        return 1
+
+    model = load_detector(args.model)
+    predict_args = {"imgsz": args.imgsz, "conf": args.conf, "verbose": False}
+    tracked = TrackedDetector(lambda frame: extract_detections(model.predict(frame, **predict_args)[0]),
+                              interval=args.detect_every)
+    annotator = Annotator(buffer_count=2)
+
+    if args.clips:
+        mode = EXPORT_CARNIVORE_CLIPS if args.carnivores_only else EXPORT_ANIMAL_CLIPS
+    else:
+        mode = EXPORT_FULL
+    # Offline export waits for the encoder instead of dropping frames
+    exporter = VideoExporter(args.video, mode, source_fps(video_cap), args.pre_roll, args.post_roll,
+                             output=args.output, policy=BLOCK)
+
+    index = 0
+    try:
+        while True:
+            ret, frame = video_cap.read()
+            if not ret:
+                break
+            detections = tracked.process(frame)
+            annotated = annotator.annotate(frame, detections,
+                                           carnivores_seen=tracked.tracker.distinct_carnivores)
+            exporter.write(index, annotated, detections)
+            index += 1
+    except KeyboardInterrupt:
+        print("Interrupted, finishing output...")
+    finally:
+        video_cap.release()
+        exporter.close()
+
+    print(f"Processed {index} frame(s) -> {exporter.summary()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+"""
+Pipelined video processing
+Decode, inference and render run on separate threads joined by bounded queues
+so that decoding the next frame overlaps with inference on the current one
+"""
+
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from metrics import Metrics
+
+# What to do when a stage's input queue is full
+DROP_OLDEST = "drop oldest"
+DROP_NEWEST = "drop newest"
+BLOCK = "block"
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+DEFAULT_FPS = 30.0
+
+
+class QueueClosed(Exception):
+    """Raised by FrameQueue.get once the queue is closed and drained"""
+
+
+class FrameQueue:
+    """Bounded FIFO with a configurable overflow policy; `on_drop(item)` sees discarded items"""
+
+    def __init__(self, maxsize, policy=BLOCK, on_drop=None):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._items = deque()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        """Add an item, applying the overflow policy; returns False if the queue is closed"""
+        with self._cond:
+            while len(self._items) >= self.maxsize and not self._closed:
+                if self.policy == DROP_OLDEST:
+                    self._discard(self._items.popleft())
+                    self.dropped += 1
+                elif self.policy == DROP_NEWEST:
+                    self._discard(item)
+                    self.dropped += 1
+                    return True
+                else:
+                    self._cond.wait()
+
+            if self._closed:
+                return False
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get(self):
+        """Remove and return the oldest item, blocking until one is available"""
+        with self._cond:
+            while not self._items:
+                if self._closed:
+                    raise QueueClosed()
+                self._cond.wait()
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        """Wake all waiters; get() keeps returning queued items until drained"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            while self._items:
+                self._discard(self._items.popleft())
+            self._cond.notify_all()
+
+    def _discard(self, item):
+        if self.on_drop is not None:
+            self.on_drop(item)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+def source_fps(video_cap):
+    """Return the capture's frame rate, falling back to DEFAULT_FPS if unknown"""
+    fps = video_cap.get(cv2.CAP_PROP_FPS)
+    if not fps or fps != fps or fps <= 0 or fps > 240:
+        return DEFAULT_FPS
+    return fps
+
+
+class VideoPipeline:
+    """
+    Three-stage video engine
+
+    decode  - reads frames from `video_cap`, paced at the video's own FPS
+    infer   - calls `infer(frame)` and forwards its output
+    render  - calls `render(index, frame, output)` for the display
+
+    `policy` decides what happens when inference falls behind decoding.
+    Decoding starts at the capture's current position and stops before `end_frame`
+    if given; `last_index` is the most recently rendered frame, for resuming.
+    With a `decoder` (shared_frames.SharedMemoryDecoder) frames are decoded in
+    another process instead of from `video_cap`, and `frame` is a view of a
+    shared slot that is reused once render() returns.
+    `on_finished` is called from the render thread once the stream ends or stop() is called.
+    Decode time, queue depths and dropped/processed frames are recorded in `metrics`.
+    """
+
+    def __init__(self, video_cap, infer, render, on_finished=None,
+                 policy=DROP_OLDEST, queue_size=2, realtime=True, metrics=None, end_frame=None,
+                 decoder=None):
+        self.video_cap = video_cap
+        self.infer = infer
+        self.render = render
+        self.on_finished = on_finished
+        self.realtime = realtime
+        self.end_frame = end_frame
+        self.decoder = decoder
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.fps = source_fps(video_cap)
+
+        # Queue items end with the frame's shared slot (None when decoding on a thread)
+        self.decode_queue = FrameQueue(queue_size, policy, on_drop=self._release)
+        # Results are never dropped: once inference is paid for, the frame is shown
+        self.render_queue = FrameQueue(queue_size, BLOCK, on_drop=self._release)
+
+        self.frames_decoded = 0
+        self.frames_processed = 0
+        self.last_index = None
+        self.error = None
+
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    @property
+    def frames_dropped(self):
+        if self.decoder is not None:
+            return self.decode_queue.dropped + self.decoder.frames_dropped
+        return self.decode_queue.dropped
+
+    def start(self):
+        """Start the decode, inference and render threads"""
+        if self.decoder is not None:
+            self.decoder.start()
+        decode_loop = self._shared_decode_loop if self.decoder is not None else self._decode_loop
+        for target, name in ((decode_loop, "decode"),
+                             (self._infer_loop, "infer"),
+                             (self._render_loop, "render")):
+            thread = threading.Thread(target=target, name=f"video-{name}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def stop(self):
+        """Ask all stages to finish; does not wait for them"""
+        self._stop_event.set()
+        if self.decoder is not None:
+            self.decoder.stop()
+        self.decode_queue.close()
+        self.decode_queue.clear()
+        self.render_queue.close()
+        self.render_queue.clear()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def join_decoder(self, timeout=None):
+        """Wait for the decode thread only, so the capture can be reused safely; True once it has exited"""
+        if self._threads:
+            self._threads[0].join(timeout)
+            return not self._threads[0].is_alive()
+        return True
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def _release(self, item):
+        """Hand a queued frame's shared slot back to the decoder"""
+        self._release_slot(item[-1])
+
+    def _release_slot(self, slot):
+        if slot is not None:
+            self.decoder.release(slot)
+
+    def _put_decoded(self, item):
+        """Queue a decoded frame; returns False once the pipeline is shutting down"""
+        dropped_before = self.decode_queue.dropped
+        if not self.decode_queue.put(item):
+            self._release(item)
+            return False
+        if self.decode_queue.dropped > dropped_before:
+            self.metrics.incr("frames_dropped", self.decode_queue.dropped - dropped_before)
+        self.metrics.set_gauge("decode_queue_depth", len(self.decode_queue))
+        self.frames_decoded += 1
+        return True
+
+    def _decode_loop(self):
+        frame_interval = 1.0 / self.fps
+        next_due = time.perf_counter()
+        index = int(self.video_cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+        try:
+            while not self._stop_event.is_set():
+                if self.end_frame is not None and index >= self.end_frame:
+                    break
+                with self.metrics.time("decode"):
+                    ret, frame = self.video_cap.read()
+                if not ret:
+                    break
+
+                if not self._put_decoded((index, frame, None)):
+                    break
+                index += 1
+
+                if self.realtime:
+                    # Pace reading like a live source instead of a fixed sleep
+                    next_due += frame_interval
+                    delay = next_due - time.perf_counter()
+                    if delay > 0:
+                        self._stop_event.wait(delay)
+                    elif delay < -frame_interval:
+                        next_due = time.perf_counter()
+        except Exception as e:
+            self.error = e
+            print(f"Error decoding video: {str(e)}")
+        finally:
+            self.decode_queue.close()
+
+    def _shared_decode_loop(self):
+        """Decode thread when frames come from a decoder process; pacing happens there"""
+        decoder_dropped = 0
+        try:
+            for index, slot, frame in self.decoder.frames():
+                if self._stop_event.is_set():
+                    self.decoder.release(slot)
+                    break
+                if self.decoder.frames_dropped > decoder_dropped:
+                    self.metrics.incr("frames_dropped", self.decoder.frames_dropped - decoder_dropped)
+                    decoder_dropped = self.decoder.frames_dropped
+                if not self._put_decoded((index, frame, slot)):
+                    break
+            if self.decoder.error:
+                self.error = self.decoder.error
+                print(f"Error decoding video: {self.decoder.error}")
+        except Exception as e:
+            self.error = e
+            print(f"Error decoding video: {str(e)}")
+        finally:
+            self.decode_queue.close()
+
+    def _infer_loop(self):
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    index, frame, slot = self.decode_queue.get()
+                except QueueClosed:
+                    break
+
+                try:
+                    output = self.infer(frame)
+                except Exception:
+                    self._release_slot(slot)
+                    raise
+                self.frames_processed += 1
+                if not self.render_queue.put((index, frame, output, slot)):
+                    self._release_slot(slot)
+                    break
+                self.metrics.set_gauge("render_queue_depth", len(self.render_queue))
+        except Exception as e:
+            self.error = e
+            print(f"Error processing video: {str(e)}")
+        finally:
+            self.render_queue.close()
+
+    def _render_loop(self):
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    index, frame, output, slot = self.render_queue.get()
+                except QueueClosed:
+                    break
+                try:
+                    self.render(index, frame, output)
+                finally:
+                    self._release_slot(slot)
+                self.last_index = index
+                self.metrics.frame_done()
+        except Exception as e:
+            self.error = e
+            print(f"Error rendering video: {str(e)}")
+        finally:
+            # Unblock upstream stages if rendering ended first
+            self.decode_queue.close()
+            self.render_queue.close()
+            if self.decoder is not None:
+                # The shared slots may only be unmapped once no stage reads them
+                self.decoder.stop()
+                self.decode_queue.clear()
+                self._threads[0].join(5.0)
+                self._threads[1].join(5.0)
+                self.decoder.close()
+            if self.on_finished is not None:
+                self.on_finished(self)